@@ -0,0 +1,85 @@
+"""
+Compare the HTML routes with the JSON API on the same playthrough.
+
+A fixed sequence of actions is played three ways through Flask's test
+client:
+    html        the HTML routes, following redirects as a browser does
+    api full    /api/v1 without ?since=, so every response has the full state
+    api delta   /api/v1 acknowledging each version, so responses only
+                carry the fields that changed
+For each this prints the response bytes (body, uncompressed) and the
+server time per action.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_api
+    python -m benchmarks.bench_api --repeat 200
+"""
+
+import argparse
+import sys
+import time
+
+from fantasy_adventure_web import app
+
+# (HTML route, API route) pairs; the API takes actions with POST
+PLAYTHROUGH = [
+    ('/location/village', '/api/v1/explore/village'),
+    ('/location/forest', '/api/v1/explore/forest'),
+    ('/combat/goblin', '/api/v1/combat/goblin'),
+    ('/attack/goblin', '/api/v1/attack/goblin'),
+    ('/attack/goblin', '/api/v1/attack/goblin'),
+    ('/flee', '/api/v1/flee'),
+    ('/buy/potion', '/api/v1/buy/potion'),
+    ('/use_potion_combat', '/api/v1/potion'),
+    ('/location/cave', '/api/v1/explore/cave'),
+    ('/status', '/api/v1/status'),
+]
+
+
+def play_html(client):
+    """Return response bytes of the playthrough over the HTML routes."""
+    size = len(client.post('/start', data={'player_name': 'Bench'}, follow_redirects=True).data)
+    for route, _ in PLAYTHROUGH:
+        size += len(client.get(route, follow_redirects=True).data)
+    return size
+
+
+def play_api(client, deltas):
+    """Return response bytes of the playthrough over the API."""
+    response = client.post('/api/v1/start', json={'name': 'Bench'})
+    size = len(response.data)
+    version = response.get_json()['version']
+    for _, route in PLAYTHROUGH:
+        url = f'{route}?since={version}' if deltas else route
+        if route.endswith('/status'):
+            response = client.get(url)
+        else:
+            response = client.post(url)
+        size += len(response.data)
+        version = response.get_json().get('version', version)
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=100, help='playthroughs per mode')
+    args = parser.parse_args(argv)
+
+    modes = [
+        ('html', play_html),
+        ('api full', lambda client: play_api(client, False)),
+        ('api delta', lambda client: play_api(client, True)),
+    ]
+    actions = len(PLAYTHROUGH) + 1
+    print(f"{'mode':<12}{'bytes':>9}{'bytes/action':>14}{'us/action':>11}")
+    for label, play in modes:
+        size = play(app.test_client())
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            play(app.test_client())
+        per_action = (time.perf_counter() - start) / (args.repeat * actions)
+        print(f'{label:<12}{size:>9,}{size / actions:>14,.0f}{per_action * 1e6:>11,.0f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Benchmark the binary player codec against JSON and the old signed cookie.
+
+For a few representative players this prints the payload size and the
+encode/decode time of:
+    cookie   Flask's signed session cookie, as the web version used to send
+    json     compact JSON, as the session store held before the codec
+    binary   fantasy_codec.encode()
+    binary+z fantasy_codec.encode(compress=True)
+
+Usage (from the repository root):
+    python -m benchmarks.bench_codec
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+import fantasy_codec as codec
+from fantasy_adventure_web import app, new_player
+from fantasy_inventory import Inventory
+
+
+def sample_players():
+    """Return (label, player) pairs from a fresh start to a long game."""
+    fresh = new_player()
+
+    mid = new_player()
+    mid.update(name='Aria', game_started=True, health=64, gold=37,
+               locations_visited=['village'], message='You strike for 12 damage! '
+               'The Goblin hits you for 4 damage!', message_type='info',
+               current_combat={'type': 'goblin', 'enemy_health': 11, 'enemy_name': 'Goblin'})
+    mid['inventory'].add('Health Potion')
+    mid['inventory'].add('Iron Sword')
+
+    late = new_player()
+    late.update(name='Sir Reginald the Unyielding', game_started=True, health=160,
+                max_health=180, attack=35, defense=11, gold=412, locations_visited=['village'])
+    for name in ['Iron Sword', 'Leather Shield', 'Magic Amulet', 'Magic Amulet',
+                 'Magic Amulet', 'Magic Amulet', 'Crystal Sword'] + ['Health Potion'] * 40:
+        late['inventory'].add(name)
+    return [('fresh', fresh), ('mid-game', mid), ('late-game', late)]
+
+
+def as_json_dict(player):
+    """Return the player with its inventory as the list of names JSON used to hold."""
+    return {**player, 'inventory': list(player['inventory'].elements())}
+
+
+def from_json_dict(player):
+    return {**player, 'inventory': Inventory(player['inventory'])}
+
+
+def codecs():
+    """Return (label, encode, decode) for every format being compared."""
+    serializer = app.session_interface.get_signing_serializer(app)
+    return [
+        ('cookie', lambda p: serializer.dumps({'player': as_json_dict(p)}).encode(),
+         lambda d: from_json_dict(serializer.loads(d.decode())['player'])),
+        ('json', lambda p: json.dumps(as_json_dict(p), separators=(',', ':')).encode(),
+         lambda d: from_json_dict(json.loads(d))),
+        ('binary', codec.encode, codec.decode),
+        ('binary+z', lambda p: codec.encode(p, compress=True), codec.decode),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=20000, help='iterations per measurement')
+    args = parser.parse_args(argv)
+
+    print(f"{'player':<12}{'format':<10}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for label, player in sample_players():
+        for name, encode, decode in codecs():
+            data = encode(player)
+            assert decode(data) == player, (label, name)
+            enc = timeit.timeit(lambda: encode(player), number=args.number) / args.number
+            dec = timeit.timeit(lambda: decode(data), number=args.number) / args.number
+            print(f'{label:<12}{name:<10}{len(data):>8}{enc * 1e6:>12.2f}{dec * 1e6:>12.2f}')
+        print()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
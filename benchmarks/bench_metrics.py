@@ -0,0 +1,91 @@
+"""
+Overhead of the /metrics instrumentation on hot requests.
+
+"Before" is the web module at the last revision without metrics (found
+with git log -S), loaded out of git as in bench_views. Each route is
+requested by calling the WSGI app directly with a prepared environ, not
+through the test client, so the instrumentation is measured against the
+app's own time only. Each round times --requests requests on one module,
+then on the other, in alternating order, and the overhead is the median
+over the rounds of the ratio of the two. Pairing the runs cancels the
+machine's drift; a comparison of the baseline with itself stays within
+about 0.3%.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_metrics
+    python -m benchmarks.bench_metrics --rounds 10000 --baseline HEAD~1
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from werkzeug.test import EnvironBuilder
+
+import fantasy_codec as codec
+from benchmarks.bench_redirects import ENDLESS, fighting
+from benchmarks.bench_views import load_module_at
+
+ROUTES = ['/', '/status', '/shop', '/location/cave', '/combat/goblin', '/attack/dragon']
+
+
+def uninstrumented_revision():
+    """Return the last revision whose web module had no metrics."""
+    commits = subprocess.run(
+        ['git', 'log', '--reverse', '--format=%H', '-S', 'import fantasy_metrics', '--', 'fantasy_adventure_web.py'],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return f'{commits[0]}~1' if commits else 'HEAD'
+
+
+def prepare(module, route):
+    """Return a WSGI environ for `route` with a session in which the request makes sense."""
+    client = module.app.test_client()
+    client.post('/start', data={'player_name': 'Bench'})
+    if route.startswith('/attack/'):
+        player = fighting('dragon', health=ENDLESS, max_health=ENDLESS)
+        with client.session_transaction() as session:
+            module.store.save(session['sid'], codec.encode(player))
+    cookie = client.get_cookie('session').value
+    return EnvironBuilder(route, headers={'Cookie': f'session={cookie}'}).get_environ()
+
+
+def run(app, environ, requests):
+    """Return seconds per request."""
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        b''.join(app(dict(environ), start_response))
+    return (time.perf_counter() - start) / requests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=5, help='requests per round')
+    parser.add_argument('--rounds', type=int, default=3000, help='rounds per route')
+    parser.add_argument('--baseline', default=None,
+                        help='git revision for "before" (default: the last one without metrics)')
+    args = parser.parse_args(argv)
+
+    import fantasy_adventure_web as current
+
+    before = load_module_at(args.baseline or uninstrumented_revision())
+    print(f"{'route':<18}{'before us':>10}{'after us':>10}{'overhead':>10}")
+    for route in ROUTES:
+        modules = [(before, prepare(before, route)), (current, prepare(current, route))]
+        times = ([], [])
+        for n in range(args.rounds):
+            for i in (0, 1) if n % 2 else (1, 0):  # alternate which module runs first
+                module, environ = modules[i]
+                times[i].append(run(module.app, environ, args.requests))
+        before_us, after_us = (statistics.median(t) * 1e6 for t in times)
+        overhead = statistics.median(after / before for before, after in zip(*times)) - 1
+        print(f'{route:<18}{before_us:>10.1f}{after_us:>10.1f}{overhead:>10.1%}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
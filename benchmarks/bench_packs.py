@@ -0,0 +1,125 @@
+"""
+Benchmark content pack loading with and without the compiled cache.
+
+Generates a synthetic pack with --entries records (enemies, items and
+locations with encounters, split evenly) in a temporary directory, then
+times fantasy_packs.load() in three situations:
+    cold     no cache: parse, validate, merge and write the cache
+    warm     cache present and no file touched since (the usual restart)
+    touched  files touched but unchanged (e.g. a fresh checkout)
+
+Usage (from the repository root):
+    python -m benchmarks.bench_packs [--entries 10000] [--format toml]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import fantasy_content as content
+import fantasy_packs
+
+RECORD_TYPES = {
+    'enemies': content.Enemy,
+    'items': content.Item,
+    'locations': content.Location,
+    'encounters': content.Encounter,
+}
+BUILTINS = {
+    'enemies': content.BUILTIN_ENEMIES,
+    'items': content.BUILTIN_ITEMS,
+    'locations': content.BUILTIN_LOCATIONS,
+}
+FIRST_ID = 1000
+
+
+def synthetic_pack(entries):
+    """Return a pack dictionary with about `entries` records."""
+    per_section = entries // 3
+    enemies = [{'key': f'enemy_{i}', 'id': FIRST_ID + i, 'name': f'Enemy {i}',
+                'health': 20 + i % 80, 'attack': 5 + i % 20, 'gold': i % 50,
+                'icon': '👾', 'appears': f'Enemy {i} appears!'}
+               for i in range(per_section)]
+    items = [{'key': f'item_{i}', 'id': FIRST_ID + i, 'name': f'Item {i}',
+              'price': 10 + i % 90, 'icon': '🎁', 'attack': i % 3,
+              'effect': f'Item number {i}', 'summary': f'#{i}'}
+             for i in range(per_section)]
+    locations = [{'key': f'place_{i}', 'id': FIRST_ID + i, 'name': f'Place {i}',
+                  'description': f'Somewhere numbered {i}.', 'action': f'Go to place {i}',
+                  'encounters': [
+                      {'kind': 'fight', 'enemy': f'enemy_{i % per_section}', 'weight': 2},
+                      {'kind': 'treasure', 'min_gold': 1, 'max_gold': 10 + i % 10},
+                  ]}
+                 for i in range(entries - 2 * per_section)]
+    return {'enemies': enemies, 'items': items, 'locations': locations}
+
+
+def to_toml(pack):
+    """Serialize a pack of flat tables (plus inline encounter tables) as TOML."""
+    def value(v):
+        if isinstance(v, list):
+            return '[' + ', '.join(value(e) for e in v) + ']'
+        if isinstance(v, dict):
+            return '{ ' + ', '.join(f'{k} = {value(e)}' for k, e in v.items()) + ' }'
+        return json.dumps(v, ensure_ascii=False)
+
+    lines = []
+    for section, entries in pack.items():
+        for entry in entries:
+            lines.append(f'[[{section}]]')
+            lines.extend(f'{k} = {value(v)}' for k, v in entry.items())
+            lines.append('')
+    return '\n'.join(lines)
+
+
+def timed(pack_dir, cache_dir):
+    start = time.perf_counter()
+    records = fantasy_packs.load(RECORD_TYPES, BUILTINS, paths=[pack_dir], cache_dir=cache_dir)
+    return time.perf_counter() - start, records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--entries', type=int, default=10000, help='records in the synthetic pack')
+    parser.add_argument('--format', choices=['json', 'toml'], default='json')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, best is reported')
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix='shadowmere-packs-')
+    try:
+        pack_dir = os.path.join(work, 'packs')
+        cache_dir = os.path.join(work, 'cache')
+        os.makedirs(pack_dir)
+        pack = synthetic_pack(args.entries)
+        path = os.path.join(pack_dir, f'synthetic.{args.format}')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(pack) if args.format == 'json' else to_toml(pack))
+
+        results = {}
+        for label in ('cold', 'warm', 'touched'):
+            best = None
+            for _ in range(args.repeat):
+                if label == 'cold':
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                elif label == 'touched':
+                    os.utime(path)
+                elapsed, records = timed(pack_dir, cache_dir)
+                best = elapsed if best is None else min(best, elapsed)
+            results[label] = best
+
+        total = sum(len(r) for r in records.values())
+        print(f"{total} records ({args.entries} from a {os.path.getsize(path) / 1024:.0f} KiB "
+              f"{args.format} pack)")
+        print(f"{'load':<10}{'ms':>10}{'speedup':>10}")
+        for label, elapsed in results.items():
+            print(f"{label:<10}{elapsed * 1000:>10.1f}{results['cold'] / elapsed:>9.1f}x")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Throughput of the web version: the debug server vs. the prefork server.
+
+Starts each server as a subprocess, exactly as it would be run:
+    debug    python fantasy_adventure_web.py (app.run with debug=True, port 5000)
+    prefork  python fantasy_serve.py --workers N (a SQLite store in a temporary directory)
+then drives it for --seconds with --clients client processes. Each client
+starts a game and cycles through the ROUTES of bench_views on a fresh
+connection per request, as a browser without keep-alive would. Prints
+requests/sec, latency percentiles and errors for both.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_prefork
+    python -m benchmarks.bench_prefork --clients 16 --workers 8 --seconds 20
+"""
+
+import argparse
+import http.client
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.bench_views import ROUTES
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def request(port, method, path, cookie=None, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Connection': 'close'}
+    if cookie:
+        headers['Cookie'] = cookie
+    if body:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response
+
+
+def client(port, seconds):
+    """Play for `seconds`; return (latencies of successful requests, errors)."""
+    latencies = []
+    errors = 0
+    response = request(port, 'POST', '/start', body='player_name=Bench')
+    cookie = response.getheader('Set-Cookie', '').split(';')[0]
+    deadline = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            response = request(port, 'GET', ROUTES[i % len(ROUTES)], cookie)
+            ok = response.status < 500
+        except OSError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+        i += 1
+    return latencies, errors
+
+
+def measure(command, port, clients, seconds, env=None):
+    """Start a server, load it, stop it; return (requests/sec, latencies, errors)."""
+    server = subprocess.Popen(command, env=env, start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        time.sleep(1)  # let the debug reloader or the workers settle
+        with ProcessPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(client, [port] * clients, [seconds] * clients))
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=60)
+    latencies = sorted(t for result, _ in results for t in result)
+    errors = sum(e for _, e in results)
+    return len(latencies) / seconds, latencies, errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='prefork workers')
+    parser.add_argument('--seconds', type=float, default=10.0, help='load duration per server')
+    parser.add_argument('--port', type=int, default=5001, help='port for the prefork server')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SHADOWMERE_SECRET_KEY='bench', SHADOWMERE_SESSION_STORE=f'sqlite:{tmp}/sessions.db')
+        servers = [
+            ('debug', [sys.executable, 'fantasy_adventure_web.py'], 5000),
+            (f'prefork x{args.workers}', [sys.executable, 'fantasy_serve.py', '--host', '127.0.0.1',
+                                          '--port', str(args.port), '--workers', str(args.workers)], args.port),
+        ]
+        print(f'{args.clients} clients, {args.seconds:g}s each, {os.cpu_count()} CPUs')
+        print(f"{'server':<14}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'errors':>8}")
+        for label, command, port in servers:
+            rate, latencies, errors = measure(command, port, args.clients, args.seconds, env)
+            print(f'{label:<14}{rate:>9,.0f}{percentile(latencies, 0.5) * 1e3:>9.2f}'
+                  f'{percentile(latencies, 0.99) * 1e3:>9.2f}{statistics.fmean(latencies) * 1e3:>9.2f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Latency per game action, before and after rendering actions in place.
+
+"Before" is the web module at the last revision whose actions answered
+with a redirect (found with git log -S), loaded out of git as in
+bench_views. Each action is timed through Flask's test client following
+redirects, as a browser would, from the same prepared player state,
+which is written to the module's session store before every request.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_redirects
+    python -m benchmarks.bench_redirects --requests 2000 --baseline HEAD~1
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+import fantasy_codec as codec
+import fantasy_sessions as sessions
+from benchmarks.bench_views import load_module_at
+from fantasy_actions import new_player
+
+# An enemy that neither side can finish off while the benchmark runs
+ENDLESS = 10 ** 6
+
+
+def fighting(enemy, **stats):
+    player = new_player(seed=1)
+    player.update(name='Bench', game_started=True, **stats)
+    player['current_combat'] = {'type': enemy, 'enemy_health': ENDLESS, 'enemy_name': enemy.title()}
+    return player
+
+
+def shopping():
+    player = new_player(seed=1)
+    player.update(name='Bench', game_started=True, gold=ENDLESS)
+    return player
+
+
+def potion_in_combat():
+    player = fighting('goblin', health=50)
+    player['inventory'].add('Health Potion')
+    return player
+
+
+# (label, method, path, state before the request or None for no session)
+ACTIONS = [
+    ('start', 'POST', '/start', None),
+    ('attack', 'GET', '/attack/dragon', fighting('dragon', health=ENDLESS, max_health=ENDLESS)),
+    ('death', 'GET', '/attack/dragon', fighting('dragon', health=1)),
+    ('flee', 'GET', '/flee', fighting('goblin')),
+    ('potion', 'GET', '/use_potion_combat', potion_in_combat()),
+    ('buy', 'GET', '/buy/potion', shopping()),
+]
+
+
+def redirecting_revision():
+    """Return the last revision whose web actions redirected."""
+    commits = subprocess.run(
+        ['git', 'log', '--reverse', '--format=%H', '-S', 'def fresh_request', '--', 'fantasy_adventure_web.py'],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return f'{commits[0]}~1' if commits else 'HEAD'
+
+
+def measure(module, method, path, state, requests):
+    """
+    Time one action from a fixed state.
+
+    Returns:
+        (median microseconds, HTTP requests per action)
+    """
+    data = codec.encode(state) if state is not None else None
+    client = module.app.test_client()
+    times = []
+    hops = 0
+    for _ in range(requests + 1):
+        client.delete_cookie('session')
+        if data is not None:
+            sid = sessions.new_session_id()
+            module.store.save(sid, data)
+            with client.session_transaction() as session:
+                session['sid'] = sid
+        start = time.perf_counter()
+        response = client.open(path, method=method, data={'player_name': 'Bench'}, follow_redirects=True)
+        times.append(time.perf_counter() - start)
+        hops = len(response.history) + 1
+    return statistics.median(times[1:]) * 1e6, hops
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=500, help='timed requests per action')
+    parser.add_argument('--baseline', default=None,
+                        help='git revision for "before" (default: the last one with redirects)')
+    args = parser.parse_args(argv)
+
+    import fantasy_adventure_web as current
+
+    before = load_module_at(args.baseline or redirecting_revision())
+    print(f"{'action':<10}{'before us':>10}{'requests':>10}{'after us':>10}{'requests':>10}{'speedup':>9}")
+    for label, method, path, state in ACTIONS:
+        old, old_hops = measure(before, method, path, state, args.requests)
+        new, new_hops = measure(current, method, path, state, args.requests)
+        print(f'{label:<10}{old:>10,.0f}{old_hops:>10}{new:>10,.0f}{new_hops:>10}{old / new:>8.2f}x')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Benchmark the game engine alone: replaying action logs vs. playing over HTTP.
+
+Plays --games games through Flask's test client with a random walk over
+the links of each page, with action logs switched on, downloads the log
+of every game from /log (a defeat starts a new game, and so a new log),
+then replays every log with fantasy_replay, with and without checking
+each step against the recorded state. All three rates are actions per
+second on the same action sequences.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_replay
+    python -m benchmarks.bench_replay --games 200 --clicks 100 --repeat 20
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+
+import fantasy_adventure_web as web
+import fantasy_replay as replay
+
+_LINK = re.compile(r'href="(/[^"]*)"')
+
+
+def play(rng, clicks):
+    """Follow random links in one session; return the action logs of its games."""
+    client = web.app.test_client()
+    page = client.post('/start', data={'player_name': 'Bench'}, follow_redirects=True).get_data(as_text=True)
+    logs = []
+    for _ in range(clicks):
+        links = [path for path in _LINK.findall(page) if not path.startswith('/static/') and path != '/log']
+        page = client.get(rng.choice(links), follow_redirects=True).get_data(as_text=True)
+        if 'name="player_name"' in page:  # back on the title page after a defeat
+            logs.append(client.get('/log').data)
+            page = client.post('/start', data={'player_name': 'Bench'},
+                               follow_redirects=True).get_data(as_text=True)
+    logs.append(client.get('/log').data)
+    return logs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=100, help='games to play over HTTP')
+    parser.add_argument('--clicks', type=int, default=60, help='links followed per game')
+    parser.add_argument('--repeat', type=int, default=10, help='replays of each log')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random walk')
+    args = parser.parse_args(argv)
+
+    web.record_actions = True
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    logs = [replay.read_log(log) for _ in range(args.games) for log in play(rng, args.clicks)]
+    http = time.perf_counter() - start
+    actions = sum(len(entries) for _, entries in logs)
+
+    diverged = sum(replay.replay(state, entries).divergence is not None for state, entries in logs)
+    print(f'{len(logs)} games in {args.games} sessions, {actions:,} actions, {diverged} diverged on replay')
+    print(f"{'mode':<16}{'actions/s':>12}{'speedup':>10}")
+    print(f"{'http':<16}{actions / http:>12,.0f}{1:>9.1f}x")
+    for label, check in (('replay checked', True), ('replay', False)):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for state, entries in logs:
+                replay.replay(state, entries, check)
+        rate = actions * args.repeat / (time.perf_counter() - start)
+        print(f'{label:<16}{rate:>12,.0f}{rate * http / actions:>9.1f}x')
+    return 1 if diverged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
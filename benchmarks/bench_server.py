@@ -0,0 +1,155 @@
+"""
+Benchmark the TCP game server with many concurrent sessions.
+
+Starts fantasy_server in a subprocess (or uses --target host:port), opens
+--clients connections, waits until every session is at the name prompt,
+then has each one play --rounds rounds of menu commands at once:
+    status   check status                      (menu -> menu)
+    shop     open the shop and leave again     (menu -> shop -> menu)
+    explore  open the location list, go back   (menu -> list -> menu)
+
+Latency is measured per command, from sending the line to receiving the
+next prompt, and reported as percentiles. Clients run in this process's
+event loop, so with very many clients the client side can be the limit.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_server [--clients 1000] [--rounds 10]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import fantasy_content as content
+from fantasy_server import raise_file_limit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MENU_PROMPT = b'Enter your choice (1-5): '
+NAME_PROMPT = b"Enter your adventurer's name: "
+SHOP_PROMPT = b'What would you like to buy? '
+WHERE_PROMPT = b'Where would you like to go? '
+
+# Command name -> [(line to send, prompt expected back), ...]
+COMMANDS = {
+    'status': [(b'2', MENU_PROMPT)],
+    'shop': [(b'3', SHOP_PROMPT), (str(len(content.SHOP_ITEMS) + 1).encode(), MENU_PROMPT)],
+    'explore': [(b'1', WHERE_PROMPT), (str(len(content.LOCATIONS) + 1).encode(), MENU_PROMPT)],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, clients):
+    """Start fantasy_server in a subprocess and wait until it accepts connections."""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'fantasy_server.py'), '--port', str(port),
+         '--max-sessions', str(clients + 100)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('fantasy_server did not start')
+
+
+async def client(host, port, rounds, started, go, latencies):
+    """Play one session: connect, name, then `rounds` rounds of commands."""
+    reader, writer = await asyncio.open_connection(host, port)
+    await reader.readuntil(NAME_PROMPT)
+    started.release()
+    await go.wait()
+
+    async def step(line, prompt):
+        writer.write(line + b'\r\n')
+        await reader.readuntil(prompt)
+
+    start = time.perf_counter()
+    await step(b'Bench', MENU_PROMPT)
+    latencies['name'].append(time.perf_counter() - start)
+
+    for _ in range(rounds):
+        for command, steps in COMMANDS.items():
+            for line, prompt in steps:
+                start = time.perf_counter()
+                await step(line, prompt)
+                latencies[command].append(time.perf_counter() - start)
+
+    writer.write(b'5\r\nyes\r\n')
+    await writer.drain()
+    writer.close()
+
+
+async def run(host, port, clients, rounds):
+    latencies = {name: [] for name in ['name', *COMMANDS]}
+    started = asyncio.Semaphore(0)
+    go = asyncio.Event()
+
+    connect_start = time.perf_counter()
+    tasks = [asyncio.create_task(client(host, port, rounds, started, go, latencies)) for _ in range(clients)]
+    for _ in range(clients):
+        await started.acquire()
+    connect_time = time.perf_counter() - connect_start
+
+    run_start = time.perf_counter()
+    go.set()
+    await asyncio.gather(*tasks)
+    run_time = time.perf_counter() - run_start
+    return connect_time, run_time, latencies
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=1000, help='concurrent connections')
+    parser.add_argument('--rounds', type=int, default=10, help='rounds of commands per client')
+    parser.add_argument('--target', help='host:port of a running server (default: start one)')
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    process = None
+    if args.target:
+        host, port = args.target.rsplit(':', 1)
+        port = int(port)
+    else:
+        host, port = '127.0.0.1', free_port()
+        process = start_server(port, args.clients)
+
+    try:
+        connect_time, run_time, latencies = asyncio.run(run(host, port, args.clients, args.rounds))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    # Every step is one round trip; multi-step commands count each step
+    round_trips = sum(len(values) for values in latencies.values())
+    print(f'{args.clients} concurrent sessions connected in {connect_time:.2f}s')
+    print(f'{round_trips} round trips in {run_time:.2f}s ({round_trips / run_time:,.0f}/s)')
+    print()
+    print(f"{'command':<10}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for command, values in latencies.items():
+        values.sort()
+        print(f'{command:<10}{len(values):>8}{statistics.fmean(values) * 1000:>10.2f}'
+              f'{percentile(values, 0.50) * 1000:>10.2f}{percentile(values, 0.95) * 1000:>10.2f}'
+              f'{percentile(values, 0.99) * 1000:>10.2f}{values[-1] * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
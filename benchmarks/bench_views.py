@@ -0,0 +1,100 @@
+"""
+Micro-benchmark: requests/sec per route, before and after precompiled views.
+
+"Before" is the web module as it exists at a git revision (the first
+commit by default), loaded straight out of git so it can be measured
+side by side with the current tree. Both run through Flask's test
+client, so the numbers compare server-side work only.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_views
+    python -m benchmarks.bench_views --requests 2000 --baseline HEAD~1
+"""
+
+import argparse
+import random
+import subprocess
+import sys
+import time
+import types
+
+import fantasy_cache
+
+ROUTES = [
+    '/',
+    '/location/village',
+    '/location/forest',
+    '/location/cave',
+    '/location/dragon',
+    '/combat/goblin',
+    '/shop',
+    '/status',
+]
+
+
+def load_module_at(revision, path='fantasy_adventure_web.py'):
+    """
+    Load a copy of a module as it was at a git revision.
+
+    Args:
+        revision: Any git revision, e.g. 'HEAD~1'
+        path: Repository path of the module
+
+    Returns:
+        The executed module object
+    """
+    source = subprocess.run(
+        ['git', 'show', f'{revision}:{path}'],
+        check=True, capture_output=True, text=True, encoding='utf-8',
+    ).stdout
+    module = types.ModuleType(f'baseline_{path[:-3]}')
+    module.__file__ = path
+    exec(compile(source, f'{revision}:{path}', 'exec'), module.__dict__)
+    return module
+
+
+def first_commit():
+    """Return the root commit of the current branch."""
+    return subprocess.run(
+        ['git', 'rev-list', '--max-parents=0', 'HEAD'],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()[0]
+
+
+def measure(app, route, requests):
+    """Return requests/sec for GET route with a started game."""
+    client = app.test_client()
+    client.post('/start', data={'player_name': 'Bench'})
+    client.get(route)  # warm up
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(route)
+    return requests / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000, help='requests per route')
+    parser.add_argument('--baseline', default=None, help='git revision for "before" (default: first commit)')
+    args = parser.parse_args(argv)
+
+    import fantasy_adventure_web as current
+
+    before = load_module_at(args.baseline or first_commit())
+
+    print(f"{'route':<20}{'before req/s':>14}{'after req/s':>14}{'speedup':>10}")
+    for route in ROUTES:
+        random.seed(0)
+        old = measure(before.app, route, args.requests)
+        random.seed(0)
+        new = measure(current.app, route, args.requests)
+        print(f"{route:<20}{old:>14.0f}{new:>14.0f}{new / old:>9.2f}x")
+
+    print(f"\n{'fragment cache':<20}{'hits':>10}{'misses':>10}{'evictions':>10}{'hit rate':>10}")
+    for stats in fantasy_cache.all_stats():
+        print(f"{stats['name']:<20}{stats['hits']:>10}{stats['misses']:>10}"
+              f"{stats['evictions']:>10}{stats['hit_rate']:>10.1%}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Report bytes on the wire per route, before and after the static stylesheet.
+
+For every route this prints the response size (headers + body) of the
+baseline web module, which inlined its CSS, next to the current module
+uncompressed, with gzip and with brotli. The stylesheet itself is listed
+separately: browsers fetch it once and then serve it from cache.
+
+Usage (from the repository root):
+    python -m benchmarks.report_wire_bytes
+    python -m benchmarks.report_wire_bytes --baseline HEAD~1
+"""
+
+import argparse
+import random
+import sys
+
+import fantasy_assets as assets
+from benchmarks.bench_views import ROUTES, first_commit, load_module_at
+
+
+def wire_size(response):
+    """Approximate bytes sent for a response: status line, headers and body."""
+    head = f'HTTP/1.1 {response.status}\r\n'
+    head += ''.join(f'{k}: {v}\r\n' for k, v in response.headers.items()) + '\r\n'
+    return len(head.encode('latin-1', 'replace')) + len(response.get_data())
+
+
+def route_sizes(app, route, accept_encoding):
+    """Return the wire size of GET route for a started game."""
+    random.seed(0)
+    client = app.test_client()
+    client.post('/start', data={'player_name': 'Bench'})
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    return wire_size(client.get(route, headers=headers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--baseline', default=None, help='git revision for "before" (default: first commit)')
+    args = parser.parse_args(argv)
+
+    import fantasy_adventure_web as current
+
+    before = load_module_at(args.baseline or first_commit())
+    encodings = [('identity', None)] + [(e, e) for e in assets.ENCODINGS]
+
+    header = f"{'route':<20}{'before':>10}" + ''.join(f'{name:>10}' for name, _ in encodings)
+    print(header)
+    for route in ROUTES:
+        row = f'{route:<20}{route_sizes(before.app, route, None):>10}'
+        for _, accept in encodings:
+            row += f'{route_sizes(current.app, route, accept):>10}'
+        print(row)
+
+    sheet = assets.STYLESHEET
+    print(f'\nstylesheet {sheet.url} (fetched once, then cached as immutable):')
+    for name, encoding in encodings:
+        print(f'  {name:<10}{len(sheet.variants[encoding]):>8} bytes')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""
+Game rules of the web version, apart from rendering.
+
+Every route of fantasy_adventure_web that changes the game is one action
+here: a function that changes the player dict exactly as the route does
+and returns what happened, for the page to show. The routes check their
+arguments, call perform() and render the result; the rules never look at
+the request.
+
+Each action draws its rolls from session_rng(player), a stream seeded by
+the player's seed and the number of actions counted so far, so a game is
+determined by its seed and its actions alone. An action only counts if
+it drew a roll or changed more than the message (see perform()); one
+that does nothing cannot be used to redraw the rolls of the next.
+fantasy_replay records the actions of every session in a log and plays
+them back without rendering anything.
+"""
+
+import random
+
+import fantasy_combat as rules
+import fantasy_content as content
+from fantasy_inventory import Inventory
+
+POTION = content.ITEMS['potion']
+
+# Rounds an auto-battle may take before it stops and leaves the fight on
+MAX_AUTO_ROUNDS = 1000
+
+# Longest player name, in characters; the routes cut longer ones, and the
+# title page's form stops at it too
+MAX_NAME_LENGTH = 40
+
+
+def new_player(seed=0):
+    """Return the state of a brand-new adventurer."""
+    return {
+        'name': '',
+        'health': 100,
+        'max_health': 100,
+        'attack': 10,
+        'defense': 5,
+        'gold': 20,
+        'inventory': Inventory(['Rusty Dagger']),
+        'locations_visited': [],
+        'dragon_defeated': False,
+        'game_started': False,
+        'current_combat': None,
+        'message': None,
+        'message_type': None,
+        'seed': seed,
+        'actions': 0,
+    }
+
+
+def session_rng(player):
+    """Return the random stream for the player's next action."""
+    return random.Random((player['seed'] << 32) | player['actions'])
+
+
+class Rolls:
+    """
+    The random stream of one action, made on its first draw.
+
+    Seeding a Random costs more than most actions, and perform() needs to
+    know whether the action drew at all.
+    """
+
+    __slots__ = ('player', 'rng')
+
+    def __init__(self, player):
+        self.player = player
+        self.rng = None
+
+    def __getattr__(self, name):
+        if self.rng is None:
+            self.rng = session_rng(self.player)
+        return getattr(self.rng, name)
+
+
+def _standing(player):
+    """Return everything an action can change but the message and the action count."""
+    fight = player['current_combat']
+    return (player['name'], player['seed'], player['health'], player['max_health'], player['attack'],
+            player['defense'], player['gold'], player['inventory'].key(), tuple(player['locations_visited']),
+            player['game_started'], player['dragon_defeated'], fight and (fight['type'], fight['enemy_health']))
+
+
+def perform(player, action, arg=None):
+    """
+    Take one action with the player's own random stream.
+
+    The action counts towards the stream's next seed, and so towards the
+    state version the web pages show, only if it drew a roll or changed
+    more than the message. Facing the enemy already being fought, or
+    buying without the gold, changes nothing the next roll depends on.
+
+    Args:
+        player: Player dict, changed in place
+        action: Key of ACTIONS
+        arg: The action's argument (see each action)
+
+    Returns:
+        Whatever the action returns
+    """
+    count = player['actions']
+    before = _standing(player)
+    rng = Rolls(player)
+    result = ACTIONS[action](player, arg, rng)
+    # A reset starts the count over itself
+    if player['actions'] == count and (rng.rng is not None or _standing(player) != before):
+        player['actions'] = count + 1
+    return result
+
+
+# ============================================================================
+# ACTIONS
+# ============================================================================
+
+def start(player, arg, rng):
+    """Start the game; arg is (name, seed), the seed of the game's rolls."""
+    name, seed = arg
+    player['name'] = name
+    player['seed'] = seed
+    player['game_started'] = True
+    player['message'] = f"Welcome, {name}! Your quest begins!"
+    player['message_type'] = 'success'
+
+
+def explore(player, key, rng):
+    """
+    Explore the location `key`.
+
+    Returns:
+        (kind, details), one of
+        ('village', gold bonus, or None on a later visit)
+        ('cave', True if the Crystal Sword is already found)
+        ('dragon', 'defeated', 'ready' or the damage taken without the sword)
+        ('encounter', (encounter or None, heal, gold))
+    """
+    if key == 'village':
+        if 'village' in player['locations_visited']:
+            return 'village', None
+        player['locations_visited'].append('village')
+        gold_bonus = rng.randint(5, 15)
+        player['gold'] += gold_bonus
+        return 'village', gold_bonus
+
+    if key == 'cave':
+        return 'cave', 'Crystal Sword' in player['inventory']
+
+    if key == 'dragon':
+        if player['dragon_defeated']:
+            return 'dragon', 'defeated'
+        if 'Crystal Sword' not in player['inventory']:
+            damage = 40
+            player['health'] = max(10, player['health'] - damage)
+            return 'dragon', damage
+        return 'dragon', 'ready'
+
+    # Every other location, the forest included, draws from its encounter table
+    location = content.LOCATIONS[key]
+    encounter = rng.choice(location.encounter_table) if location.encounter_table else None
+    heal = gold = 0
+    if encounter is None or encounter.kind == 'fight':
+        pass
+    elif encounter.kind == 'heal':
+        heal = min(encounter.amount, player['max_health'] - player['health'])
+        player['health'] += heal
+    else:
+        gold = rng.randint(encounter.min_gold, encounter.max_gold)
+        player['gold'] += gold
+    return 'encounter', (encounter, heal, gold)
+
+
+def enter_combat(player, enemy, rng):
+    """Face `enemy`, keeping the fight in progress if it is the same kind; return the fight."""
+    enemy_data = content.ENEMIES[enemy]
+    if player.get('current_combat') is None or player['current_combat'].get('type') != enemy:
+        player['current_combat'] = {
+            'type': enemy,
+            'enemy_health': enemy_data.health,
+            'enemy_name': enemy_data.name
+        }
+    return player['current_combat']
+
+
+def attack(player, enemy, rng):
+    """
+    Attack in the current fight; `enemy` names the enemy that hits back.
+
+    Returns:
+        'victory', 'defeat' or 'hit'
+    """
+    combat_state = player['current_combat']
+    enemy_data = content.ENEMIES[enemy]
+
+    # Player attacks
+    damage = rules.roll_player_damage(rng, player['attack'])
+    combat_state['enemy_health'] -= damage
+
+    message = f"You strike for {damage} damage! "
+
+    # Check if enemy defeated
+    if combat_state['enemy_health'] <= 0:
+        player['gold'] += enemy_data.gold
+        player['current_combat'] = None
+        reward = content.ITEMS.get(enemy_data.reward_item)
+
+        # Special rewards
+        if reward and reward.name not in player['inventory']:
+            if player['inventory'].can_add(reward.name):
+                player['inventory'].add(reward.name)
+                player['attack'] += reward.attack
+                player['message'] = f"Victory! You earned {enemy_data.gold} gold and found the {reward.name.upper()}! (+{reward.attack} Attack)"
+            else:
+                player['message'] = f"Victory! You earned {enemy_data.gold} gold, but your pack is full, so you leave the {reward.name.upper()} behind."
+        elif enemy == 'dragon':
+            player['dragon_defeated'] = True
+            player['message'] = "🎉 VICTORY! You have defeated the Dragon of Shadowmere! You are the hero of the realm!"
+        else:
+            player['message'] = f"Victory! You earned {enemy_data.gold} gold!"
+
+        player['message_type'] = 'success'
+        return 'victory'
+
+    # Enemy attacks back
+    actual_damage = rules.roll_enemy_damage(rng, enemy_data.attack, player['defense'])
+    player['health'] -= actual_damage
+
+    message += f"The {combat_state['enemy_name']} hits you for {actual_damage} damage!"
+
+    # Check if player defeated
+    if player['health'] <= 0:
+        player['message'] = "💀 You have been defeated! Game Over!"
+        player['message_type'] = 'danger'
+        player['game_started'] = False
+        player['current_combat'] = None
+        return 'defeat'
+
+    player['message'] = message
+    player['message_type'] = 'info'
+    return 'hit'
+
+
+def flee(player, arg, rng):
+    """Try to flee the current fight; return True on success."""
+    if rules.roll_flee(rng):
+        player['current_combat'] = None
+        player['message'] = "You successfully fled from battle!"
+        player['message_type'] = 'info'
+        return True
+    player['message'] = "You failed to escape!"
+    player['message_type'] = 'danger'
+    return False
+
+
+def drink_potion(player, arg, rng):
+    """Drink a Health Potion if there is one; return True if one was drunk."""
+    if POTION.name not in player['inventory']:
+        return False
+    player['inventory'].remove(POTION.name)
+    heal = POTION.heal
+    player['health'] = min(player['health'] + heal, player['max_health'])
+    player['message'] = f"You drink a Health Potion and recover {heal} health!"
+    player['message_type'] = 'success'
+    return True
+
+
+def buy(player, item, rng):
+    """
+    Buy the shop item with key `item`.
+
+    Returns:
+        'bought', 'full' (cannot carry more) or 'poor' (not enough gold)
+    """
+    item_data = content.ITEMS[item]
+    if not player['inventory'].can_add(item_data.name):
+        if item_data.name in player['inventory']:
+            player['message'] = "You can't carry any more of that!"
+        else:
+            player['message'] = "Your pack is full!"
+        player['message_type'] = 'danger'
+        return 'full'
+    if player['gold'] < item_data.price:
+        player['message'] = "Not enough gold!"
+        player['message_type'] = 'danger'
+        return 'poor'
+    player['gold'] -= item_data.price
+    player['inventory'].add(item_data.name)
+    player['attack'] += item_data.attack
+    player['defense'] += item_data.defense
+    player['max_health'] += item_data.max_health
+    player['health'] += item_data.max_health
+
+    player['message'] = f"Purchased {item_data.name}!"
+    player['message_type'] = 'success'
+    return 'bought'
+
+
+def auto_battle(player, policy, rng):
+    """
+    Fight the current enemy to the end, choosing each round by `policy`.
+
+    Every round is attack(), drink_potion() or flee() exactly as the
+    combat page's links take them, with the rolls of this one action.
+
+    Args:
+        policy: A fantasy_combat.Policy
+
+    Returns:
+        (outcome, rounds): outcome is 'victory', 'defeat', 'fled' or
+        'timeout' (MAX_AUTO_ROUNDS reached); rounds lists (action, message)
+    """
+    enemy = player['current_combat']['type']
+    rounds = []
+    while len(rounds) < MAX_AUTO_ROUNDS:
+        action = policy.action(player['health'], player['inventory'].count(POTION.name))
+        if action == 'attack':
+            outcome = attack(player, enemy, rng)
+        elif action == 'potion':
+            drink_potion(player, None, rng)
+            outcome = None
+        else:
+            outcome = 'fled' if flee(player, None, rng) else None
+        rounds.append((action, player['message']))
+        if outcome in ('victory', 'defeat', 'fled'):
+            return outcome, rounds
+    return 'timeout', rounds
+
+
+def reset(player, arg, rng):
+    """Throw the game away and start over as a new player."""
+    player.clear()
+    player.update(new_player())
+
+
+def reseed(player, seed, rng):
+    """Draw the rest of the game's rolls from a new seed, once the old one has been shown."""
+    player['seed'] = seed
+
+
+ACTIONS = {
+    'start': start,
+    'explore': explore,
+    'combat': enter_combat,
+    'attack': attack,
+    'flee': flee,
+    'potion': drink_potion,
+    'buy': buy,
+    'reset': reset,
+    'auto': auto_battle,
+    'reseed': reseed,
+}
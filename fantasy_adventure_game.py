@@ -3,492 +3,777 @@ fantasy-Style Text Adventure Game
 A text-based adventure game where players explore locations, collect items,
 encounter challenges, and complete a quest to defeat the Dragon of Shadowmere.
 
+Each game is a GameState object, so one process can run many games at
+once (see fantasy_server for a TCP server that does). A game never waits
+on input() itself: it runs until it needs an answer, then hands back its
+output and the prompt, and carries on when send() gives it the next line.
+
+Batch mode replays recorded playthroughs without a terminal:
+
+    python fantasy_adventure_game.py --batch scripts/ --seed 1 --quiet
+
+A script is a text file with one input per line, each taken exactly as
+written. Each script runs with its own random.Random(seed), so a
+replay is deterministic, and a line summarising the final state and the
+time taken is printed per script. --quiet skips rendering altogether.
+
+--record FILE saves an interactive game as such a script, headed by a
+"# seed N" line that batch mode uses unless --seed is given, so a
+reported game can be replayed exactly:
+
+    python fantasy_adventure_game.py --record bug.txt
+    python fantasy_adventure_game.py --batch bug.txt
+
 Python Concepts Used:
 - Variables: player stats, game state
 - Lists: inventory, locations
 - Loops: game loop, menu navigation
 - Conditionals: player choices, combat outcomes
 - Functions: modular game logic
+- Classes: one GameState per player
+- Generators: pausing the game at each prompt until input arrives
 """
 
+import argparse
+import json
+import os
 import random
+import sys
+import time
+
+import fantasy_combat as rules
+import fantasy_content as content
+from fantasy_inventory import Inventory
 
 # ============================================================================
 # GAME DATA - Variables and Lists
 # ============================================================================
 
-# Player stats (variables)
-player = {
-    "name": "",
-    "health": 100,
-    "max_health": 100,
-    "attack": 10,
-    "defense": 5,
-    "gold": 20
+# Available locations and shop items (shared with the web version)
+locations = list(content.LOCATIONS.values())
+shop_items = list(content.SHOP_ITEMS)
+
+# The CLI's own wording for built-in texts that the shared content tables
+# word as the web version does. Keyed by the shared text, so anything a
+# content pack rewrites is shown as the pack words it.
+CLI_WORDING = {
+    "You venture deep into the mysterious forest. The trees seem to whisper ancient secrets...":
+        "You venture deep into the forest...",
+    "A wild Goblin leaps from the bushes!": "A wild Goblin appears!",
 }
 
-# Player inventory (list)
-inventory = []
-
-# Available locations (list of dictionaries)
-locations = [
-    {
-        "name": "Village of Elderbrook",
-        "description": "A peaceful village with cobblestone streets and friendly townsfolk. A tavern and shop stand nearby.",
-        "visited": False
-    },
-    {
-        "name": "Whispering Forest",
-        "description": "A dark, mysterious forest where the trees seem to whisper ancient secrets. Danger lurks within.",
-        "visited": False
-    },
-    {
-        "name": "Crystal Cave",
-        "description": "A cave filled with glowing crystals that illuminate the darkness. Strange creatures dwell here.",
-        "visited": False
-    },
-    {
-        "name": "Dragon's Lair",
-        "description": "The dreaded lair of the Dragon of Shadowmere. Only the bravest adventurers dare enter.",
-        "visited": False
-    }
-]
-
-# Items available in the shop (list)
-shop_items = [
-    {"name": "Health Potion", "price": 15, "effect": "Restores 30 health"},
-    {"name": "Iron Sword", "price": 25, "effect": "Increases attack by 5"},
-    {"name": "Leather Shield", "price": 20, "effect": "Increases defense by 3"},
-    {"name": "Magic Amulet", "price": 40, "effect": "Increases max health by 20"}
-]
-
-# Game state
-game_active = True
-dragon_defeated = False
+# Likewise for what an encounter gives, keyed by its headline
+CLI_ENCOUNTER_WORDING = {
+    "A friendly forest fairy appears!":
+        "\n✨ A friendly forest fairy appears!\nShe sprinkles healing dust on you.\nYou recovered {amount} health!",
+    "You discovered a hidden treasure chest!":
+        "\n💰 You found a hidden treasure chest containing {amount} gold!",
+}
 
 
-# ============================================================================
-# HELPER FUNCTIONS
-# ============================================================================
-
-def get_valid_input(prompt: str, valid_options: list) -> str:
+class GameState:
     """
-    Get validated input from the player.
-    
-    Args:
-        prompt: The message to display to the player
-        valid_options: List of valid input options
-        
-    Returns:
-        The validated user input (lowercase)
+    One player's game.
+
+    The game logic is written as generators: every question is asked with
+    `answer = yield from self.ask(...)`, which pauses the game until send()
+    supplies a line. Output is collected in a buffer and returned by
+    start() and send() instead of being printed.
+
+    Example:
+        game = GameState()
+        print(game.start(), end="")
+        while not game.finished:
+            print(game.send(input()), end="")
     """
-    while True:
-        user_input = input(prompt).strip().lower()
-        if user_input in valid_options:
-            return user_input
-        print(f"Invalid choice. Please enter one of: {', '.join(valid_options)}")
 
+    def __init__(self, rng=None, quiet=False):
+        """
+        Create a new game.
+
+        Args:
+            rng: random.Random used for every roll; a fresh one if None
+            quiet: If True, nothing is rendered and start()/send() return ""
+        """
+        self.rng = rng or random.Random()
+        if quiet:
+            self.print = self._discard
+
+        # Player stats (variables)
+        self.player = {
+            "name": "",
+            "health": 100,
+            "max_health": 100,
+            "attack": 10,
+            "defense": 5,
+            "gold": 20
+        }
+
+        # Player inventory (stacks of items, see fantasy_inventory)
+        self.inventory = Inventory()
+
+        # Keys of the locations the player has visited
+        self.visited_locations = set()
+
+        # Game state
+        self.game_active = True
+        self.dragon_defeated = False
+
+        self.prompt = None     # question waiting for an answer, if any
+        self.finished = False  # True once the game has ended
+        self._output = []
+        self._game = self.run()
+
+    # ========================================================================
+    # DRIVING THE GAME
+    # ========================================================================
+
+    def start(self) -> str:
+        """
+        Run the game up to its first question.
+
+        Returns:
+            Everything printed so far, ending with the prompt
+        """
+        return self._resume(None)
+
+    def send(self, line: str) -> str:
+        """
+        Answer the current question and run the game up to the next one.
+
+        Args:
+            line: The player's input, without the newline
+
+        Returns:
+            Everything printed in response, ending with the next prompt
+            (or the final stats, once the game is finished)
+        """
+        if self.finished:
+            return ""
+        return self._resume(line)
+
+    def _resume(self, line):
+        try:
+            self.prompt = self._game.send(line)
+            self.print(self.prompt, end="")
+        except StopIteration:
+            self.prompt = None
+            self.finished = True
+        output = "".join(self._output)
+        self._output.clear()
+        return output
+
+    def print(self, *values, sep=" ", end="\n"):
+        """Add a line to the output, like the built-in print()."""
+        self._output.append(sep.join(str(value) for value in values) + end)
+
+    @staticmethod
+    def _discard(*values, sep=" ", end="\n"):
+        pass
+
+    def summary(self) -> dict:
+        """Return the player's current state as plain data."""
+        return {
+            **self.player,
+            "inventory": self.inventory.describe(),
+            "visited": sorted(self.visited_locations),
+            "dragon_defeated": self.dragon_defeated,
+            "finished": self.finished,
+            "prompt": self.prompt,
+        }
+
+    def ask(self, prompt: str, valid_options: list):
+        """
+        Get validated input from the player.
+
+        Args:
+            prompt: The message to display to the player
+            valid_options: List of valid input options
+
+        Returns:
+            The validated user input (lowercase)
+        """
+        while True:
+            user_input = (yield prompt).strip().lower()
+            if user_input in valid_options:
+                return user_input
+            self.print(f"Invalid choice. Please enter one of: {', '.join(valid_options)}")
+
+    # ========================================================================
+    # HELPER FUNCTIONS
+    # ========================================================================
+
+    def display_separator(self):
+        """Display a visual separator line."""
+        self.print("\n" + "=" * 60 + "\n")
+
+    def display_player_status(self):
+        """Display current player stats and inventory."""
+        player = self.player
+        self.print(f"\n--- {player['name']}'s Status ---")
+        self.print(f"Health: {player['health']}/{player['max_health']}")
+        self.print(f"Attack: {player['attack']} | Defense: {player['defense']}")
+        self.print(f"Gold: {player['gold']}")
+        self.print(f"Inventory: {self.inventory.describe()}")
+
+    # ========================================================================
+    # GAME FUNCTIONS
+    # ========================================================================
+
+    def start_game(self):
+        """
+        Initialize the game and get player name.
+        Displays welcome message and sets up initial game state.
+        """
+        player = self.player
+        self.display_separator()
+        self.print("⚔️  WELCOME TO THE REALM OF SHADOWMERE ⚔️")
+        self.print("A Fantasy-Style Text Adventure Game")
+        self.display_separator()
+
+        self.print("In the land of Shadowmere, a fearsome dragon threatens the kingdom.")
+        self.print("You are a brave adventurer chosen to defeat this ancient evil.")
+        self.print("Explore the land, gather items, and prepare for the ultimate battle!\n")
+
+        player["name"] = (yield "Enter your adventurer's name: ").strip()
+        if not player["name"]:
+            player["name"] = "Hero"
+
+        self.print(f"\nWelcome, {player['name']}! Your quest begins in the Village of Elderbrook.")
+        self.inventory.add("Rusty Dagger")
+        self.print("You start with a Rusty Dagger and 20 gold coins.\n")
+
+    def main_menu(self):
+        """
+        Display the main game menu and handle player choices.
+
+        Returns:
+            The player's menu choice
+        """
+        self.print("\n--- What would you like to do? ---")
+        self.print("1. Explore a location")
+        self.print("2. Check status")
+        self.print("3. Visit shop")
+        self.print("4. Use item")
+        self.print("5. Quit game")
+
+        choice = yield from self.ask("Enter your choice (1-5): ", ["1", "2", "3", "4", "5"])
+        return choice
+
+    def explore_location(self):
+        """
+        Allow player to choose and explore a location.
+        Handles different encounters based on location.
+        """
+        self.print("\n--- Available Locations ---")
+        for i, loc in enumerate(locations, 1):
+            visited_marker = " (Visited)" if loc.key in self.visited_locations else ""
+            self.print(f"{i}. {loc.name}{visited_marker}")
+        self.print(f"{len(locations) + 1}. Go back")
+
+        valid_choices = [str(i) for i in range(1, len(locations) + 2)]
+        choice = yield from self.ask("Where would you like to go? ", valid_choices)
+
+        if choice == str(len(locations) + 1):
+            return
+
+        location_index = int(choice) - 1
+        location = locations[location_index]
+
+        self.display_separator()
+        self.print(f"📍 {location.name}")
+        self.print(location.description)
+        self.visited_locations.add(location.key)
+
+        # Handle location-specific encounters; the rest use their encounter table
+        handler = LOCATION_ENCOUNTERS.get(location.key)
+        if handler:
+            yield from handler(self)
+        else:
+            yield from self.random_encounter(location)
+
+    def village_encounter(self):
+        """
+        Handle encounters in the Village of Elderbrook.
+        Player can talk to villagers and receive hints.
+        """
+        self.print("\nThe villagers greet you warmly.")
+        self.print("An old sage approaches you...")
+        self.print('\n"Brave adventurer," he says, "to defeat the dragon, you must first')
+        self.print('find the Crystal Sword hidden in the Crystal Cave. Without it,')
+        self.print('the dragon\'s scales cannot be pierced!"')
+
+        # Random chance to receive gold from grateful villagers
+        if self.rng.random() < 0.5:
+            gold_found = self.rng.randint(5, 15)
+            self.player["gold"] += gold_found
+            self.print(f"\nA grateful villager gives you {gold_found} gold coins!")
+        yield from ()  # asks nothing, but every encounter is a generator
+
+    def random_encounter(self, location: content.Location):
+        """
+        Handle a location whose encounters are drawn from its content table,
+        like the Whispering Forest or any location added by a content pack.
+
+        Args:
+            location: The location being explored
+        """
+        player = self.player
+        if location.intro:
+            self.print(f"\n{CLI_WORDING.get(location.intro, location.intro)}")
+        if not location.encounter_table:
+            return
+
+        encounter = self.rng.choice(location.encounter_table)
+
+        if encounter.kind == "fight":
+            enemy = content.ENEMIES[encounter.enemy]
+            self.print(f"\n{enemy.icon} {CLI_WORDING.get(enemy.appears, enemy.appears)}")
+            yield from self.combat(enemy)
+        elif encounter.kind == "heal":
+            player["health"] = min(player["health"] + encounter.amount, player["max_health"])
+            self.report_encounter(encounter, encounter.amount, "health")
+        else:
+            gold_found = self.rng.randint(encounter.min_gold, encounter.max_gold)
+            player["gold"] += gold_found
+            self.report_encounter(encounter, gold_found, "gold")
+
+    def report_encounter(self, encounter: content.Encounter, amount: int, unit: str):
+        """
+        Print what a heal or treasure encounter gave the player.
+
+        Args:
+            encounter: The encounter that happened
+            amount: Health recovered or gold found
+            unit: "health" or "gold"
+        """
+        wording = CLI_ENCOUNTER_WORDING.get(encounter.text)
+        if wording:
+            self.print(wording.format(amount=amount))
+        else:
+            self.print(f"\n{encounter.icon} {encounter.text}")
+            self.print(f"{encounter.detail} {amount} {unit}!")
+
+    def cave_encounter(self):
+        """
+        Handle encounters in the Crystal Cave.
+        Player can find the Crystal Sword needed to defeat the dragon.
+        """
+        self.print("\nThe crystals illuminate your path as you explore the cave...")
+
+        if "Crystal Sword" in self.inventory:
+            self.print("You've already claimed the Crystal Sword from this cave.")
+            self.print("The cave feels peaceful now.")
+            return
+
+        bat = content.ENEMIES["bat"]
+        self.print("\n🦇 A Giant Bat swoops down to attack!")
+        victory = yield from self.combat(bat)
+
+        reward = content.ITEMS.get(bat.reward_item)
+        if victory and reward and reward.name not in self.inventory:
+            self.print("\n✨ With the bat defeated, you notice a glowing sword embedded in a crystal!")
+            if not self.inventory.can_add(reward.name):
+                self.print(f"But your pack is full, so you leave the {reward.name.upper()} where it is.")
+                return
+            self.print(f"You pull it free - it's the legendary {reward.name.upper()}!")
+            self.inventory.add(reward.name)
+            self.player["attack"] += reward.attack
+            self.print(f"Your attack power has increased by {reward.attack}!")
+
+    def dragon_encounter(self):
+        """
+        Handle the final boss encounter with the Dragon of Shadowmere.
+        Requires Crystal Sword to have a chance at victory.
+        """
+        player = self.player
+
+        if self.dragon_defeated:
+            self.print("\nThe dragon has been defeated. Peace has returned to the lair.")
+            return
+
+        self.print("\n🐉 THE DRAGON OF SHADOWMERE AWAKENS!")
+        self.print("Its massive form fills the cavern, scales glittering like obsidian.")
+
+        if "Crystal Sword" not in self.inventory:
+            self.print("\n⚠️ You don't have the Crystal Sword!")
+            self.print("Your attacks bounce harmlessly off the dragon's scales.")
+            self.print("You barely escape with your life!")
+            player["health"] = max(10, player["health"] - 40)
+            self.print(f"You took 40 damage fleeing! Current health: {player['health']}")
+            return
+
+        self.print("\nYour Crystal Sword glows with ancient power!")
+        self.print("The dragon recognizes the legendary blade and roars in fury!")
+
+        victory = yield from self.combat(content.ENEMIES["dragon"])
+
+        if victory:
+            self.dragon_defeated = True
+            self.print("\n🎉 VICTORY! 🎉")
+            self.print("The Dragon of Shadowmere has been defeated!")
+            self.print("You are hailed as the greatest hero the realm has ever known!")
+            self.print("\n*** CONGRATULATIONS! YOU HAVE COMPLETED THE QUEST! ***")
+
+            choice = yield from self.ask("\nWould you like to continue exploring? (yes/no): ", ["yes", "no"])
+            if choice == "no":
+                self.game_active = False
+
+    def combat(self, enemy: content.Enemy):
+        """
+        Handle combat between the player and an enemy.
+
+        Args:
+            enemy: The enemy to fight, from fantasy_content.ENEMIES
+
+        Returns:
+            True if player wins, False if player flees or is defeated
+        """
+        player = self.player
+        rng = self.rng
+        enemy_name = enemy.name
+        enemy_health = enemy.health
+        attack = enemy.attack
+        gold_reward = enemy.gold
+
+        self.print(f"\n--- Battle with {enemy_name} ---")
+        self.print(f"{enemy_name} Health: {enemy_health}")
+
+        while enemy_health > 0 and player["health"] > 0:
+            self.print(f"\nYour Health: {player['health']} | {enemy_name} Health: {enemy_health}")
+            self.print("1. Attack")
+            self.print("2. Use Health Potion")
+            self.print("3. Flee")
+
+            choice = yield from self.ask("Choose your action: ", ["1", "2", "3"])
+
+            if choice == "1":
+                # Player attacks
+                damage = rules.roll_player_damage(rng, player["attack"])
+                enemy_health -= damage
+                self.print(f"You strike the {enemy_name} for {damage} damage!")
+
+            elif choice == "2":
+                if "Health Potion" in self.inventory:
+                    self.inventory.remove("Health Potion")
+                    heal = content.ITEMS["potion"].heal
+                    player["health"] = min(player["health"] + heal, player["max_health"])
+                    self.print(f"You drink a Health Potion and recover {heal} health!")
+                else:
+                    self.print("You don't have any Health Potions!")
+                    continue
+
+            elif choice == "3":
+                if rules.roll_flee(rng):
+                    self.print("You successfully flee from battle!")
+                    return False
+                else:
+                    self.print("You failed to escape!")
+
+            # Enemy attacks if still alive
+            if enemy_health > 0:
+                actual_damage = rules.roll_enemy_damage(rng, attack, player["defense"])
+                player["health"] -= actual_damage
+                self.print(f"The {enemy_name} attacks you for {actual_damage} damage!")
+
+        if player["health"] <= 0:
+            self.print("\n💀 You have been defeated!")
+            self.print("GAME OVER")
+            return False
+        else:
+            self.print(f"\n⚔️ You defeated the {enemy_name}!")
+            player["gold"] += gold_reward
+            self.print(f"You earned {gold_reward} gold!")
+            return True
+
+    def visit_shop(self):
+        """
+        Allow player to buy items from the shop.
+        Displays available items and handles purchase logic.
+        """
+        player = self.player
+        self.print("\n--- Welcome to the Village Shop ---")
+        self.print(f"Your gold: {player['gold']}\n")
+
+        for i, item in enumerate(shop_items, 1):
+            self.print(f"{i}. {item.name} - {item.price} gold ({item.effect})")
+        self.print(f"{len(shop_items) + 1}. Leave shop")
+
+        valid_choices = [str(i) for i in range(1, len(shop_items) + 2)]
+        choice = yield from self.ask("What would you like to buy? ", valid_choices)
+
+        if choice == str(len(shop_items) + 1):
+            self.print("Thanks for visiting!")
+            return
+
+        item_index = int(choice) - 1
+        item = shop_items[item_index]
+
+        if not self.inventory.can_add(item.name):
+            if item.name in self.inventory:
+                self.print("You can't carry any more of that!")
+            else:
+                self.print("Your pack is full!")
+        elif player["gold"] >= item.price:
+            player["gold"] -= item.price
+
+            # Apply item effects
+            player["attack"] += item.attack
+            player["defense"] += item.defense
+            player["max_health"] += item.max_health
+            player["health"] += item.max_health
+            self.inventory.add(item.name)
+
+            self.print(f"You purchased {item.name}!")
+        else:
+            self.print("You don't have enough gold!")
 
-def display_separator():
-    """Display a visual separator line."""
-    print("\n" + "=" * 60 + "\n")
+    def use_item(self):
+        """
+        Allow player to use items from their inventory.
+        """
+        player = self.player
+        inventory = self.inventory
+        if not inventory:
+            self.print("\nYour inventory is empty!")
+            return
 
+        self.print("\n--- Your Inventory ---")
+        usable_items = inventory.usable()
 
-def display_player_status():
-    """Display current player stats and inventory."""
-    print(f"\n--- {player['name']}'s Status ---")
-    print(f"Health: {player['health']}/{player['max_health']}")
-    print(f"Attack: {player['attack']} | Defense: {player['defense']}")
-    print(f"Gold: {player['gold']}")
-    print(f"Inventory: {', '.join(inventory) if inventory else 'Empty'}")
+        if not usable_items:
+            self.print("You have no usable items.")
+            self.print(f"Inventory: {inventory.describe()}")
+            return
+
+        for i, item in enumerate(usable_items, 1):
+            count = inventory.count(item)
+            self.print(f"{i}. {item}" + (f" (x{count})" if count > 1 else ""))
+        self.print(f"{len(usable_items) + 1}. Cancel")
+
+        valid_choices = [str(i) for i in range(1, len(usable_items) + 2)]
+        choice = yield from self.ask("Which item would you like to use? ", valid_choices)
+
+        if choice == str(len(usable_items) + 1):
+            return
+
+        item = content.ITEMS_BY_NAME[usable_items[int(choice) - 1]]
+
+        if player["health"] >= player["max_health"]:
+            self.print("Your health is already full!")
+        else:
+            inventory.remove(item.name)
+            player["health"] = min(player["health"] + item.heal, player["max_health"])
+            self.print(f"You drink a {item.name} and recover {item.heal} health!")
+
+    def end_game(self):
+        """
+        Display end game message and final stats.
+        """
+        self.display_separator()
+        self.print("Thank you for playing THE REALM OF SHADOWMERE!")
+        self.print("\n--- Final Stats ---")
+        self.display_player_status()
+
+        if self.dragon_defeated:
+            self.print("\n🏆 Quest Status: COMPLETED - Dragon Defeated!")
+        else:
+            self.print("\n📜 Quest Status: Incomplete - The dragon still lives...")
+
+        self.display_separator()
+
+    # ========================================================================
+    # MAIN GAME LOOP
+    # ========================================================================
+
+    def run(self):
+        """
+        Main game loop that runs the adventure.
+        Demonstrates use of while loop for continuous gameplay.
+        """
+        yield from self.start_game()
+
+        while self.game_active and self.player["health"] > 0:
+            choice = yield from self.main_menu()
+
+            if choice == "1":
+                yield from self.explore_location()
+            elif choice == "2":
+                self.display_player_status()
+            elif choice == "3":
+                yield from self.visit_shop()
+            elif choice == "4":
+                yield from self.use_item()
+            elif choice == "5":
+                confirm = yield from self.ask("Are you sure you want to quit? (yes/no): ", ["yes", "no"])
+                if confirm == "yes":
+                    self.game_active = False
+
+        self.end_game()
+
+
+# Location key -> encounter method
+LOCATION_ENCOUNTERS = {
+    "village": GameState.village_encounter,
+    "cave": GameState.cave_encounter,
+    "dragon": GameState.dragon_encounter,
+}
 
 
 # ============================================================================
-# GAME FUNCTIONS
+# BATCH MODE
 # ============================================================================
 
-def start_game():
-    """
-    Initialize the game and get player name.
-    Displays welcome message and sets up initial game state.
-    """
-    display_separator()
-    print("⚔️  WELCOME TO THE REALM OF SHADOWMERE ⚔️")
-    print("A Fantasy-Style Text Adventure Game")
-    display_separator()
-    
-    print("In the land of Shadowmere, a fearsome dragon threatens the kingdom.")
-    print("You are a brave adventurer chosen to defeat this ancient evil.")
-    print("Explore the land, gather items, and prepare for the ultimate battle!\n")
-    
-    player["name"] = input("Enter your adventurer's name: ").strip()
-    if not player["name"]:
-        player["name"] = "Hero"
-    
-    print(f"\nWelcome, {player['name']}! Your quest begins in the Village of Elderbrook.")
-    inventory.append("Rusty Dagger")
-    print("You start with a Rusty Dagger and 20 gold coins.\n")
-
-
-def main_menu():
-    """
-    Display the main game menu and handle player choices.
-    
-    Returns:
-        The player's menu choice
-    """
-    print("\n--- What would you like to do? ---")
-    print("1. Explore a location")
-    print("2. Check status")
-    print("3. Visit shop")
-    print("4. Use item")
-    print("5. Quit game")
-    
-    choice = get_valid_input("Enter your choice (1-5): ", ["1", "2", "3", "4", "5"])
-    return choice
-
-
-def explore_location():
-    """
-    Allow player to choose and explore a location.
-    Handles different encounters based on location.
-    """
-    print("\n--- Available Locations ---")
-    for i, loc in enumerate(locations, 1):
-        visited_marker = " (Visited)" if loc["visited"] else ""
-        print(f"{i}. {loc['name']}{visited_marker}")
-    print(f"{len(locations) + 1}. Go back")
-    
-    valid_choices = [str(i) for i in range(1, len(locations) + 2)]
-    choice = get_valid_input("Where would you like to go? ", valid_choices)
-    
-    if choice == str(len(locations) + 1):
-        return
-    
-    location_index = int(choice) - 1
-    location = locations[location_index]
-    
-    display_separator()
-    print(f"📍 {location['name']}")
-    print(location["description"])
-    location["visited"] = True
-    
-    # Handle location-specific encounters
-    if location["name"] == "Village of Elderbrook":
-        village_encounter()
-    elif location["name"] == "Whispering Forest":
-        forest_encounter()
-    elif location["name"] == "Crystal Cave":
-        cave_encounter()
-    elif location["name"] == "Dragon's Lair":
-        dragon_encounter()
-
-
-def village_encounter():
-    """
-    Handle encounters in the Village of Elderbrook.
-    Player can talk to villagers and receive hints.
-    """
-    print("\nThe villagers greet you warmly.")
-    print("An old sage approaches you...")
-    print('\n"Brave adventurer," he says, "to defeat the dragon, you must first')
-    print('find the Crystal Sword hidden in the Crystal Cave. Without it,')
-    print('the dragon\'s scales cannot be pierced!"')
-    
-    # Random chance to receive gold from grateful villagers
-    if random.random() < 0.5:
-        gold_found = random.randint(5, 15)
-        player["gold"] += gold_found
-        print(f"\nA grateful villager gives you {gold_found} gold coins!")
-
-
-def forest_encounter():
-    """
-    Handle encounters in the Whispering Forest.
-    Player may encounter friendly or hostile creatures.
-    """
-    print("\nYou venture deep into the forest...")
-    
-    encounters = ["goblin", "fairy", "wolf", "treasure"]
-    encounter = random.choice(encounters)
-    
-    if encounter == "goblin":
-        print("\n⚔️ A wild Goblin appears!")
-        combat("Goblin", health=30, attack=8, gold_reward=10)
-    elif encounter == "fairy":
-        print("\n✨ A friendly forest fairy appears!")
-        print("She sprinkles healing dust on you.")
-        heal_amount = 20
-        player["health"] = min(player["health"] + heal_amount, player["max_health"])
-        print(f"You recovered {heal_amount} health!")
-    elif encounter == "wolf":
-        print("\n🐺 A fierce Wolf blocks your path!")
-        combat("Wolf", health=25, attack=10, gold_reward=8)
-    else:
-        gold_found = random.randint(10, 25)
-        player["gold"] += gold_found
-        print(f"\n💰 You found a hidden treasure chest containing {gold_found} gold!")
+SEED_HEADER = "# seed "
 
 
-def cave_encounter():
-    """
-    Handle encounters in the Crystal Cave.
-    Player can find the Crystal Sword needed to defeat the dragon.
-    """
-    print("\nThe crystals illuminate your path as you explore the cave...")
-    
-    if "Crystal Sword" in inventory:
-        print("You've already claimed the Crystal Sword from this cave.")
-        print("The cave feels peaceful now.")
-        return
-    
-    print("\n🦇 A Giant Bat swoops down to attack!")
-    victory = combat("Giant Bat", health=35, attack=12, gold_reward=15)
-    
-    if victory:
-        print("\n✨ With the bat defeated, you notice a glowing sword embedded in a crystal!")
-        print("You pull it free - it's the legendary CRYSTAL SWORD!")
-        inventory.append("Crystal Sword")
-        player["attack"] += 15
-        print("Your attack power has increased by 15!")
-
-
-def dragon_encounter():
-    """
-    Handle the final boss encounter with the Dragon of Shadowmere.
-    Requires Crystal Sword to have a chance at victory.
-    """
-    global dragon_defeated, game_active
-    
-    if dragon_defeated:
-        print("\nThe dragon has been defeated. Peace has returned to the lair.")
-        return
-    
-    print("\n🐉 THE DRAGON OF SHADOWMERE AWAKENS!")
-    print("Its massive form fills the cavern, scales glittering like obsidian.")
-    
-    if "Crystal Sword" not in inventory:
-        print("\n⚠️ You don't have the Crystal Sword!")
-        print("Your attacks bounce harmlessly off the dragon's scales.")
-        print("You barely escape with your life!")
-        player["health"] = max(10, player["health"] - 40)
-        print(f"You took 40 damage fleeing! Current health: {player['health']}")
-        return
-    
-    print("\nYour Crystal Sword glows with ancient power!")
-    print("The dragon recognizes the legendary blade and roars in fury!")
-    
-    victory = combat("Dragon of Shadowmere", health=100, attack=20, gold_reward=100)
-    
-    if victory:
-        dragon_defeated = True
-        print("\n🎉 VICTORY! 🎉")
-        print("The Dragon of Shadowmere has been defeated!")
-        print("You are hailed as the greatest hero the realm has ever known!")
-        print("\n*** CONGRATULATIONS! YOU HAVE COMPLETED THE QUEST! ***")
-        
-        choice = get_valid_input("\nWould you like to continue exploring? (yes/no): ", ["yes", "no"])
-        if choice == "no":
-            game_active = False
-
-
-def combat(enemy_name: str, health: int, attack: int, gold_reward: int) -> bool:
+def load_script(path: str) -> tuple:
     """
-    Handle combat between the player and an enemy.
-    
+    Read a command script: an optional "# seed N" header, then one input per line.
+
+    Only the first line can be the header; any other line is an input,
+    even one starting with # (a player named "#1 Hero", say).
+
     Args:
-        enemy_name: Name of the enemy
-        health: Enemy's starting health
-        attack: Enemy's attack power
-        gold_reward: Gold earned for defeating the enemy
-        
+        path: File to read, or "-" for standard input
+
     Returns:
-        True if player wins, False if player flees or is defeated
+        (input lines without line endings, seed from the header or None)
     """
-    enemy_health = health
-    
-    print(f"\n--- Battle with {enemy_name} ---")
-    print(f"{enemy_name} Health: {enemy_health}")
-    
-    while enemy_health > 0 and player["health"] > 0:
-        print(f"\nYour Health: {player['health']} | {enemy_name} Health: {enemy_health}")
-        print("1. Attack")
-        print("2. Use Health Potion")
-        print("3. Flee")
-        
-        choice = get_valid_input("Choose your action: ", ["1", "2", "3"])
-        
-        if choice == "1":
-            # Player attacks
-            damage = random.randint(player["attack"] - 3, player["attack"] + 5)
-            enemy_health -= damage
-            print(f"You strike the {enemy_name} for {damage} damage!")
-            
-        elif choice == "2":
-            if "Health Potion" in inventory:
-                inventory.remove("Health Potion")
-                heal = 30
-                player["health"] = min(player["health"] + heal, player["max_health"])
-                print(f"You drink a Health Potion and recover {heal} health!")
-            else:
-                print("You don't have any Health Potions!")
-                continue
-                
-        elif choice == "3":
-            escape_chance = random.random()
-            if escape_chance > 0.3:
-                print("You successfully flee from battle!")
-                return False
-            else:
-                print("You failed to escape!")
-        
-        # Enemy attacks if still alive
-        if enemy_health > 0:
-            enemy_damage = random.randint(attack - 2, attack + 3)
-            actual_damage = max(1, enemy_damage - player["defense"])
-            player["health"] -= actual_damage
-            print(f"The {enemy_name} attacks you for {actual_damage} damage!")
-    
-    if player["health"] <= 0:
-        print("\n💀 You have been defeated!")
-        print("GAME OVER")
-        return False
+    if path == "-":
+        text = sys.stdin.read()
     else:
-        print(f"\n⚔️ You defeated the {enemy_name}!")
-        player["gold"] += gold_reward
-        print(f"You earned {gold_reward} gold!")
-        return True
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    lines = text.splitlines()
+    seed = None
+    if lines and lines[0].startswith(SEED_HEADER):
+        seed = int(lines.pop(0)[len(SEED_HEADER):])
+    return lines, seed
+
+
+def script_paths(paths: list) -> list:
+    """Expand directories to the .txt scripts they contain, sorted by name."""
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            scripts.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                           if name.endswith(".txt"))
+        else:
+            scripts.append(path)
+    return scripts
 
 
-def visit_shop():
-    """
-    Allow player to buy items from the shop.
-    Displays available items and handles purchase logic.
+def play_script(lines: list, seed: int = 0, quiet: bool = False, out=None):
     """
-    print("\n--- Welcome to the Village Shop ---")
-    print(f"Your gold: {player['gold']}\n")
-    
-    for i, item in enumerate(shop_items, 1):
-        print(f"{i}. {item['name']} - {item['price']} gold ({item['effect']})")
-    print(f"{len(shop_items) + 1}. Leave shop")
-    
-    valid_choices = [str(i) for i in range(1, len(shop_items) + 2)]
-    choice = get_valid_input("What would you like to buy? ", valid_choices)
-    
-    if choice == str(len(shop_items) + 1):
-        print("Thanks for visiting!")
-        return
-    
-    item_index = int(choice) - 1
-    item = shop_items[item_index]
-    
-    if player["gold"] >= item["price"]:
-        player["gold"] -= item["price"]
-        
-        # Apply item effects
-        if item["name"] == "Health Potion":
-            inventory.append("Health Potion")
-        elif item["name"] == "Iron Sword":
-            player["attack"] += 5
-            inventory.append("Iron Sword")
-        elif item["name"] == "Leather Shield":
-            player["defense"] += 3
-            inventory.append("Leather Shield")
-        elif item["name"] == "Magic Amulet":
-            player["max_health"] += 20
-            player["health"] += 20
-            inventory.append("Magic Amulet")
-        
-        print(f"You purchased {item['name']}!")
-    else:
-        print("You don't have enough gold!")
+    Play a game from a list of inputs.
 
+    Args:
+        lines: The inputs, in order; any left after the game ends are ignored
+        seed: Seed for the game's random.Random
+        quiet: If True, skip rendering entirely
+        out: File to write each screen to, or None to discard the output
 
-def use_item():
+    Returns:
+        (GameState, number of inputs used)
     """
-    Allow player to use items from their inventory.
+    game = GameState(rng=random.Random(seed), quiet=quiet)
+    write = out.write if out is not None and not quiet else None
+    screen = game.start()
+    if write:
+        write(screen)
+    used = 0
+    for line in lines:
+        if game.finished:
+            break
+        screen = game.send(line)
+        used += 1
+        if write:
+            write(screen)
+    return game, used
+
+
+def format_summary(name: str, summary: dict, used: int, elapsed: float) -> str:
+    """Return a one-line report of a script's final state and timing."""
+    status = "finished" if summary["finished"] else f"waiting at {summary['prompt'].strip()!r}"
+    dragon = "dragon defeated" if summary["dragon_defeated"] else "dragon alive"
+    return (f"{name}: {status} after {used} inputs in {elapsed * 1000:.2f} ms | "
+            f"health {summary['health']}/{summary['max_health']} "
+            f"attack {summary['attack']} defense {summary['defense']} gold {summary['gold']} | "
+            f"{dragon} | {summary['inventory']}")
+
+
+def run_batch(paths: list, seed: int = None, quiet: bool = False, as_json: bool = False) -> int:
     """
-    if not inventory:
-        print("\nYour inventory is empty!")
-        return
-    
-    print("\n--- Your Inventory ---")
-    usable_items = [item for item in inventory if item == "Health Potion"]
-    
-    if not usable_items:
-        print("You have no usable items.")
-        print(f"Inventory: {', '.join(inventory)}")
-        return
-    
-    for i, item in enumerate(usable_items, 1):
-        print(f"{i}. {item}")
-    print(f"{len(usable_items) + 1}. Cancel")
-    
-    valid_choices = [str(i) for i in range(1, len(usable_items) + 2)]
-    choice = get_valid_input("Which item would you like to use? ", valid_choices)
-    
-    if choice == str(len(usable_items) + 1):
-        return
-    
-    item_name = usable_items[int(choice) - 1]
-    
-    if item_name == "Health Potion":
-        if player["health"] >= player["max_health"]:
-            print("Your health is already full!")
-        else:
-            inventory.remove("Health Potion")
-            heal = 30
-            player["health"] = min(player["health"] + heal, player["max_health"])
-            print(f"You drink a Health Potion and recover {heal} health!")
+    Play every script and report on each.
 
+    Args:
+        paths: Script files or directories of .txt scripts; "-" is stdin
+        seed: Seed used for every script, or None for each script's
+            "# seed N" line (0 without one)
+        quiet: If True, only the reports are printed
+        as_json: If True, print each report as a JSON object
 
-def end_game():
-    """
-    Display end game message and final stats.
+    Returns:
+        Number of scripts played
     """
-    display_separator()
-    print("Thank you for playing THE REALM OF SHADOWMERE!")
-    print("\n--- Final Stats ---")
-    display_player_status()
-    
-    if dragon_defeated:
-        print("\n🏆 Quest Status: COMPLETED - Dragon Defeated!")
-    else:
-        print("\n📜 Quest Status: Incomplete - The dragon still lives...")
-    
-    display_separator()
+    scripts = script_paths(paths)
+    out = sys.stdout
+    total_start = time.perf_counter()
+    for path in scripts:
+        lines, script_seed = load_script(path)
+        if seed is not None:
+            script_seed = seed
+        start = time.perf_counter()
+        game, used = play_script(lines, seed=script_seed or 0, quiet=quiet, out=out)
+        elapsed = time.perf_counter() - start
+        summary = game.summary()
+        if as_json:
+            out.write(json.dumps({"script": path, "inputs": used, "seconds": elapsed, **summary},
+                                 ensure_ascii=False) + "\n")
+        else:
+            out.write(("" if quiet else "\n") + format_summary(path, summary, used, elapsed) + "\n")
+    total = time.perf_counter() - total_start
+    print(f"{len(scripts)} scripts in {total:.3f}s", file=sys.stderr)
+    return len(scripts)
 
 
 # ============================================================================
-# MAIN GAME LOOP
+# ENTRY POINT
 # ============================================================================
 
-def main():
-    """
-    Main game loop that runs the adventure.
-    Demonstrates use of while loop for continuous gameplay.
-    """
-    global game_active
-    
-    start_game()
-    
-    while game_active and player["health"] > 0:
-        choice = main_menu()
-        
-        if choice == "1":
-            explore_location()
-        elif choice == "2":
-            display_player_status()
-        elif choice == "3":
-            visit_shop()
-        elif choice == "4":
-            use_item()
-        elif choice == "5":
-            confirm = get_valid_input("Are you sure you want to quit? (yes/no): ", ["yes", "no"])
-            if confirm == "yes":
-                game_active = False
-    
-    end_game()
+def main(argv=None):
+    """Play one game in the terminal, or replay scripts with --batch."""
+    parser = argparse.ArgumentParser(description="The Realm of Shadowmere, a text adventure.")
+    parser.add_argument("--batch", nargs="+", metavar="SCRIPT",
+                        help="play command scripts (files, directories of .txt, or - for stdin)")
+    parser.add_argument("--seed", type=int,
+                        help="random seed (batch mode default: the script's # seed line, else 0)")
+    parser.add_argument("--record", metavar="FILE", help="save the game's inputs as a script")
+    parser.add_argument("--quiet", action="store_true", help="batch mode: do not render the game")
+    parser.add_argument("--json", action="store_true", help="batch mode: report as JSON lines (implies --quiet)")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        run_batch(args.batch, seed=args.seed, quiet=args.quiet or args.json, as_json=args.json)
+        return
+
+    seed = args.seed if args.seed is not None else random.SystemRandom().getrandbits(32)
+    record = open(args.record, "w", encoding="utf-8") if args.record else None
+    try:
+        if record:
+            record.write(f"{SEED_HEADER}{seed}\n")
+        game = GameState(rng=random.Random(seed))
+        print(game.start(), end="")
+        while not game.finished:
+            line = input()
+            if record:
+                record.write(line + "\n")
+                record.flush()
+            print(game.send(line), end="")
+    finally:
+        if record:
+            record.close()
 
 
 # Run the game
@@ -13,210 +13,209 @@ To find your IP address:
 - Mac/Linux: ifconfig or ip addr
 """
 
-from flask import Flask, render_template_string, request, session, redirect, url_for
-import random
+from flask import Flask, abort, g, jsonify, make_response, request, session, redirect, url_for
+import hashlib
 import os
+import secrets
+from collections import Counter
+from time import perf_counter
+
+from markupsafe import Markup
+
+import fantasy_actions as actions
+import fantasy_assets as assets
+import fantasy_codec as codec
+import fantasy_content as content
+import fantasy_metrics as metrics
+import fantasy_profile as profile
+import fantasy_replay as replay
+import fantasy_sessions as sessions
+import fantasy_trace as trace
+import fantasy_views as views
+from fantasy_actions import new_player
+from fantasy_cache import FragmentCache
+from fantasy_combat import Policy
+
+# Static files are served by static_asset() below, not Flask's default route
+app = Flask(__name__, static_folder=None)
+# Signs the session cookie. Set SHADOWMERE_SECRET_KEY to keep cookies valid
+# across restarts and processes; fantasy_serve.py does.
+app.secret_key = os.environ.get('SHADOWMERE_SECRET_KEY') or os.urandom(24)
+
+# Player state lives server-side; the cookie only holds a session ID
+store = sessions.create_store()
+
+# Rendered fragments, keyed by exactly the values each one displays
+stats_bar_cache = FragmentCache('stats_bar', maxsize=4096)
+inventory_cache = FragmentCache('inventory', maxsize=1024)
+location_cache = FragmentCache('location', maxsize=256)
+# Conditional pages answered with a 304 ('hits') or in full ('misses'); see conditional_page()
+page_etag_counts = Counter()
+
+# Keep an action log of every game, downloadable at /log (see fantasy_replay)
+record_actions = bool(os.environ.get('SHADOWMERE_ACTION_LOGS'))
+
+
+def encode_player(player):
+    """Serialize player state for the session store."""
+    # Records are ~100 bytes; zlib costs more time than it saves space here
+    return codec.encode(player)
+
+
+def decode_player(data):
+    """Deserialize player state from the session store."""
+    return codec.decode(data)
+
+
+NEW_PLAYER_DATA = encode_player(new_player())
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session management
-
-# HTML Template with fantasy styling
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Realm of Shadowmere - Fantasy Adventure</title>
-    <style>
-        * { box-sizing: border-box; }
-        body {
-            background: linear-gradient(135deg, #1a1a2e 0%, #16213e 50%, #0f3460 100%);
-            color: #e8d5b7;
-            font-family: 'Georgia', serif;
-            min-height: 100vh;
-            margin: 0;
-            padding: 20px;
-        }
-        .container {
-            max-width: 800px;
-            margin: 0 auto;
-            background: rgba(0,0,0,0.6);
-            border: 3px solid #c9a227;
-            border-radius: 10px;
-            padding: 30px;
-            box-shadow: 0 0 30px rgba(201, 162, 39, 0.3);
-        }
-        h1 {
-            text-align: center;
-            color: #c9a227;
-            text-shadow: 2px 2px 4px #000;
-            font-size: 2.5em;
-            margin-bottom: 10px;
-        }
-        h2 {
-            color: #c9a227;
-            border-bottom: 2px solid #c9a227;
-            padding-bottom: 10px;
-        }
-        .subtitle {
-            text-align: center;
-            font-style: italic;
-            margin-bottom: 30px;
-        }
-        .stats-bar {
-            display: flex;
-            justify-content: space-around;
-            background: rgba(201, 162, 39, 0.2);
-            padding: 15px;
-            border-radius: 5px;
-            margin-bottom: 20px;
-            flex-wrap: wrap;
-        }
-        .stat {
-            text-align: center;
-            padding: 5px 15px;
-        }
-        .stat-label { font-size: 0.9em; color: #aaa; }
-        .stat-value { font-size: 1.3em; font-weight: bold; color: #c9a227; }
-        .game-text {
-            background: rgba(0,0,0,0.4);
-            padding: 20px;
-            border-radius: 5px;
-            margin-bottom: 20px;
-            line-height: 1.8;
-            border-left: 4px solid #c9a227;
-        }
-        .choices {
-            display: flex;
-            flex-direction: column;
-            gap: 10px;
-        }
-        .choice-btn {
-            background: linear-gradient(180deg, #2d2d44 0%, #1a1a2e 100%);
-            color: #e8d5b7;
-            border: 2px solid #c9a227;
-            padding: 15px 25px;
-            font-size: 1.1em;
-            cursor: pointer;
-            border-radius: 5px;
-            transition: all 0.3s;
-            font-family: 'Georgia', serif;
-        }
-        .choice-btn:hover {
-            background: linear-gradient(180deg, #c9a227 0%, #a07d1c 100%);
-            color: #1a1a2e;
-            transform: translateX(10px);
-        }
-        input[type="text"] {
-            background: rgba(0,0,0,0.5);
-            border: 2px solid #c9a227;
-            color: #e8d5b7;
-            padding: 15px;
-            font-size: 1.1em;
-            width: 100%;
-            border-radius: 5px;
-            margin-bottom: 15px;
-            font-family: 'Georgia', serif;
-        }
-        .inventory {
-            background: rgba(201, 162, 39, 0.1);
-            padding: 15px;
-            border-radius: 5px;
-            margin-top: 20px;
-        }
-        .inventory h3 { margin-top: 0; color: #c9a227; }
-        .message {
-            padding: 15px;
-            border-radius: 5px;
-            margin-bottom: 15px;
-            text-align: center;
-        }
-        .message-success { background: rgba(39, 174, 96, 0.3); border: 1px solid #27ae60; }
-        .message-danger { background: rgba(231, 76, 60, 0.3); border: 1px solid #e74c3c; }
-        .message-info { background: rgba(52, 152, 219, 0.3); border: 1px solid #3498db; }
-        .health-bar {
-            background: #333;
-            border-radius: 10px;
-            overflow: hidden;
-            height: 20px;
-            margin: 5px 0;
-        }
-        .health-fill {
-            background: linear-gradient(90deg, #e74c3c, #27ae60);
-            height: 100%;
-            transition: width 0.5s;
-        }
-        footer {
-            text-align: center;
-            margin-top: 30px;
-            color: #666;
-            font-size: 0.9em;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        {{ content | safe }}
-    </div>
-    <footer>Fantasy Adventure Game - Created with Python & Flask</footer>
-</body>
-</html>
-"""
 
 def get_player():
     """Get or initialize player session data."""
-    if 'player' not in session:
-        session['player'] = {
-            'name': '',
-            'health': 100,
-            'max_health': 100,
-            'attack': 10,
-            'defense': 5,
-            'gold': 20,
-            'inventory': ['Rusty Dagger'],
-            'locations_visited': [],
-            'dragon_defeated': False,
-            'game_started': False,
-            'current_combat': None,
-            'message': None,
-            'message_type': None
-        }
-    return session['player']
+    if 'player' not in g:
+        sid = session.get('sid')
+        data = store.load(sid) if sid else None
+        if data is None:
+            g.player = new_player()
+            g.player_data = NEW_PLAYER_DATA
+        else:
+            g.player = decode_player(data)
+            g.player_data = data
+            session_read_bytes.observe(len(data))
+    return g.player
 
 
 def save_player(player):
     """Save player data to session."""
-    session['player'] = player
-    session.modified = True
+    g.player = player
+
+
+def take_action(player, action, arg=None):
+    """Apply one of fantasy_actions.ACTIONS and, if record_actions, add it to the session's action log."""
+    fight, gold = player['current_combat'], player['gold']
+    start = perf_counter()
+    result = actions.perform(player, action, arg)
+    game_events.append((action, arg, result, fight, gold, player['gold'], perf_counter() - start))
+    if record_actions:
+        if action == 'start':
+            g.new_log = True
+        g.setdefault('log_entries', []).append(replay.entry(action, arg, player))
+    return result
+
+
+def count_game_event(action, arg, result, fight, gold, gold_after, seconds):
+    """Update the game metrics for one action; `fight` and `gold` are from before it."""
+    logic_seconds[action].observe(seconds)
+    if action == 'combat' and result is not fight:
+        fights_started[arg].inc()
+    elif action == 'potion' and result:
+        potions_used.inc()
+    elif action == 'auto':
+        potions_used.inc(sum(1 for step, _ in result[1] if step == 'potion'))
+    outcome = result[0] if action == 'auto' else result
+    if outcome == 'defeat':
+        deaths[fight['type']].inc()
+    if gold_after > gold and action != 'reset':
+        gold_minted.inc(gold_after - gold)
+
+
+# Keys the state versions, which are derived from the seed (see state_version())
+_secret = app.secret_key if isinstance(app.secret_key, bytes) else app.secret_key.encode()
+VERSION_KEY = hashlib.blake2b(_secret, digest_size=32, person=b'smversion').digest()
+
+
+def state_version(player):
+    """
+    Return the version of the player's state, an opaque token.
+
+    It is a digest of the seed and the number of actions counted, keyed
+    with the app's secret. Every change to the state but its message is a
+    counted action, so the version identifies the state; yet it tells a
+    client nothing about the seed, from which the rolls to come would follow.
+    """
+    data = f"{player['seed']}.{player['actions']}".encode()
+    return hashlib.blake2b(data, key=VERSION_KEY, digest_size=8).hexdigest()
+
+
+def fresh_request(player):
+    """
+    Tell whether an action request should be taken.
+
+    Pages put the state version they show into their action links as ?v=,
+    and actions render their result in place, so a refresh or a second
+    click resends an old version; that request only shows the current page.
+    Requests without a version are always taken.
+    """
+    version = request.values.get('v')
+    return version is None or version == state_version(player)
+
+
+def player_name(value):
+    """Return the name a player asked for: stripped, cut to actions.MAX_NAME_LENGTH, 'Hero' if blank."""
+    return str(value).strip()[:actions.MAX_NAME_LENGTH].rstrip() or 'Hero'
+
+
+def log_key():
+    """Return the store key of this browser's action log, creating the ID if needed."""
+    if 'log' not in session:
+        session['log'] = sessions.new_session_id()
+    return 'log:' + session['log']
+
+
+@app.after_request
+def persist_player(response):
+    """Write the player back to the store, but only if it changed, and extend the action log."""
+    player = g.pop('player', None)
+    if player is not None:
+        data = encode_player(player)
+        if data != g.player_data:
+            if 'sid' not in session:
+                session['sid'] = sessions.new_session_id()
+            store.save(session['sid'], data)
+            session_written_bytes.observe(len(data))
+    entries = g.pop('log_entries', None)
+    if entries:
+        key = log_key()
+        # A game starts a new log; any log starts from the state before this request
+        log = None if g.pop('new_log', False) else store.load(key)
+        store.save(key, replay.extend_log(log, entries, g.player_data))
+    return response
+
+
+class RequestTimings:
+    """
+    Time spent in the current request, for /metrics.
+
+    One for the process, not one per thread, which would make each update
+    several times dearer: prefork workers run one request at a time, and
+    under the threaded debug server a request overlapping another can at
+    worst have its render time counted towards the other.
+    """
+
+    render = 0.0
+
+
+timings = RequestTimings()
+
+
+def render(name, **context):
+    """Render a template as fantasy_views.render does, counting the time towards the request's render time."""
+    start = perf_counter()
+    html = Markup(views.compiled[name].render(context))  # not through views.render: one call and copy fewer
+    timings.render += perf_counter() - start
+    return html
 
 
 def render_stats_bar(player):
     """Render the player stats bar HTML."""
+    key = (player['name'], player['health'], player['max_health'],
+           player['attack'], player['defense'], player['gold'])
+    return stats_bar_cache.get(key, _render_stats_bar, player)
+
+
+def _render_stats_bar(player):
     health_percent = (player['health'] / player['max_health']) * 100
-    return f"""
-    <div class="stats-bar">
-        <div class="stat">
-            <div class="stat-label">Adventurer</div>
-            <div class="stat-value">{player['name']}</div>
-        </div>
-        <div class="stat">
-            <div class="stat-label">Health</div>
-            <div class="health-bar"><div class="health-fill" style="width: {health_percent}%"></div></div>
-            <div class="stat-value">{player['health']}/{player['max_health']}</div>
-        </div>
-        <div class="stat">
-            <div class="stat-label">Attack</div>
-            <div class="stat-value">⚔️ {player['attack']}</div>
-        </div>
-        <div class="stat">
-            <div class="stat-label">Defense</div>
-            <div class="stat-value">🛡️ {player['defense']}</div>
-        </div>
-        <div class="stat">
-            <div class="stat-label">Gold</div>
-            <div class="stat-value">💰 {player['gold']}</div>
-        </div>
-    </div>
-    """
+    return render('stats_bar.html', player=player, health_percent=health_percent)
 
 
 def render_message(player):
@@ -227,19 +226,63 @@ def render_message(player):
         player['message'] = None
         player['message_type'] = None
         save_player(player)
-        return f'<div class="message message-{msg_type}">{msg}</div>'
+        return render('message.html', msg=msg, msg_type=msg_type)
     return ''
 
 
 def render_inventory(player):
     """Render inventory section."""
-    items = ', '.join(player['inventory']) if player['inventory'] else 'Empty'
-    return f"""
-    <div class="inventory">
-        <h3>🎒 Inventory</h3>
-        <p>{items}</p>
-    </div>
+    inventory = player['inventory']
+    return inventory_cache.get(inventory.key(), _render_inventory, inventory)
+
+
+def _render_inventory(inventory):
+    return render('inventory.html', items=inventory.describe())
+
+
+def conditional_page(page, state, render):
+    """
+    Answer a GET for a page that depends only on `state`, honouring ETags.
+
+    The page is served with a weak ETag and must be revalidated on every
+    use, so a refresh of an unchanged page costs a 304 and no rendering.
+
+    Args:
+        page: Template name, used in the ETag
+        state: Tuple of every value the page displays
+        render: Callable returning the page body, only called on a miss
+
+    Returns:
+        A 304 or 200 response
     """
+    etag = views.page_etag(page, state)
+    if request.if_none_match.contains_weak(etag):
+        page_etag_counts['hits'] += 1
+        response = app.response_class(status=304)
+    else:
+        page_etag_counts['misses'] += 1
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def uncacheable_page(body):
+    """Wrap a page that must never be reused, e.g. one showing a message."""
+    response = make_response(body)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# The title page of a new player, which is what almost every visitor gets
+TITLE_PAGE = views.render('title.html', version=state_version(new_player()))
+
+
+def title_page(player):
+    """Return the title page, whose form carries the player's state version."""
+    if player['seed'] == 0 and player['actions'] == 0:
+        return TITLE_PAGE
+    return render('title.html', version=state_version(player))
 
 
 @app.route('/')
@@ -248,57 +291,25 @@ def index():
     player = get_player()
     
     if not player['game_started']:
-        content = """
-        <h1>⚔️ REALM OF SHADOWMERE ⚔️</h1>
-        <p class="subtitle">A Fantasy-Style Text Adventure</p>
-            <p class="subtitle">A Fantasy-Style Text Adventure</p>
-        
-        <div class="game-text">
-            <p>In the land of Shadowmere, a fearsome dragon threatens the kingdom.</p>
-            <p>You are a brave adventurer chosen to defeat this ancient evil.</p>
-            <p>Explore the land, gather items, and prepare for the ultimate battle!</p>
-        </div>
-        
-        <form action="/start" method="POST">
-            <input type="text" name="player_name" placeholder="Enter your adventurer's name..." required>
-            <button type="submit" class="choice-btn">🗡️ Begin Your Quest</button>
-        </form>
-        """
-    else:
-        content = render_stats_bar(player)
-        content += render_message(player)
-        content += """
-        <h2>📍 Village of Elderbrook</h2>
-        <div class="game-text">
-            <p>You stand in the heart of the village. The townsfolk go about their daily business.</p>
-            <p>Where would you like to go?</p>
-        </div>
-        
-        <div class="choices">
-            <a href="/location/village" class="choice-btn">🏘️ Explore the Village</a>
-            <a href="/location/forest" class="choice-btn">🌲 Enter the Whispering Forest</a>
-            <a href="/location/cave" class="choice-btn">💎 Venture into Crystal Cave</a>
-            <a href="/location/dragon" class="choice-btn">🐉 Challenge the Dragon's Lair</a>
-            <a href="/shop" class="choice-btn">🛒 Visit the Shop</a>
-            <a href="/status" class="choice-btn">📊 Check Status</a>
-            <a href="/reset" class="choice-btn">🔄 Restart Game</a>
-        </div>
-        """
-        content += render_inventory(player)
-    
-    return render_template_string(HTML_TEMPLATE, content=content)
+        return title_page(player)
+
+    return render(
+        'hub.html',
+        stats_bar=render_stats_bar(player),
+        message=render_message(player),
+        inventory=render_inventory(player),
+    )
 
 
 @app.route('/start', methods=['POST'])
 def start_game():
     """Start a new game."""
     player = get_player()
-    player['name'] = request.form.get('player_name', 'Hero').strip() or 'Hero'
-    player['game_started'] = True
-    player['message'] = f"Welcome, {player['name']}! Your quest begins!"
-    player['message_type'] = 'success'
-    save_player(player)
-    return redirect(url_for('index'))
+    if fresh_request(player):
+        name = player_name(request.form.get('player_name', ''))
+        take_action(player, 'start', (name, secrets.randbits(64)))
+        save_player(player)
+    return index()
 
 
 @app.route('/location/<location>')
@@ -309,159 +320,62 @@ def explore_location(location):
     if not player['game_started']:
         return redirect(url_for('index'))
     
-    content = render_stats_bar(player)
-    content += render_message(player)
-    
-    if location == 'village':
-        content += village_content(player)
-    elif location == 'forest':
-        content += forest_content(player)
-    elif location == 'cave':
-        content += cave_content(player)
-    elif location == 'dragon':
-        content += dragon_content(player)
-    
-    content += render_inventory(player)
-    content += '<div class="choices"><a href="/" class="choice-btn">⬅️ Return to Village</a></div>'
-    
+    stats_bar = render_stats_bar(player)
+    message = render_message(player)
+
+    body = ''
+    if location in content.LOCATIONS:
+        kind, details = take_action(player, 'explore', location)
+        body = LOCATION_VIEWS[kind](content.LOCATIONS[location], details)
+
     save_player(player)
-    return render_template_string(HTML_TEMPLATE, content=content)
-
-
-def village_content(player):
-    """Generate village content."""
-    if 'village' not in player['locations_visited']:
-        player['locations_visited'].append('village')
-        gold_bonus = random.randint(5, 15)
-        player['gold'] += gold_bonus
-        return f"""
-        <h2>🏘️ Village of Elderbrook</h2>
-        <div class="game-text">
-            <p>The villagers greet you warmly as you walk through the cobblestone streets.</p>
-            <p>An old sage approaches you with wisdom in his eyes...</p>
-            <p><em>"Brave adventurer," he says, "to defeat the dragon, you must first
-            find the Crystal Sword hidden in the Crystal Cave. Without it,
-            the dragon's scales cannot be pierced!"</em></p>
-            <p>A grateful villager gives you <strong>{gold_bonus} gold</strong> for your bravery!</p>
-        </div>
-        """
-    else:
-        return """
-        <h2>🏘️ Village of Elderbrook</h2>
-        <div class="game-text">
-            <p>The peaceful village continues its daily routines.</p>
-            <p>The old sage nods at you knowingly. "Remember - the Crystal Sword is your key to victory!"</p>
-        </div>
-        """
-
-
-def forest_content(player):
-    """Generate forest encounter content."""
-    encounter = random.choice(['goblin', 'fairy', 'wolf', 'treasure'])
-    
-    content = "<h2>🌲 Whispering Forest</h2>"
-    content += '<div class="game-text"><p>You venture deep into the mysterious forest. The trees seem to whisper ancient secrets...</p>'
-    
-    if encounter == 'goblin':
-        content += """
-            <p>⚔️ <strong>A wild Goblin leaps from the bushes!</strong></p>
-        </div>
-        <div class="choices">
-            <a href="/combat/goblin" class="choice-btn">⚔️ Fight the Goblin</a>
-            <a href="/flee" class="choice-btn">🏃 Attempt to Flee</a>
-        </div>
-        """
-    elif encounter == 'fairy':
-        heal = min(20, player['max_health'] - player['health'])
-        player['health'] += heal
-        content += f"""
-            <p>✨ <strong>A friendly forest fairy appears!</strong></p>
-            <p>She sprinkles healing dust on you, restoring <strong>{heal} health</strong>!</p>
-        </div>
-        """
-    elif encounter == 'wolf':
-        content += """
-            <p>🐺 <strong>A fierce Wolf blocks your path!</strong></p>
-        </div>
-        <div class="choices">
-            <a href="/combat/wolf" class="choice-btn">⚔️ Fight the Wolf</a>
-            <a href="/flee" class="choice-btn">🏃 Attempt to Flee</a>
-        </div>
-        """
-    else:
-        gold = random.randint(10, 25)
-        player['gold'] += gold
-        content += f"""
-            <p>💰 <strong>You discovered a hidden treasure chest!</strong></p>
-            <p>Inside you find <strong>{gold} gold coins</strong>!</p>
-        </div>
-        """
-    
-    return content
+    return render(
+        'location.html',
+        stats_bar=stats_bar,
+        message=message,
+        body=body,
+        inventory=render_inventory(player),
+    )
 
 
-def cave_content(player):
-    """Generate cave content."""
-    content = "<h2>💎 Crystal Cave</h2>"
-    content += '<div class="game-text"><p>The crystals illuminate your path as you explore the cave...</p>'
-    
-    if 'Crystal Sword' in player['inventory']:
-        content += """
-            <p>The cave feels peaceful now that you've claimed the Crystal Sword.</p>
-            <p>The crystals seem to hum with approval as you pass.</p>
-        </div>
-        """
-    else:
-        content += """
-            <p>🦇 <strong>A Giant Bat swoops down from the darkness!</strong></p>
-            <p>You must defeat it to reach the legendary Crystal Sword!</p>
-        </div>
-        <div class="choices">
-            <a href="/combat/bat" class="choice-btn">⚔️ Fight the Giant Bat</a>
-            <a href="/flee" class="choice-btn">🏃 Attempt to Flee</a>
-        </div>
-        """
-    
-    return content
+def village_content(location, gold_bonus):
+    """Render the village; gold_bonus is None on later visits."""
+    if gold_bonus is None:
+        return views.VILLAGE_REVISITED
+    return location_cache.get(('village', gold_bonus), render,
+                              'village_first_visit.html', gold_bonus=gold_bonus)
 
 
-def dragon_content(player):
-    """Generate dragon lair content."""
-    content = "<h2>🐉 Dragon's Lair</h2>"
-    
-    if player['dragon_defeated']:
-        content += """
-        <div class="game-text">
-            <p>The dragon has been defeated. Peace has returned to the lair.</p>
-            <p>Your legend will be told for generations to come!</p>
-        </div>
-        """
-    elif 'Crystal Sword' not in player['inventory']:
-        damage = 40
-        player['health'] = max(10, player['health'] - damage)
-        content += f"""
-        <div class="game-text">
-            <p>🐉 <strong>THE DRAGON OF SHADOWMERE AWAKENS!</strong></p>
-            <p>Its massive form fills the cavern, scales glittering like obsidian.</p>
-            <p>⚠️ <strong>You don't have the Crystal Sword!</strong></p>
-            <p>Your attacks bounce harmlessly off the dragon's scales. You barely escape with your life!</p>
-            <p class="message message-danger">You took {damage} damage fleeing!</p>
-        </div>
-        """
-    else:
-        content += """
-        <div class="game-text">
-            <p>🐉 <strong>THE DRAGON OF SHADOWMERE AWAKENS!</strong></p>
-            <p>Its massive form fills the cavern, scales glittering like obsidian.</p>
-            <p>Your Crystal Sword glows with ancient power! The dragon recognizes the legendary blade!</p>
-        </div>
-        <div class="choices">
-            <a href="/combat/dragon" class="choice-btn">⚔️ FIGHT THE DRAGON!</a>
-            <a href="/flee" class="choice-btn">🏃 Flee (Coward!)</a>
-        </div>
-        """
-    
-    return content
+def encounter_content(location, details):
+    """Render a random encounter from the location's encounter table."""
+    encounter, heal, gold = details
+    enemy = content.ENEMIES[encounter.enemy] if encounter and encounter.kind == 'fight' else None
+    return location_cache.get((location.key, encounter, heal, gold), render, 'encounter.html',
+                              location=location, encounter=encounter, enemy=enemy, heal=heal, gold=gold)
+
+
+def cave_content(location, has_sword):
+    """Render the cave."""
+    return views.CAVE_PEACEFUL if has_sword else views.CAVE_BAT
+
+
+def dragon_content(location, outcome):
+    """Render the dragon's lair; outcome is 'defeated', 'ready' or the damage taken."""
+    if outcome == 'defeated':
+        return views.DRAGON_DEFEATED
+    if outcome == 'ready':
+        return views.DRAGON_READY
+    return location_cache.get(('dragon', outcome), render,
+                              'dragon.html', outcome='no_sword', damage=outcome)
+
+
+# Page bodies by the kind of outcome fantasy_actions.explore() returns
+LOCATION_VIEWS = {
+    'village': village_content,
+    'encounter': encounter_content,
+    'cave': cave_content,
+    'dragon': dragon_content,
+}
 
 
 @app.route('/combat/<enemy>')
@@ -469,48 +383,20 @@ def combat(enemy):
     """Handle combat encounters."""
     player = get_player()
     
-    enemies = {
-        'goblin': {'name': 'Goblin', 'health': 30, 'attack': 8, 'gold': 10},
-        'wolf': {'name': 'Wolf', 'health': 25, 'attack': 10, 'gold': 8},
-        'bat': {'name': 'Giant Bat', 'health': 35, 'attack': 12, 'gold': 15},
-        'dragon': {'name': 'Dragon of Shadowmere', 'health': 100, 'attack': 20, 'gold': 100}
-    }
-    
-    if enemy not in enemies:
+    if enemy not in content.ENEMIES:
         return redirect(url_for('index'))
     
-    enemy_data = enemies[enemy]
-    
-    # Initialize or get combat state
-    if player.get('current_combat') is None or player['current_combat'].get('type') != enemy:
-        player['current_combat'] = {
-            'type': enemy,
-            'enemy_health': enemy_data['health'],
-            'enemy_name': enemy_data['name']
-        }
-    
-    combat_state = player['current_combat']
-    
-    content = render_stats_bar(player)
-    content += f"""
-    <h2>⚔️ Battle: {combat_state['enemy_name']}</h2>
-    <div class="game-text">
-        <p><strong>{combat_state['enemy_name']} Health:</strong> {combat_state['enemy_health']}</p>
-    </div>
-    <div class="choices">
-        <a href="/attack/{enemy}" class="choice-btn">⚔️ Attack!</a>
-    """
-    
-    if 'Health Potion' in player['inventory']:
-        content += '<a href="/use_potion_combat" class="choice-btn">🧪 Use Health Potion</a>'
-    
-    content += """
-        <a href="/flee" class="choice-btn">🏃 Attempt to Flee</a>
-    </div>
-    """
-    
+    combat_state = take_action(player, 'combat', enemy)
+
     save_player(player)
-    return render_template_string(HTML_TEMPLATE, content=content)
+    return render(
+        'combat.html',
+        stats_bar=render_stats_bar(player),
+        combat=combat_state,
+        enemy=enemy,
+        has_potion='Health Potion' in player['inventory'],
+        version=state_version(player),
+    )
 
 
 @app.route('/attack/<enemy>')
@@ -518,101 +404,98 @@ def attack(enemy):
     """Process an attack."""
     player = get_player()
     
-    enemies = {
-        'goblin': {'attack': 8, 'gold': 10},
-        'wolf': {'attack': 10, 'gold': 8},
-        'bat': {'attack': 12, 'gold': 15},
-        'dragon': {'attack': 20, 'gold': 100}
-    }
-    
-    if enemy not in enemies or player.get('current_combat') is None:
-        return redirect(url_for('index'))
-    
-    combat_state = player['current_combat']
-    enemy_data = enemies[enemy]
-    
-    # Player attacks
-    damage = random.randint(player['attack'] - 3, player['attack'] + 5)
-    combat_state['enemy_health'] -= damage
-    
-    message = f"You strike for {damage} damage! "
-    
-    # Check if enemy defeated
-    if combat_state['enemy_health'] <= 0:
-        player['gold'] += enemy_data['gold']
-        player['current_combat'] = None
-        
-        # Special rewards
-        if enemy == 'bat' and 'Crystal Sword' not in player['inventory']:
-            player['inventory'].append('Crystal Sword')
-            player['attack'] += 15
-            player['message'] = f"Victory! You earned {enemy_data['gold']} gold and found the CRYSTAL SWORD! (+15 Attack)"
-        elif enemy == 'dragon':
-            player['dragon_defeated'] = True
-            player['message'] = "🎉 VICTORY! You have defeated the Dragon of Shadowmere! You are the hero of the realm!"
-        else:
-            player['message'] = f"Victory! You earned {enemy_data['gold']} gold!"
-        
-        player['message_type'] = 'success'
-        save_player(player)
+    if enemy not in content.ENEMIES or player.get('current_combat') is None:
         return redirect(url_for('index'))
-    
-    # Enemy attacks back
-    enemy_damage = random.randint(enemy_data['attack'] - 2, enemy_data['attack'] + 3)
-    actual_damage = max(1, enemy_damage - player['defense'])
-    player['health'] -= actual_damage
-    
-    message += f"The {combat_state['enemy_name']} hits you for {actual_damage} damage!"
-    
-    # Check if player defeated
-    if player['health'] <= 0:
-        player['message'] = "💀 You have been defeated! Game Over!"
-        player['message_type'] = 'danger'
-        player['game_started'] = False
-        player['current_combat'] = None
+
+    # Each outcome renders the page the player would otherwise be redirected to
+    if fresh_request(player):
+        outcome = take_action(player, 'attack', enemy)
         save_player(player)
-        return redirect(url_for('reset'))
-    
-    player['message'] = message
-    player['message_type'] = 'info'
-    save_player(player)
-    return redirect(url_for('combat', enemy=enemy))
+        if outcome == 'victory':
+            return index()
+        if outcome == 'defeat':
+            end_game()
+            return TITLE_PAGE
+    return combat(enemy)
 
 
 @app.route('/flee')
 def flee():
     """Attempt to flee from combat."""
     player = get_player()
-    
-    if random.random() > 0.3:
-        player['current_combat'] = None
-        player['message'] = "You successfully fled from battle!"
-        player['message_type'] = 'info'
-    else:
-        player['message'] = "You failed to escape!"
-        player['message_type'] = 'danger'
-    
-    save_player(player)
-    return redirect(url_for('index'))
+    if fresh_request(player):
+        take_action(player, 'flee')
+        save_player(player)
+    return index()
 
 
 @app.route('/use_potion_combat')
 def use_potion_combat():
     """Use health potion during combat."""
     player = get_player()
-    
-    if 'Health Potion' in player['inventory']:
-        player['inventory'].remove('Health Potion')
-        heal = 30
-        player['health'] = min(player['health'] + heal, player['max_health'])
-        player['message'] = f"You drink a Health Potion and recover {heal} health!"
-        player['message_type'] = 'success'
-    
-    save_player(player)
+    if fresh_request(player):
+        take_action(player, 'potion')
+        save_player(player)
     
     if player.get('current_combat'):
-        return redirect(url_for('combat', enemy=player['current_combat']['type']))
-    return redirect(url_for('index'))
+        return combat(player['current_combat']['type'])
+    return index()
+
+
+# Icons of the rounds in an auto-battle's log
+ROUND_ICONS = {'attack': '⚔️', 'potion': '🧪', 'flee': '🏃'}
+
+
+def policy_threshold(name, default):
+    """Read a health threshold of the auto-battle form."""
+    try:
+        value = int(request.values.get(name, default))
+    except ValueError:
+        return default
+    return min(max(value, 0), 0xFFFF)  # the action log stores them as u16
+
+
+@app.route('/auto_battle', methods=['POST'])
+def auto_battle():
+    """Fight the current enemy to the end by the player's policy, and show the log."""
+    player = get_player()
+    fight = player.get('current_combat')
+    if fight is None:
+        return redirect(url_for('index'))
+    if not fresh_request(player):
+        return combat(fight['type'])
+
+    policy = Policy(potion_at=policy_threshold('potion_at', 30), flee_at=policy_threshold('flee_at', 0))
+    outcome, rounds = take_action(player, 'auto', policy)
+    save_player(player)
+
+    # Consecutive identical rounds, e.g. failed flee attempts, share a line
+    log = []
+    for action, message in rounds:
+        line = f'{ROUND_ICONS[action]} {message}'
+        if log and log[-1][0] == line:
+            log[-1][1] += 1
+        else:
+            log.append([line, 1])
+    counts = Counter(action for action, _ in rounds)
+    summary = (f"{len(rounds)} rounds: {counts['attack']} attacks, {counts['potion']} potions, "
+               f"{counts['flee']} flee attempts.")
+
+    page = render(
+        'auto_battle.html',
+        stats_bar=render_stats_bar(player),
+        message=render_message(player),
+        enemy=fight['type'],
+        enemy_name=fight['enemy_name'],
+        summary=summary,
+        log=log,
+        fighting=outcome == 'timeout',
+        defeated=outcome == 'defeat',
+        inventory=render_inventory(player),
+    )
+    if outcome == 'defeat':
+        end_game()
+    return uncacheable_page(page)
 
 
 @app.route('/shop')
@@ -623,24 +506,23 @@ def shop():
     if not player['game_started']:
         return redirect(url_for('index'))
     
-    content = render_stats_bar(player)
-    content += render_message(player)
-    content += """
-    <h2>🛒 Village Shop</h2>
-    <div class="game-text">
-        <p>"Welcome, adventurer! What would you like to purchase?"</p>
-    </div>
-    <div class="choices">
-        <a href="/buy/potion" class="choice-btn">🧪 Health Potion - 15 gold (Restores 30 health)</a>
-        <a href="/buy/sword" class="choice-btn">⚔️ Iron Sword - 25 gold (+5 Attack)</a>
-        <a href="/buy/shield" class="choice-btn">🛡️ Leather Shield - 20 gold (+3 Defense)</a>
-        <a href="/buy/amulet" class="choice-btn">📿 Magic Amulet - 40 gold (+20 Max Health)</a>
-        <a href="/" class="choice-btn">⬅️ Leave Shop</a>
-    </div>
-    """
-    content += render_inventory(player)
-    
-    return render_template_string(HTML_TEMPLATE, content=content)
+    def render_shop():
+        return render(
+            'shop.html',
+            stats_bar=render_stats_bar(player),
+            message=render_message(player),
+            inventory=render_inventory(player),
+            version=state_version(player),
+        )
+
+    # A pending message is shown once and then cleared, so that response
+    # must not be cached; the next refresh gets a cacheable page.
+    if player.get('message'):
+        return uncacheable_page(render_shop())
+
+    state = (player['name'], player['health'], player['max_health'], player['attack'],
+             player['defense'], player['gold'], player['inventory'].key(), state_version(player))
+    return conditional_page('shop.html', state, render_shop)
 
 
 @app.route('/buy/<item>')
@@ -648,38 +530,14 @@ def buy_item(item):
     """Process item purchase."""
     player = get_player()
     
-    items = {
-        'potion': {'name': 'Health Potion', 'price': 15},
-        'sword': {'name': 'Iron Sword', 'price': 25, 'attack': 5},
-        'shield': {'name': 'Leather Shield', 'price': 20, 'defense': 3},
-        'amulet': {'name': 'Magic Amulet', 'price': 40, 'max_health': 20}
-    }
-    
-    if item not in items:
+    item_data = content.ITEMS.get(item)
+    if item_data is None or item_data.price is None:
         return redirect(url_for('shop'))
-    
-    item_data = items[item]
-    
-    if player['gold'] >= item_data['price']:
-        player['gold'] -= item_data['price']
-        player['inventory'].append(item_data['name'])
-        
-        if 'attack' in item_data:
-            player['attack'] += item_data['attack']
-        if 'defense' in item_data:
-            player['defense'] += item_data['defense']
-        if 'max_health' in item_data:
-            player['max_health'] += item_data['max_health']
-            player['health'] += item_data['max_health']
-        
-        player['message'] = f"Purchased {item_data['name']}!"
-        player['message_type'] = 'success'
-    else:
-        player['message'] = "Not enough gold!"
-        player['message_type'] = 'danger'
-    
-    save_player(player)
-    return redirect(url_for('shop'))
+
+    if fresh_request(player):
+        take_action(player, 'buy', item)
+        save_player(player)
+    return shop()
 
 
 @app.route('/status')
@@ -690,33 +548,388 @@ def status():
     if not player['game_started']:
         return redirect(url_for('index'))
     
-    quest_status = "🏆 COMPLETED - Dragon Defeated!" if player['dragon_defeated'] else "📜 Incomplete - Defeat the Dragon"
-    
-    content = render_stats_bar(player)
-    content += f"""
-    <h2>📊 Adventurer Status</h2>
-    <div class="game-text">
-        <p><strong>Name:</strong> {player['name']}</p>
-        <p><strong>Health:</strong> {player['health']}/{player['max_health']}</p>
-        <p><strong>Attack Power:</strong> {player['attack']}</p>
-        <p><strong>Defense:</strong> {player['defense']}</p>
-        <p><strong>Gold:</strong> {player['gold']}</p>
-        <p><strong>Quest Status:</strong> {quest_status}</p>
-        <p><strong>Locations Visited:</strong> {', '.join(player['locations_visited']) if player['locations_visited'] else 'None yet'}</p>
-    </div>
-    """
-    content += render_inventory(player)
-    content += '<div class="choices"><a href="/" class="choice-btn">⬅️ Return to Village</a></div>'
-    
-    return render_template_string(HTML_TEMPLATE, content=content)
+    def render_status():
+        quest_status = "🏆 COMPLETED - Dragon Defeated!" if player['dragon_defeated'] else "📜 Incomplete - Defeat the Dragon"
+        locations_visited = ', '.join(player['locations_visited']) if player['locations_visited'] else 'None yet'
+
+        return render(
+            'status.html',
+            stats_bar=render_stats_bar(player),
+            player=player,
+            quest_status=quest_status,
+            locations_visited=locations_visited,
+            inventory=render_inventory(player),
+            action_log=record_actions,
+        )
+
+    state = (player['name'], player['health'], player['max_health'], player['attack'],
+             player['defense'], player['gold'], player['inventory'].key(),
+             player['dragon_defeated'], tuple(player['locations_visited']), record_actions)
+    return conditional_page('status.html', state, render_status)
+
+
+@app.route('/static/<filename>')
+def static_asset(filename):
+    """Serve a content-hashed static asset."""
+    asset = assets.ASSETS.get(filename)
+    if asset is None:
+        abort(404)
+    return assets.asset_response(app.response_class, asset, request)
+
+
+@app.after_request
+def compress_response(response):
+    """Compress dynamic pages for clients that accept it."""
+    return assets.compress_response(response, request)
+
+
+def end_game():
+    """Throw the game away, keeping only the action log."""
+    if 'sid' in session:
+        take_action(get_player(), 'reset')
+        store.delete(session['sid'])
+    g.pop('player', None)
+    # The action log outlives the game, so a death can still be reported
+    log = session.get('log')
+    session.clear()
+    if log:
+        session['log'] = log
 
 
 @app.route('/reset')
 def reset():
     """Reset the game."""
-    session.clear()
+    end_game()
     return redirect(url_for('index'))
 
+
+@app.route('/log')
+def action_log():
+    """
+    Download this browser's action log, to attach to a bug report.
+
+    The log holds the game's seed, so a game in progress goes on with a
+    new one: whatever the log tells about the rolls is already spent.
+    """
+    data = store.load('log:' + session['log']) if 'log' in session else None
+    if data is None:
+        abort(404)
+    player = get_player()
+    if player['game_started']:
+        take_action(player, 'reseed', secrets.randbits(64))
+        save_player(player)
+    response = make_response(data)
+    response.headers['Content-Type'] = 'application/octet-stream'
+    response.headers['Content-Disposition'] = 'attachment; filename=shadowmere.log'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# JSON API. Each response carries the state version (see state_version()).
+# A client that passes the version it last saw as ?since= gets only the
+# fields that changed since, with "base" set to that version; otherwise
+# it gets the full state and no "base". The routes follow the rules of
+# the HTML routes above.
+
+def api_state(player):
+    """Return the player's state as the API shows it."""
+    fight = player['current_combat']
+    return {
+        'name': player['name'],
+        'health': player['health'],
+        'max_health': player['max_health'],
+        'attack': player['attack'],
+        'defense': player['defense'],
+        'gold': player['gold'],
+        'inventory': {content.ITEMS_BY_ID[item_id].key: count
+                      for item_id, count in player['inventory'].stacks()},
+        'visited': list(player['locations_visited']),
+        'game_started': player['game_started'],
+        'dragon_defeated': player['dragon_defeated'],
+        'combat': fight and {'enemy': fight['type'], 'health': fight['enemy_health']},
+    }
+
+
+def api_base():
+    """Return (version the client acknowledged, state at that version or None) before an action."""
+    player = get_player()
+    since = request.args.get('since')
+    return since, api_state(player) if since == state_version(player) else None
+
+
+def pop_message(player):
+    """Take the pending message, which is shown once, as in render_message()."""
+    message = player['message'] and (player['message'], player['message_type'])
+    player['message'] = player['message_type'] = None
+    return message
+
+
+def api_response(player, since, base, result=None, message=None):
+    """
+    Answer with the state, or what changed in it since the `base` state.
+
+    Args:
+        player: Player dict after the request
+        since: Version the client acknowledged
+        base: State at that version, or None to send the full state
+        result: What the action returned, if anything
+        message: (text, type) to show, if any
+    """
+    state = api_state(player)
+    body = {'version': state_version(player)}
+    if base is not None:
+        body['base'] = since
+        state = {field: value for field, value in state.items() if base[field] != value}
+    body['state'] = state
+    if result is not None:
+        body['result'] = result
+    if message:
+        body['message'], body['message_type'] = message
+    save_player(player)
+    response = jsonify(body)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def api_error(status, error):
+    """Answer with an error and nothing changed."""
+    response = jsonify(error=error)
+    response.status_code = status
+    return response
+
+
+def api_action(action, arg=None):
+    """Take an action and answer with the state delta and its message."""
+    since, base = api_base()
+    player = get_player()
+    result = take_action(player, action, arg)
+    return api_response(player, since, base, result, pop_message(player))
+
+
+def explore_result(kind, details):
+    """Describe what fantasy_actions.explore() returned as JSON."""
+    if kind == 'village':
+        return {'kind': kind, 'gold': details}
+    if kind == 'cave':
+        return {'kind': kind, 'enemy': None if details else 'bat'}
+    if kind == 'dragon':
+        if isinstance(details, int):
+            return {'kind': kind, 'outcome': 'no_sword', 'damage': details}
+        return {'kind': kind, 'outcome': details}
+    encounter, heal, gold = details
+    return {'kind': kind, 'encounter': encounter and encounter.kind,
+            'enemy': encounter and encounter.enemy, 'heal': heal, 'gold': gold}
+
+
+@app.route('/api/v1/start', methods=['POST'])
+def api_start():
+    """Start a new game; the name comes from a JSON body or a form."""
+    data = request.get_json(silent=True) or request.form
+    name = player_name(data.get('name', ''))
+    return api_action('start', (name, secrets.randbits(64)))
+
+
+@app.route('/api/v1/explore/<location>', methods=['POST'])
+def api_explore(location):
+    """Explore a location."""
+    if location not in content.LOCATIONS:
+        return api_error(404, 'unknown location')
+    if not get_player()['game_started']:
+        return api_error(409, 'game not started')
+    since, base = api_base()
+    player = get_player()
+    kind, details = take_action(player, 'explore', location)
+    return api_response(player, since, base, explore_result(kind, details), pop_message(player))
+
+
+@app.route('/api/v1/combat/<enemy>', methods=['POST'])
+def api_combat(enemy):
+    """Face an enemy, as following a link to /combat/<enemy> does."""
+    if enemy not in content.ENEMIES:
+        return api_error(404, 'unknown enemy')
+    since, base = api_base()
+    player = get_player()
+    take_action(player, 'combat', enemy)
+    return api_response(player, since, base)
+
+
+@app.route('/api/v1/attack/<enemy>', methods=['POST'])
+def api_attack(enemy):
+    """Attack in the current fight; a defeat ends the game, as /attack does."""
+    if enemy not in content.ENEMIES:
+        return api_error(404, 'unknown enemy')
+    if get_player().get('current_combat') is None:
+        return api_error(409, 'not in combat')
+    since, base = api_base()
+    player = get_player()
+    outcome = take_action(player, 'attack', enemy)
+    message = pop_message(player)
+    if outcome == 'defeat':
+        end_game()
+        player = get_player()  # a new player, stored only once it acts, as after /attack
+    return api_response(player, since, base, outcome, message)
+
+
+@app.route('/api/v1/flee', methods=['POST'])
+def api_flee():
+    """Try to flee the current fight."""
+    return api_action('flee')
+
+
+@app.route('/api/v1/potion', methods=['POST'])
+def api_potion():
+    """Drink a Health Potion."""
+    return api_action('potion')
+
+
+@app.route('/api/v1/buy/<item>', methods=['POST'])
+def api_buy(item):
+    """Buy an item from the shop."""
+    item_data = content.ITEMS.get(item)
+    if item_data is None or item_data.price is None:
+        return api_error(404, 'not for sale')
+    return api_action('buy', item)
+
+
+@app.route('/api/v1/status')
+def api_status():
+    """Return the state, or what changed in it since ?since=."""
+    since, base = api_base()
+    player = get_player()
+    return api_response(player, since, base, message=pop_message(player))
+
+
+@app.route('/metrics')
+def export_metrics():
+    """Metrics of every worker process, in the Prometheus text format."""
+    response = make_response(registry.exposition())
+    response.headers['Content-Type'] = metrics.CONTENT_TYPE
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# ============================================================================
+# METRICS (see fantasy_metrics; declared last, once every route exists)
+# ============================================================================
+
+UNMATCHED = '(unmatched)'
+ROUTE_RULES = [rule.rule for rule in app.url_map.iter_rules()] + [UNMATCHED]
+CACHES = [cache.name for cache in FragmentCache.registry] + ['page_etag']
+
+registry = metrics.Registry()
+request_seconds = registry.histogram(
+    'shadowmere_request_duration_seconds', 'Time to answer a request, per route.',
+    metrics.LATENCY_BUCKETS, 'route', ROUTE_RULES)
+render_seconds = registry.histogram(
+    'shadowmere_render_duration_seconds', 'Time spent rendering templates, per route, by requests that rendered one.',
+    metrics.LATENCY_BUCKETS, 'route', ROUTE_RULES)
+logic_seconds = registry.histogram(
+    'shadowmere_game_logic_duration_seconds', 'Time spent in game logic, per action.',
+    metrics.LATENCY_BUCKETS, 'action', list(actions.ACTIONS))
+session_read_bytes = registry.histogram(
+    'shadowmere_session_read_bytes', 'Size of player states read from the session store.', metrics.BYTES_BUCKETS)
+session_written_bytes = registry.histogram(
+    'shadowmere_session_written_bytes', 'Size of player states written to the session store.', metrics.BYTES_BUCKETS)
+cache_hits = registry.counter(
+    'shadowmere_cache_hits_total', 'Fragments served from cache, and pages revalidated with a 304.',
+    'cache', CACHES)
+cache_misses = registry.counter(
+    'shadowmere_cache_misses_total', 'Fragments rendered, and conditional pages sent in full.',
+    'cache', CACHES)
+fights_started = registry.counter(
+    'shadowmere_fights_started_total', 'Fights started, per enemy.', 'enemy', list(content.ENEMIES))
+deaths = registry.counter(
+    'shadowmere_deaths_total', 'Players killed, per enemy.', 'enemy', list(content.ENEMIES))
+potions_used = registry.counter('shadowmere_potions_used_total', 'Health potions drunk.')
+gold_minted = registry.counter('shadowmere_gold_minted_total', 'Gold found or won by players.')
+registry.start(os.environ.get('SHADOWMERE_METRICS_DIR') or None)
+
+# The histograms of each route, by path for static routes and by the path
+# up to the last slash for routes with a variable in their last part.
+# Requests are matched to routes by hand, as fantasy_loadgen and
+# fantasy_trace label paths, because Flask's own match is gone from the
+# environ by the time the request is timed. A path is never taken for a
+# route it could not be for, though one Flask would still 404 (an empty
+# variable, say) gets the route it nearly matched.
+ROUTE_SERIES = {route: (request_seconds[route], render_seconds[route]) for route in ROUTE_RULES}
+STATIC_SERIES = {rule.rule: ROUTE_SERIES[rule.rule] for rule in app.url_map.iter_rules() if not rule.arguments}
+PREFIX_SERIES = {rule.rule[:rule.rule.index('<')]: ROUTE_SERIES[rule.rule]
+                 for rule in app.url_map.iter_rules() if rule.arguments}
+
+
+# Left by requests and actions for the next sync to count: (path, seconds,
+# render seconds) per request, and the arguments of count_game_event() per
+# action
+finished_requests = []
+game_events = []
+
+
+def count_pending():
+    """Count the requests and game actions finished since the last sync into the metrics."""
+    batch = finished_requests[:]
+    del finished_requests[:len(batch)]  # those appended by another thread meanwhile wait for the next sync
+    static, prefix, unmatched = STATIC_SERIES.get, PREFIX_SERIES.get, ROUTE_SERIES[UNMATCHED]
+    for path, seconds, rendering in batch:
+        total, render_series = static(path) or prefix(path[:path.rfind('/') + 1], unmatched)
+        total.observe(seconds)
+        if rendering:
+            render_series.observe(rendering)
+    batch = game_events[:]
+    del game_events[:len(batch)]
+    for event in batch:
+        count_game_event(*event)
+
+
+def sync_cache_counters():
+    """Copy the counts the fragment caches and conditional_page() keep for themselves into the metrics."""
+    for cache in FragmentCache.registry:
+        cache_hits[cache.name].set(cache.hits)
+        cache_misses[cache.name].set(cache.misses)
+    cache_hits['page_etag'].set(page_etag_counts['hits'])
+    cache_misses['page_etag'].set(page_etag_counts['misses'])
+
+
+registry.add_sync(count_pending)
+registry.add_sync(sync_cache_counters)
+
+
+def timed(wsgi_app):
+    """
+    Wrap the WSGI app to time every request.
+
+    This is the hottest code in the app, so it is kept to one wrapper
+    rather than before/teardown_request handlers, which cost more in
+    Flask's dispatch and the `request` proxy, and a request only leaves its
+    times in finished_requests: count_pending() finds the route and
+    observes them at the next sync, at most once every
+    metrics.SYNC_SECONDS. Render times are only observed when nonzero, so
+    their counts tell how many requests rendered a template.
+    """
+    def timed_app(environ, start_response):
+        start = perf_counter()
+        try:
+            return wsgi_app(environ, start_response)
+        finally:
+            end = perf_counter()
+            finished_requests.append((environ['PATH_INFO'], end - start, timings.render))
+            timings.render = 0.0
+            if end >= registry.next_sync:
+                registry.sync()
+    return timed_app
+
+
+app.wsgi_app = timed(app.wsgi_app)
+
+
+# Opt-in request trace, for replaying real traffic (see fantasy_trace)
+if os.environ.get('SHADOWMERE_TRACE'):
+    trace.install(app, os.environ['SHADOWMERE_TRACE'])
+
+# Opt-in profiling of sampled requests, switched on at /admin/profile (see fantasy_profile)
+if os.environ.get('SHADOWMERE_ADMIN_TOKEN'):
+    profile.install(app, os.environ.get('SHADOWMERE_PROFILE_DIR', 'profiles'), os.environ['SHADOWMERE_ADMIN_TOKEN'])
+
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🐉 Fantasy Adventure Game - Web Server")
@@ -0,0 +1,152 @@
+"""
+Static assets and response compression for the web version.
+
+Assets are read once at startup, named after a hash of their content
+(so a changed file gets a new URL) and precompressed with every encoding
+we support. That lets them be served with a year-long immutable cache
+lifetime and strong ETags.
+
+Brotli is optional: without the `brotli` package only gzip is offered.
+"""
+
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STATIC_URL = '/static/'
+
+# One year; the URL changes whenever the content does.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Dynamic pages are compressed quickly rather than as small as possible.
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 4
+MIN_COMPRESS_SIZE = 512
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'application/json')
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, static=False):
+    """
+    Compress bytes with the given content-coding.
+
+    Args:
+        data: Raw bytes
+        encoding: 'gzip' or 'br'
+        static: Use the slowest, smallest settings (done once at startup)
+
+    Returns:
+        The compressed bytes
+    """
+    if encoding == 'br':
+        quality = 11 if static else DYNAMIC_BROTLI_QUALITY
+        return brotli.compress(data, quality=quality)
+    level = 9 if static else DYNAMIC_GZIP_LEVEL
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def choose_encoding(accept_encodings):
+    """
+    Pick the best content-coding the client accepts.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header
+
+    Returns:
+        'br', 'gzip', or None for an uncompressed response
+    """
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class StaticAsset:
+    """A file served under a content-hashed URL with precompressed variants."""
+
+    def __init__(self, name, data, content_type):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        stem, ext = os.path.splitext(name)
+        self.filename = f'{stem}.{self.digest}{ext}'
+        self.url = STATIC_URL + self.filename
+        self.variants = {None: data}
+        for encoding in ENCODINGS:
+            self.variants[encoding] = compress(data, encoding, static=True)
+
+    @classmethod
+    def from_file(cls, name, content_type):
+        """Load an asset from the static directory."""
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            return cls(name, f.read(), content_type)
+
+    def etag(self, encoding):
+        """Strong ETag for one encoded variant."""
+        return self.digest if encoding is None else f'{self.digest}-{encoding}'
+
+
+STYLESHEET = StaticAsset.from_file('shadowmere.css', 'text/css; charset=utf-8')
+
+ASSETS = {asset.filename: asset for asset in (STYLESHEET,)}
+
+
+def asset_response(response_class, asset, request):
+    """
+    Build the response for a static asset request.
+
+    Args:
+        response_class: The app's response class
+        asset: The StaticAsset being served
+        request: The current request
+
+    Returns:
+        A 200 response with the best variant, or 304 if the client's copy
+        is current
+    """
+    encoding = choose_encoding(request.accept_encodings)
+    etag = asset.etag(encoding)
+
+    if request.if_none_match.contains(etag):
+        response = response_class(status=304)
+    else:
+        response = response_class(asset.variants[encoding], content_type=asset.content_type)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_response(response, request):
+    """
+    Compress a dynamic response in place when the client accepts it.
+
+    Streaming, already-encoded, small and non-text responses are left
+    untouched.
+    """
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,440 @@
+"""
+Autoplay bot: plans whole playthroughs of the CLI game.
+
+The bot plays the real game engine (fantasy_adventure_game.GameState),
+typing its inputs like a player would. At every main-menu prompt it
+plans with Monte Carlo tree search over a model of the game:
+
+    state    health, max health, attack, defense, gold, potions,
+             Crystal Sword, dragon defeated
+    actions  explore a location (with a combat stance: when to drink a
+             potion and when to flee if a fight breaks out), buy a shop
+             item, or drink a potion
+
+Fights in the model are played by fantasy_combat.fight(), and encounters
+come from fantasy_content, so the model follows content changes. The
+search is UCT with a transposition table keyed by state: the same state
+reached by different routes shares its statistics, and the table lives
+on across the decisions of an episode (it is cleared past --max-nodes,
+to bound memory). A state backs up its best action's mean, not the
+average of everything tried from it, which makes the search an
+expectimax estimate rather than plain UCT. Each input costs a little and
+beating the dragon is worth 1, so the bot maximises completion first and
+speed second.
+
+Episodes are spread over a process pool. Each gets a fresh planner whose
+rolls are seeded from the episode's seed, so a run's results do not
+depend on the number of workers or on which episodes land on which
+worker. The report gives the completion rate, the expected number of
+inputs to beat the dragon, the most common winning routes and, for
+comparison, a simple scripted player. --min-completion makes the exit
+status fail below a rate, for balance regression checks.
+
+Usage:
+    python fantasy_bot.py --episodes 200 --iterations 500
+    python fantasy_bot.py --min-completion 0.95
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import fantasy_combat as rules
+import fantasy_content as content
+from fantasy_adventure_game import LOCATION_ENCOUNTERS, GameState, locations, shop_items
+from fantasy_combat import Build, Policy
+
+State = namedtuple('State', 'health max_health attack defense gold potions crystal dragon')
+
+# Combat stances the bot can pick when it sets out
+STANCES = {
+    'fight': Policy(),
+    'heal': Policy(potion_at=30),
+    'careful': Policy(potion_at=30, flee_at=12),
+    'flee': Policy(flee_at=40),
+}
+
+POTION = content.ITEMS['potion']
+CRYSTAL_SWORD = content.ITEMS['crystal_sword']
+CLI_RULES = rules.RULES['cli']
+
+HORIZON = 200          # inputs before a playthrough counts as failed
+INPUT_COST = 0.5 / HORIZON
+SUCCESS = 1.0
+
+MENU_PROMPT = 'Enter your choice (1-5): '
+COMBAT_PROMPT = 'Choose your action: '
+CONTINUE_PROMPT = '\nWould you like to continue exploring? (yes/no): '
+
+
+# ============================================================================
+# GAME MODEL
+# ============================================================================
+
+def _has_fight(location, state):
+    if location.key == 'cave':
+        return not state.crystal
+    if location.key == 'dragon':
+        return state.crystal and not state.dragon
+    return location.key not in LOCATION_ENCOUNTERS and any(e.kind == 'fight' for e in location.encounters)
+
+
+def _is_idle(location, state):
+    # Exploring here would change nothing
+    if location.key == 'cave':
+        return state.crystal
+    if location.key == 'dragon':
+        return state.dragon
+    return location.key not in LOCATION_ENCOUNTERS and not location.encounter_table
+
+
+def _stances(potions):
+    # Stances that play differently with this many potions
+    seen = {}
+    for name, policy in STANCES.items():
+        seen.setdefault((policy.potion_at if potions else 0, policy.flee_at), name)
+    return list(seen.values())
+
+
+def actions(state):
+    """Return the actions open to the player at the main menu."""
+    result = []
+    for location in locations:
+        if _has_fight(location, state):
+            result.extend(('explore', location.key, stance) for stance in _stances(state.potions))
+        elif not _is_idle(location, state):
+            result.append(('explore', location.key, 'fight'))
+    for item in shop_items:
+        if state.gold >= item.price and (item.heal == 0 or item.key == 'potion'):
+            result.append(('buy', item.key, None))
+    if state.potions and state.health < state.max_health:
+        result.append(('drink', POTION.key, None))
+    return result
+
+
+def _fight(state, enemy, stance, rng):
+    build = Build('bot', state.attack, state.defense, state.max_health, state.health, state.potions)
+    result = rules.fight(build, enemy, STANCES[stance], CLI_RULES, rng)
+    state = state._replace(health=result.health, potions=state.potions - result.potions_used)
+    if result.outcome == rules.WIN:
+        state = state._replace(gold=state.gold + enemy.gold)
+    return state, result.turns, result.outcome
+
+
+def step(state, action, rng):
+    """
+    Apply one action to the model, as the CLI game would.
+
+    Returns:
+        (next state, inputs used, 'won', 'died' or None)
+    """
+    kind, key, stance = action
+    if kind == 'buy':
+        item = content.ITEMS[key]
+        return state._replace(
+            gold=state.gold - item.price,
+            attack=state.attack + item.attack,
+            defense=state.defense + item.defense,
+            max_health=state.max_health + item.max_health,
+            health=state.health + item.max_health,
+            potions=state.potions + (key == 'potion'),
+        ), 2, None
+    if kind == 'drink':
+        return state._replace(health=min(state.health + POTION.heal, state.max_health),
+                              potions=state.potions - 1), 2, None
+
+    location = content.LOCATIONS[key]
+    if key == 'village':
+        if rng.random() < 0.5:
+            state = state._replace(gold=state.gold + rng.randint(5, 15))
+        return state, 2, None
+    if key == 'cave':
+        if state.crystal:
+            return state, 2, None
+        state, turns, outcome = _fight(state, content.ENEMIES['bat'], stance, rng)
+        if outcome == rules.WIN:
+            state = state._replace(crystal=True, attack=state.attack + CRYSTAL_SWORD.attack)
+        return state, 2 + turns, 'died' if outcome == rules.DEATH else None
+    if key == 'dragon':
+        if state.dragon:
+            return state, 2, None
+        if not state.crystal:
+            return state._replace(health=max(10, state.health - 40)), 2, None
+        state, turns, outcome = _fight(state, content.ENEMIES['dragon'], stance, rng)
+        if outcome == rules.WIN:
+            return state._replace(dragon=True), 2 + turns + 1, 'won'  # +1: "continue exploring?"
+        return state, 2 + turns, 'died' if outcome == rules.DEATH else None
+
+    # Any other location draws from its encounter table
+    if not location.encounter_table:
+        return state, 2, None
+    encounter = rng.choice(location.encounter_table)
+    if encounter.kind == 'fight':
+        state, turns, outcome = _fight(state, content.ENEMIES[encounter.enemy], stance, rng)
+        return state, 2 + turns, 'died' if outcome == rules.DEATH else None
+    if encounter.kind == 'heal':
+        return state._replace(health=min(state.health + encounter.amount, state.max_health)), 2, None
+    return state._replace(gold=state.gold + rng.randint(encounter.min_gold, encounter.max_gold)), 2, None
+
+
+def scripted_action(state):
+    """A simple hand-written player, used for rollouts and as a baseline."""
+    if state.potions and state.health <= 40:
+        return ('drink', POTION.key, None)
+    if not state.crystal:
+        if state.health <= 60 and not state.potions and state.gold >= POTION.price:
+            return ('buy', POTION.key, None)
+        return ('explore', 'cave', 'heal')
+    return ('explore', 'dragon', 'heal')
+
+
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+class Planner:
+    """UCT search over the game model with a transposition table."""
+
+    def __init__(self, rng, iterations=500, exploration=0.3, max_nodes=200_000):
+        self.rng = rng
+        self.iterations = iterations
+        self.exploration = exploration
+        self.max_nodes = max_nodes
+        self.table = {}  # state -> {action: [visits, total value]}
+        self.hits = 0
+        self.lookups = 0
+
+    def choose(self, state, budget=HORIZON):
+        """Return the best action from `state`, searching first."""
+        if len(self.table) > self.max_nodes:
+            self.table.clear()
+        for _ in range(self.iterations):
+            self._simulate(state, budget)
+        stats = self.table[state]
+        # The most visited action is the robust choice; ties go to the better mean
+        return max(stats, key=lambda a: (stats[a][0], stats[a][1] / stats[a][0] if stats[a][0] else -math.inf))
+
+    def value(self, state):
+        """Return the best mean value found for `state`, or None if unexplored."""
+        stats = self.table.get(state)
+        if not stats:
+            return None
+        return max(total / visits for visits, total in stats.values() if visits)
+
+    def _simulate(self, state, budget):
+        if budget <= 0:
+            return 0.0
+        self.lookups += 1
+        stats = self.table.get(state)
+        if stats is None:
+            self.table[state] = {action: [0, 0.0] for action in actions(state)}
+            return self._rollout(state, budget)
+        self.hits += 1
+
+        untried = [a for a, (visits, _) in stats.items() if visits == 0]
+        if untried:
+            action = self.rng.choice(untried)
+        else:
+            total_visits = sum(visits for visits, _ in stats.values())
+            log_total = math.log(total_visits)
+            action = max(stats, key=lambda a: stats[a][1] / stats[a][0]
+                         + self.exploration * math.sqrt(log_total / stats[a][0]))
+
+        next_state, inputs, outcome = step(state, action, self.rng)
+        value = -INPUT_COST * inputs
+        if outcome == 'won':
+            value += SUCCESS
+        elif outcome is None:
+            value += self._simulate(next_state, budget - inputs)
+        entry = stats[action]
+        entry[0] += 1
+        entry[1] += value
+        # Back up the best action's mean rather than this sample, so
+        # exploring poor actions does not drag the state's value down
+        return self.value(state)
+
+    def _rollout(self, state, budget):
+        value = 0.0
+        while budget > 0:
+            state, inputs, outcome = step(state, scripted_action(state), self.rng)
+            budget -= inputs
+            value -= INPUT_COST * inputs
+            if outcome == 'won':
+                return value + SUCCESS
+            if outcome == 'died':
+                return value
+        return value
+
+
+# ============================================================================
+# PLAYING THE REAL GAME
+# ============================================================================
+
+def state_of(game):
+    """Read the model state from a GameState."""
+    player = game.player
+    return State(player['health'], player['max_health'], player['attack'], player['defense'],
+                 player['gold'], game.inventory.count(POTION.name),
+                 CRYSTAL_SWORD.name in game.inventory, game.dragon_defeated)
+
+
+def _menu_inputs(game, action):
+    kind, key, _ = action
+    if kind == 'explore':
+        return ['1', str(locations.index(content.LOCATIONS[key]) + 1)]
+    if kind == 'buy':
+        return ['3', str(shop_items.index(content.ITEMS[key]) + 1)]
+    return ['4', str(game.inventory.usable().index(POTION.name) + 1)]
+
+
+def play(choose, seed, horizon=HORIZON):
+    """
+    Play one game on the real engine.
+
+    Args:
+        choose: Function from State to action, called at the main menu
+        seed: Seed for the game's random numbers
+        horizon: Inputs before giving up
+
+    Returns:
+        (dragon defeated, inputs used, route as a list of action labels)
+    """
+    game = GameState(rng=random.Random(seed), quiet=True)
+    game.start()
+    game.send('Bot')
+    inputs = 0
+    route = []
+    stance = STANCES['fight']
+    while not game.finished and inputs < horizon:
+        if game.prompt == MENU_PROMPT:
+            action = choose(state_of(game))
+            kind, key, stance_name = action
+            route.append(f'{kind} {key}' + (f' ({stance_name})' if kind == 'explore' and stance_name != 'fight' else ''))
+            stance = STANCES[stance_name or 'fight']
+            for line in _menu_inputs(game, action):
+                game.send(line)
+                inputs += 1
+        elif game.prompt == COMBAT_PROMPT:
+            potions = game.inventory.count(POTION.name)
+            answer = {'attack': '1', 'potion': '2', 'flee': '3'}[stance.action(game.player['health'], potions)]
+            game.send(answer)
+            inputs += 1
+        elif game.prompt == CONTINUE_PROMPT:
+            game.send('no')
+            inputs += 1
+        else:
+            raise RuntimeError(f'unexpected prompt {game.prompt!r}')
+    return game.dragon_defeated, inputs, route
+
+
+# Search settings of a worker process: (iterations, max nodes)
+_settings = None
+
+
+def _init_worker(iterations, max_nodes):
+    global _settings
+    _settings = iterations, max_nodes
+
+
+def run_episode(task):
+    """Play one episode in a worker; returns (bot result, scripted result, (table hits, lookups))."""
+    seed, = task
+    iterations, max_nodes = _settings
+    # A string seed keeps the planner's rolls apart from the game's, which are seeded with `seed` itself
+    planner = Planner(random.Random(f'planner {seed}'), iterations, max_nodes=max_nodes)
+    bot = play(planner.choose, seed)
+    scripted = play(scripted_action, seed)
+    return bot, scripted, (planner.hits, planner.lookups)
+
+
+def planned_route(planner, state, rng, limit=20):
+    """
+    Follow the planner's choices from `state` through one sampled playthrough of the model.
+
+    Returns:
+        (action, expected value of the state it was chosen in, inputs) tuples
+    """
+    route = []
+    for _ in range(limit):
+        action = planner.choose(state)
+        value = planner.value(state)
+        state, inputs, outcome = step(state, action, rng)
+        route.append((action, value, inputs))
+        if outcome:
+            break
+    return route
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def summarize(label, results):
+    wins = [inputs for won, inputs, _ in results if won]
+    rate = len(wins) / len(results)
+    mean = sum(wins) / len(wins) if wins else math.nan
+    print(f'{label:<10}completion {rate:7.2%}   inputs to beat the dragon: mean {mean:6.2f}'
+          + (f', min {min(wins)}, max {max(wins)}' if wins else ''))
+    return rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Autoplay bot for the CLI game.')
+    parser.add_argument('--episodes', type=int, default=200, help='games to play')
+    parser.add_argument('--iterations', type=int, default=500, help='search iterations per decision')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--max-nodes', type=int, default=200_000, help='transposition table size limit')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--min-completion', type=float, help='exit with status 1 below this completion rate')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    tasks = [(args.seed + i,) for i in range(args.episodes)]
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.iterations, args.max_nodes)) as pool:
+        results = list(pool.map(run_episode, tasks, chunksize=max(1, args.episodes // (args.workers * 4))))
+    elapsed = time.perf_counter() - start
+
+    bot = [r[0] for r in results]
+    scripted = [r[1] for r in results]
+    print(f'{args.episodes} games on the real engine, {args.iterations} search iterations per decision')
+    rate = summarize('bot', bot)
+    summarize('scripted', scripted)
+
+    print('\nMost common winning routes')
+    routes = Counter(' -> '.join(route) for won, _, route in bot if won)
+    for route, count in routes.most_common(3):
+        print(f'{count / len(bot):7.2%}  {route}')
+
+    rng = random.Random(args.seed)
+    planner = Planner(rng, args.iterations * 10, max_nodes=args.max_nodes)
+    print('\nPlanned route from a new game (one playthrough of the model)')
+    print(f"  {'action':<30}{'value':>7}{'inputs':>8}")
+    for (kind, key, stance), value, inputs in planned_route(planner, state_of(_new_game()), rng):
+        label = f'{kind} {key}' + (f' ({stance})' if stance else '')
+        print(f'  {label:<30}{value:>7.3f}{inputs:>8}')
+
+    hits = sum(r[2][0] for r in results)
+    lookups = sum(r[2][1] for r in results)
+    print(f'\n{elapsed:.1f}s with {args.workers} workers; transposition hits {hits / max(lookups, 1):.1%}')
+
+    if args.min_completion is not None and rate < args.min_completion:
+        print(f'FAILED: completion {rate:.2%} is below {args.min_completion:.2%}')
+        return 1
+    return 0
+
+
+def _new_game():
+    game = GameState(rng=random.Random(0), quiet=True)
+    game.start()
+    game.send('Bot')
+    return game
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Bounded LRU cache for rendered HTML fragments.
+
+Fragments such as the stats bar depend on only a handful of small
+values, and players tend to share the same combinations, so rendering
+each combination once and reusing the string saves both template work
+and allocations. Every cache counts hits, misses and evictions.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """A thread-safe LRU cache of rendered fragments with hit counters."""
+
+    # Every cache ever created, so they can be reported on together
+    registry = []
+
+    def __init__(self, name, maxsize=1024):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        FragmentCache.registry.append(self)
+
+    def get(self, key, render, *args, **kwargs):
+        """
+        Return the cached fragment for key, rendering it on a miss.
+
+        Args:
+            key: Hashable tuple of every input the fragment depends on
+            render: Callable producing the fragment
+            *args, **kwargs: Passed to render on a miss
+
+        Returns:
+            The rendered fragment
+        """
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        # Render outside the lock; two threads may race to fill the same
+        # key, which only costs a duplicate render.
+        fragment = render(*args, **kwargs)
+
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return fragment
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def reset_counters(self):
+        """Reset the counters, keeping the entries."""
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Return the counters as a dictionary."""
+        return {
+            'name': self.name,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
+
+
+def all_stats():
+    """Return stats for every fragment cache in the process."""
+    return [cache.stats() for cache in FragmentCache.registry]
@@ -0,0 +1,258 @@
+"""
+Compact, versioned binary encoding of player state.
+
+Layout of a version 3 record (all integers little-endian):
+
+    version     u8   low 7 bits: format version, high bit: zlib-compressed
+    stats       5 x i32   health, max_health, attack, defense, gold
+    flags       u8   bit 0 game_started, bit 1 dragon_defeated
+    visited     u16 length + bitset, bit n - 1 set if location ID n was visited
+    name        u16 length + UTF-8
+    inventory   u16 stack count, then per stack: u16 item ID + u16 count
+    combat      u16 enemy ID (0 = not fighting) + i32 enemy health
+    message     u8 type ID (0 = none) + u16 length + UTF-8
+    rng         u64 seed + u32 actions counted (see fantasy_actions.perform)
+
+Version 2 had no rng fields; its sessions carry on with seed 0. Version 1
+was as version 2 except that item and enemy IDs were u8 and the visited
+bitset a single u8, which content packs outgrew.
+
+Everything after the version byte may be zlib-compressed, which only
+pays off for large inventories.
+
+Older records are upgraded on decode: the JSON dicts written before this
+format existed are version 0. ID tables are append-only; never reorder
+or remove an entry, or existing sessions will decode wrongly.
+"""
+
+import json
+import struct
+import zlib
+from collections import Counter
+
+import fantasy_content as content
+from fantasy_inventory import ITEM_IDS, Inventory
+
+CURRENT_VERSION = 3
+COMPRESSED = 0x80
+
+# Enemy, item and location IDs come from fantasy_content; message types
+# are only used here. Position in the tuple is the ID, 0 means "none".
+MESSAGE_TYPES = (None, 'success', 'danger', 'info')
+MESSAGE_TYPE_IDS = {kind: i for i, kind in enumerate(MESSAGE_TYPES) if kind}
+
+# Location with ID n is bit n - 1 of the visited bitset
+LOCATION_BITS = {location.key: 1 << (location.id - 1) for location in content.LOCATIONS.values()}
+
+_STATS = struct.Struct('<iiiiiB')
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_STACK = struct.Struct('<HH')
+_COMBAT = struct.Struct('<Hi')
+_RNG = struct.Struct('<QI')
+
+# Version 1 structures, kept for decoding old records
+_STATS_V1 = struct.Struct('<iiiiiBB')
+_STACK_V1 = struct.Struct('<BH')
+_COMBAT_V1 = struct.Struct('<Bi')
+
+GAME_STARTED = 0x01
+DRAGON_DEFEATED = 0x02
+
+
+# ============================================================================
+# ENCODING
+# ============================================================================
+
+def _pack_text(text):
+    data = (text or '').encode('utf-8')
+    if len(data) > 0xFFFF:
+        raise ValueError(f'text of {len(data)} bytes does not fit a u16 length: {data[:20]!r}...')
+    return _U16.pack(len(data)) + data
+
+
+def encode(player, compress=False):
+    """
+    Encode a player dict in the current format.
+
+    Args:
+        player: Player state as used by the web version
+        compress: zlib-compress the body when that makes it smaller
+
+    Returns:
+        The encoded bytes
+
+    Raises:
+        ValueError: If the name or message is 64 KiB or more in UTF-8
+    """
+    flags = 0
+    if player['game_started']:
+        flags |= GAME_STARTED
+    if player['dragon_defeated']:
+        flags |= DRAGON_DEFEATED
+
+    visited = 0
+    for key in player['locations_visited']:
+        visited |= LOCATION_BITS[key]
+
+    visited_bytes = visited.to_bytes((visited.bit_length() + 7) // 8, 'little')
+    parts = [
+        _STATS.pack(player['health'], player['max_health'], player['attack'],
+                    player['defense'], player['gold'], flags),
+        _U16.pack(len(visited_bytes)), visited_bytes,
+        _pack_text(player['name']),
+    ]
+
+    stacks = player['inventory'].stacks()
+    parts.append(_U16.pack(len(stacks)))
+    parts.extend(_STACK.pack(item_id, count) for item_id, count in stacks)
+
+    combat = player.get('current_combat')
+    if combat:
+        parts.append(_COMBAT.pack(content.ENEMIES[combat['type']].id, combat['enemy_health']))
+    else:
+        parts.append(_COMBAT.pack(0, 0))
+
+    if player.get('message'):
+        parts.append(_U8.pack(MESSAGE_TYPE_IDS[player['message_type']]))
+        parts.append(_pack_text(player['message']))
+    else:
+        parts.append(_U8.pack(0))
+
+    parts.append(_RNG.pack(player.get('seed', 0), player.get('actions', 0)))
+
+    body = b''.join(parts)
+    if compress:
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body):
+            return _U8.pack(CURRENT_VERSION | COMPRESSED) + packed
+    return _U8.pack(CURRENT_VERSION) + body
+
+
+# ============================================================================
+# DECODING
+# ============================================================================
+
+def _unpack_text(data, offset):
+    (length,) = _U16.unpack_from(data, offset)
+    offset += _U16.size
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def _decode(body, stats, stack, combat_struct, read_visited, rng=None):
+    # Versions differ in field widths and in the rng fields; the arguments say which
+    health, max_health, attack, defense, gold, flags = stats.unpack_from(body, 0)[:6]
+    visited, offset = read_visited(body, stats)
+    name, offset = _unpack_text(body, offset)
+
+    (stack_count,) = _U16.unpack_from(body, offset)
+    offset += _U16.size
+    stacks = []
+    for _ in range(stack_count):
+        stacks.append(stack.unpack_from(body, offset))
+        offset += stack.size
+    inventory = Inventory.from_stacks(stacks)
+
+    enemy_id, enemy_health = combat_struct.unpack_from(body, offset)
+    offset += combat_struct.size
+    combat = None
+    if enemy_id:
+        enemy = content.ENEMIES_BY_ID[enemy_id]
+        combat = {'type': enemy.key, 'enemy_health': enemy_health, 'enemy_name': enemy.name}
+
+    (message_type_id,) = _U8.unpack_from(body, offset)
+    offset += _U8.size
+    message = None
+    if message_type_id:
+        message, offset = _unpack_text(body, offset)
+
+    player = {
+        'name': name,
+        'health': health,
+        'max_health': max_health,
+        'attack': attack,
+        'defense': defense,
+        'gold': gold,
+        'inventory': inventory,
+        'locations_visited': [key for key, bit in LOCATION_BITS.items() if visited & bit],
+        'dragon_defeated': bool(flags & DRAGON_DEFEATED),
+        'game_started': bool(flags & GAME_STARTED),
+        'current_combat': combat,
+        'message': message,
+        'message_type': MESSAGE_TYPES[message_type_id],
+    }
+    if rng:
+        player['seed'], player['actions'] = rng.unpack_from(body, offset)
+    return player
+
+
+def _visited_v1(body, stats):
+    return body[stats.size - 1], stats.size
+
+
+def _visited_v2(body, stats):
+    offset = stats.size
+    (length,) = _U16.unpack_from(body, offset)
+    offset += _U16.size
+    return int.from_bytes(body[offset:offset + length], 'little'), offset + length
+
+
+def _decode_v1(body):
+    return _decode(body, _STATS_V1, _STACK_V1, _COMBAT_V1, _visited_v1)
+
+
+def _decode_v2(body):
+    return _decode(body, _STATS, _STACK, _COMBAT, _visited_v2)
+
+
+def _decode_v3(body):
+    return _decode(body, _STATS, _STACK, _COMBAT, _visited_v2, _RNG)
+
+
+# Decoders by format version; each returns the player dict of its version
+DECODERS = {
+    1: _decode_v1,
+    2: _decode_v2,
+    3: _decode_v3,
+}
+
+
+def _migrate_v0(player):
+    # Inventories were lists of names; keep whatever was held, over limits or not
+    stacks = Counter(ITEM_IDS[name] for name in player['inventory']).items()
+    return {**player, 'inventory': Inventory.from_stacks(stacks)}
+
+
+# Upgrades a decoded dict from version N to N + 1
+MIGRATIONS = {
+    0: _migrate_v0,
+    1: lambda player: player,  # only field widths changed
+    2: lambda player: {**player, 'seed': 0, 'actions': 0},
+}
+
+
+def decode(data):
+    """
+    Decode player state written by any version of encode().
+
+    Args:
+        data: Bytes from encode(), or a legacy JSON document
+
+    Returns:
+        The player dict, upgraded to the current version
+    """
+    if data[:1] == b'{':
+        version, player = 0, json.loads(data)
+    else:
+        version = data[0] & ~COMPRESSED
+        body = data[1:]
+        if data[0] & COMPRESSED:
+            body = zlib.decompress(body)
+        if version not in DECODERS:
+            raise ValueError(f"Unknown player state version {version}")
+        player = DECODERS[version](body)
+
+    while version < CURRENT_VERSION:
+        player = MIGRATIONS[version](player)
+        version += 1
+    return player
@@ -0,0 +1,188 @@
+"""
+Combat rules shared by the CLI, the web version and the simulators.
+
+Every roll a fight makes goes through the functions here, so the game
+and the balancing tools (fantasy_sim, fantasy_solver) cannot disagree
+about damage ranges or flee chances.
+
+A round is one player action:
+    attack  deal attack-3 .. attack+5 damage (uniform)
+    potion  drink a Health Potion, restoring up to 30 health
+    flee    escape with probability 0.7
+If the enemy survives, it hits back for max(1, roll - defense) with a roll
+of enemy_attack-2 .. enemy_attack+3. In the CLI the enemy hits back after
+every action; in the web version only after an attack, since drinking a
+potion or failing to flee there does not take a turn.
+"""
+
+import random
+from dataclasses import dataclass, replace
+
+import fantasy_content as content
+
+# Damage ranges, as offsets from the attacker's attack stat (inclusive)
+PLAYER_DAMAGE = (-3, 5)
+ENEMY_DAMAGE = (-2, 3)
+MIN_DAMAGE = 1
+
+# A flee attempt succeeds when random() is above this
+FLEE_FAIL_CHANCE = 0.3
+
+POTION = content.ITEMS['potion']
+
+# Fight outcomes
+WIN, DEATH, FLED, TIMEOUT = range(4)
+OUTCOMES = ('win', 'death', 'fled', 'timeout')
+
+
+# ============================================================================
+# ROLLS
+# ============================================================================
+
+def roll_player_damage(rng, attack):
+    """Roll the damage of a player attack."""
+    return rng.randint(attack + PLAYER_DAMAGE[0], attack + PLAYER_DAMAGE[1])
+
+
+def roll_enemy_damage(rng, enemy_attack, defense):
+    """Roll the damage an enemy attack does to the player, after defense."""
+    roll = rng.randint(enemy_attack + ENEMY_DAMAGE[0], enemy_attack + ENEMY_DAMAGE[1])
+    return max(MIN_DAMAGE, roll - defense)
+
+
+def roll_flee(rng):
+    """Return True if a flee attempt succeeds."""
+    return rng.random() > FLEE_FAIL_CHANCE
+
+
+# ============================================================================
+# RULE SETS, BUILDS AND POLICIES
+# ============================================================================
+
+@dataclass(frozen=True, slots=True)
+class Rules:
+    """Where the two front ends' combat loops differ."""
+    name: str
+    counter_after_potion: bool       # enemy hits back after a potion
+    counter_after_failed_flee: bool  # enemy hits back after a failed flee
+
+
+RULES = {
+    'cli': Rules('cli', counter_after_potion=True, counter_after_failed_flee=True),
+    'web': Rules('web', counter_after_potion=False, counter_after_failed_flee=False),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Build:
+    """A player's combat stats."""
+    name: str
+    attack: int
+    defense: int
+    max_health: int
+    health: int | None = None  # current health; None means full
+    potions: int = 0
+
+    @property
+    def start_health(self):
+        return self.max_health if self.health is None else self.health
+
+    def with_items(self, *keys):
+        """Return this build with the stat bonuses of some items added."""
+        build = self
+        for key in keys:
+            item = content.ITEMS[key]
+            build = replace(build, attack=build.attack + item.attack,
+                            defense=build.defense + item.defense,
+                            max_health=build.max_health + item.max_health)
+        return replace(build, name='+'.join([self.name, *keys]))
+
+
+# A new player, as both front ends start one
+STARTER = Build('starter', attack=10, defense=5, max_health=100)
+
+
+def standard_builds(potions=0):
+    """Return the builds worth balancing against: the starter plus shop and reward gear."""
+    start = replace(STARTER, potions=potions)
+    return [
+        start,
+        start.with_items('sword'),
+        start.with_items('sword', 'shield'),
+        start.with_items('crystal_sword'),
+        start.with_items('crystal_sword', 'sword', 'shield', 'amulet'),
+    ]
+
+
+@dataclass(frozen=True, slots=True)
+class Policy:
+    """
+    How a simulated player fights.
+
+    Each round the player drinks a potion if health <= potion_at and one is
+    left, else flees if health <= flee_at, else attacks.
+    """
+    potion_at: int = 0
+    flee_at: int = 0
+
+    def action(self, health, potions):
+        if potions > 0 and health <= self.potion_at:
+            return 'potion'
+        if health <= self.flee_at:
+            return 'flee'
+        return 'attack'
+
+
+# ============================================================================
+# SCALAR ENGINE
+# ============================================================================
+
+@dataclass(frozen=True, slots=True)
+class FightResult:
+    outcome: int  # WIN, DEATH, FLED or TIMEOUT
+    turns: int
+    health: int   # player health at the end
+    potions_used: int
+
+
+def fight(build, enemy, policy=Policy(), rules=RULES['cli'], rng=random, max_turns=1000):
+    """
+    Play one fight, one roll at a time, exactly as the game does.
+
+    Args:
+        build: The player's stats and potions
+        enemy: A fantasy_content.Enemy
+        policy: Which action the player picks each round
+        rules: RULES['cli'] or RULES['web']
+        rng: Source of rolls (random or a random.Random)
+        max_turns: Rounds before the fight is called a TIMEOUT
+
+    Returns:
+        A FightResult
+    """
+    health = build.start_health
+    potions = build.potions
+    enemy_health = enemy.health
+
+    for turn in range(1, max_turns + 1):
+        action = policy.action(health, potions)
+        counter = True
+        if action == 'attack':
+            enemy_health -= roll_player_damage(rng, build.attack)
+            if enemy_health <= 0:
+                return FightResult(WIN, turn, health, build.potions - potions)
+        elif action == 'potion':
+            potions -= 1
+            health = min(health + POTION.heal, build.max_health)
+            counter = rules.counter_after_potion
+        else:
+            if roll_flee(rng):
+                return FightResult(FLED, turn, health, build.potions - potions)
+            counter = rules.counter_after_failed_flee
+
+        if counter:
+            health -= roll_enemy_damage(rng, enemy.attack, build.defense)
+            if health <= 0:
+                return FightResult(DEATH, turn, health, build.potions - potions)
+
+    return FightResult(TIMEOUT, max_turns, health, build.potions - potions)
@@ -0,0 +1,187 @@
+"""
+Game content shared by the CLI and web versions.
+
+Enemies, items and locations are defined once here as frozen records and
+indexed when this module is imported. Both front ends look them up by key
+or ID instead of keeping their own copies, so the two versions cannot
+drift apart and nothing is rebuilt per request.
+
+IDs are what saved sessions store. Never change or reuse one.
+"""
+
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import fantasy_packs
+
+
+@dataclass(frozen=True, slots=True)
+class Enemy:
+    """A creature the player can fight."""
+    key: str
+    id: int
+    name: str
+    health: int
+    attack: int
+    gold: int
+    reward_item: str | None = None  # item key dropped on the first victory
+    icon: str = ''
+    appears: str = ''               # announcement when it shows up
+
+
+@dataclass(frozen=True, slots=True)
+class Item:
+    """Something the player can carry, and perhaps buy or use."""
+    key: str
+    id: int
+    name: str
+    price: int | None = None  # None if the shop does not sell it
+    icon: str = ''
+    effect: str = ''          # long description, used by the CLI
+    summary: str = ''         # short description, used by the web shop
+    attack: int = 0
+    defense: int = 0
+    max_health: int = 0
+    heal: int = 0             # health restored when used
+
+    @property
+    def usable(self):
+        return self.heal > 0
+
+
+@dataclass(frozen=True, slots=True)
+class Encounter:
+    """One entry in a location's table of random encounters."""
+    kind: str                # 'fight', 'heal' or 'treasure'
+    weight: int = 1
+    enemy: str | None = None  # enemy key, for 'fight'
+    amount: int = 0          # health restored, for 'heal'
+    min_gold: int = 0        # gold range, for 'treasure'
+    max_gold: int = 0
+    icon: str = ''
+    text: str = ''           # headline, e.g. 'A friendly forest fairy appears!'
+    detail: str = ''         # lead-in to the amount, e.g. 'Inside you find'
+
+    KINDS = ('fight', 'heal', 'treasure')
+
+
+@dataclass(frozen=True, slots=True)
+class Location:
+    """A place the player can explore."""
+    key: str
+    id: int
+    name: str
+    description: str
+    action: str  # menu entry in the web version
+    icon: str = ''
+    intro: str = ''  # first line shown on arrival
+    encounters: tuple = ()
+    # Encounters repeated by weight, so one random.choice() picks one
+    encounter_table: tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        table = tuple(e for e in self.encounters for _ in range(e.weight))
+        object.__setattr__(self, 'encounter_table', table)
+
+
+def _index(records):
+    """Index records by key, checking keys and IDs are unique."""
+    by_key = {}
+    ids = set()
+    for record in records:
+        if record.key in by_key or record.id in ids or record.id <= 0:
+            raise ValueError(f"Duplicate or invalid {type(record).__name__}: {record.key} ({record.id})")
+        by_key[record.key] = record
+        ids.add(record.id)
+    return MappingProxyType(by_key)
+
+
+def _by_id(records):
+    """Return a tuple indexed by record ID, with None in unused slots."""
+    table = [None] * (max(record.id for record in records) + 1)
+    for record in records:
+        table[record.id] = record
+    return tuple(table)
+
+
+# ============================================================================
+# BUILT-IN CONTENT
+# ============================================================================
+
+BUILTIN_ENEMIES = [
+    Enemy('goblin', 1, 'Goblin', health=30, attack=8, gold=10,
+          icon='⚔️', appears='A wild Goblin leaps from the bushes!'),
+    Enemy('wolf', 2, 'Wolf', health=25, attack=10, gold=8,
+          icon='🐺', appears='A fierce Wolf blocks your path!'),
+    Enemy('bat', 3, 'Giant Bat', health=35, attack=12, gold=15, reward_item='crystal_sword',
+          icon='🦇', appears='A Giant Bat swoops down from the darkness!'),
+    Enemy('dragon', 4, 'Dragon of Shadowmere', health=100, attack=20, gold=100,
+          icon='🐉', appears='THE DRAGON OF SHADOWMERE AWAKENS!'),
+]
+
+BUILTIN_ITEMS = [
+    Item('dagger', 1, 'Rusty Dagger'),
+    Item('potion', 2, 'Health Potion', price=15, icon='🧪', heal=30,
+         effect='Restores 30 health', summary='Restores 30 health'),
+    Item('sword', 3, 'Iron Sword', price=25, icon='⚔️', attack=5,
+         effect='Increases attack by 5', summary='+5 Attack'),
+    Item('shield', 4, 'Leather Shield', price=20, icon='🛡️', defense=3,
+         effect='Increases defense by 3', summary='+3 Defense'),
+    Item('amulet', 5, 'Magic Amulet', price=40, icon='📿', max_health=20,
+         effect='Increases max health by 20', summary='+20 Max Health'),
+    Item('crystal_sword', 6, 'Crystal Sword', attack=15),
+]
+
+BUILTIN_LOCATIONS = [
+    Location('village', 1, 'Village of Elderbrook',
+             'A peaceful village with cobblestone streets and friendly townsfolk. '
+             'A tavern and shop stand nearby.',
+             '🏘️ Explore the Village', icon='🏘️'),
+    Location('forest', 2, 'Whispering Forest',
+             'A dark, mysterious forest where the trees seem to whisper ancient secrets. '
+             'Danger lurks within.',
+             '🌲 Enter the Whispering Forest', icon='🌲',
+             intro='You venture deep into the mysterious forest. The trees seem to whisper ancient secrets...',
+             encounters=(
+                 Encounter('fight', enemy='goblin'),
+                 Encounter('heal', amount=20, icon='✨', text='A friendly forest fairy appears!',
+                           detail='She sprinkles healing dust on you, restoring'),
+                 Encounter('fight', enemy='wolf'),
+                 Encounter('treasure', min_gold=10, max_gold=25, icon='💰',
+                           text='You discovered a hidden treasure chest!', detail='Inside you find'),
+             )),
+    Location('cave', 3, 'Crystal Cave',
+             'A cave filled with glowing crystals that illuminate the darkness. '
+             'Strange creatures dwell here.',
+             '💎 Venture into Crystal Cave', icon='💎'),
+    Location('dragon', 4, "Dragon's Lair",
+             'The dreaded lair of the Dragon of Shadowmere. '
+             'Only the bravest adventurers dare enter.',
+             "🐉 Challenge the Dragon's Lair", icon='🐉'),
+]
+
+# ============================================================================
+# REGISTRIES
+# ============================================================================
+
+# Content packs (see fantasy_packs) may add records or replace built-in ones
+_packs = fantasy_packs.load(
+    {'enemies': Enemy, 'items': Item, 'locations': Location, 'encounters': Encounter},
+    {'enemies': BUILTIN_ENEMIES, 'items': BUILTIN_ITEMS, 'locations': BUILTIN_LOCATIONS},
+)
+
+ENEMIES = _index(_packs['enemies'])
+ITEMS = _index(_packs['items'])
+LOCATIONS = _index(_packs['locations'])
+
+# ============================================================================
+# DERIVED INDEXES
+# ============================================================================
+
+ENEMIES_BY_ID = _by_id(ENEMIES.values())
+ITEMS_BY_ID = _by_id(ITEMS.values())
+ITEMS_BY_NAME = MappingProxyType({item.name: item for item in ITEMS.values()})
+LOCATIONS_BY_ID = _by_id(LOCATIONS.values())
+
+# What the shop sells, in display order
+SHOP_ITEMS = tuple(item for item in ITEMS.values() if item.price is not None)
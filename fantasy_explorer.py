@@ -0,0 +1,610 @@
+"""
+Reachable-state explorer for the web version.
+
+Starting from a new player, the explorer calls the Flask route handlers
+of fantasy_adventure_web directly, on every state it reaches, with every
+outcome of every roll: the session's random stream (see
+fantasy_actions.session_rng) is replaced by one that follows a script, and each request is re-run with every script the
+rolls allow (all values of randint() and choice(); random() at 0.0 and
+just under 1.0, which lands on both sides of any threshold). Nothing is
+modelled by hand, so the explorer sees the same edge cases as players.
+
+A state is the player record as fantasy_codec encodes it, with the
+message and random stream cleared and gold capped at --gold-cap, plus (in clicks mode) the
+set of requests the current page offers. Two modes:
+    clicks  the player only follows links and forms, redirects included,
+            as a browser would
+    urls    the player may request any route at any time, as anyone
+            with a URL bar can
+
+States are deduplicated by a 64-bit BLAKE2 hash, either in an exact set
+or (--bitstate-mb) in a fixed-size bitstate table: three bits per state
+in a bit array, as in Holzmann's supertrace. The table never grows, at
+the cost of occasionally taking a new state for a seen one; the report
+gives the chance. The BFS frontier spills to a temporary file past
+--frontier-memory records, so memory stays bounded however wide a level
+gets; --dfs explores depth-first instead, with memory proportional to
+--max-depth. BFS finds the shortest witness for every finding.
+
+The report lists:
+    findings      requests that break an invariant (fighting a stale
+                  enemy, switching enemies mid-fight, retrying a failed
+                  roll for free, beating the dragon without the Crystal
+                  Sword, acting before the game starts or after death)
+    gold loops    requests that only add gold, so they can be repeated
+                  for as much gold as wanted
+    dead ends     states where every request leads back to the same state
+    unreachable   locations, enemies and items never reached; in both
+                  modes, also what only typed URLs reach
+
+Usage:
+    python fantasy_explorer.py --max-depth 12
+    python fantasy_explorer.py --mode urls --max-states 5000000 --bitstate-mb 64
+"""
+
+import argparse
+import hashlib
+import re
+import resource
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections import deque
+
+from flask import g
+
+import fantasy_actions as actions
+import fantasy_adventure_web as web
+import fantasy_codec as codec
+import fantasy_content as content
+
+# random() is explored at these two values: below and above any threshold
+RANDOM_EXTREMES = (0.0, 1.0 - 1e-9)
+
+# Every request a player can type, in urls mode. The plain pages ('/',
+# '/shop', '/status') only clear the message, so they are left out.
+URL_REQUESTS = (
+    [('POST', '/start'), ('GET', '/reset'), ('GET', '/flee'), ('GET', '/use_potion_combat')]
+    + [('GET', f'/location/{key}') for key in content.LOCATIONS]
+    + [('GET', f'/combat/{key}') for key in content.ENEMIES]
+    + [('GET', f'/attack/{key}') for key in content.ENEMIES]
+    + [('GET', f'/buy/{item.key}') for item in content.SHOP_ITEMS]
+)
+
+FINDINGS = {
+    'stale-attack': '/attack/<enemy> hit a fight with a different enemy',
+    'combat-switch': '/combat/<enemy> replaced a fight in progress with a fresh enemy',
+    'combat-carried-over': 'a new encounter resumed an earlier, wounded enemy of the same kind',
+    'free-retry': 'a failed roll in combat changed nothing, so it can be retried for free',
+    'quest-bypass': 'the dragon was defeated without the Crystal Sword',
+    'unguarded': 'a request changed the game before it was started',
+    'dead-but-playing': 'the game went on with health at or below 0',
+}
+
+# Links lose their ?v= version token, so every request is taken (see fantasy_adventure_web.fresh_request)
+_LINK = re.compile(r'href="(/[^"?]*)')
+_FORM = re.compile(r'<form action="(/[^"]*)" method="POST"')
+_RECORD = struct.Struct('<HHH')
+
+
+# ============================================================================
+# RUNNING ROUTE HANDLERS
+# ============================================================================
+
+class ScriptedRandom:
+    """
+    Stands in for the random module, taking each roll from a script.
+
+    With bounds=True, randint() only offers the lowest, middle and highest
+    value of its range.
+    """
+
+    def __init__(self, script, bounds=False):
+        self.script = script
+        self.bounds = bounds
+        self.taken = []    # index picked at each roll
+        self.options = []  # number of outcomes of each roll
+        self.values = []
+
+    def _pick(self, n):
+        i = len(self.taken)
+        index = self.script[i] if i < len(self.script) else 0
+        self.taken.append(index)
+        self.options.append(n)
+        return index
+
+    def randint(self, a, b):
+        if self.bounds and b - a > 1:
+            value = (a, (a + b) // 2, b)[self._pick(3)]
+        else:
+            value = a + self._pick(b - a + 1)
+        self.values.append(value)
+        return value
+
+    def choice(self, seq):
+        value = seq[self._pick(len(seq))]
+        self.values.append(getattr(value, 'enemy', None) or getattr(value, 'kind', value))
+        return value
+
+    def random(self):
+        value = RANDOM_EXTREMES[self._pick(2)]
+        self.values.append('low' if value < 0.5 else 'high')
+        return value
+
+
+def outcomes(run, bounds=False):
+    """
+    Call run(rng) once per combination of roll outcomes.
+
+    Yields:
+        (values rolled, what run returned)
+    """
+    scripts = [()]
+    while scripts:
+        script = scripts.pop()
+        rng = ScriptedRandom(script, bounds)
+        result = run(rng)
+        for i in range(len(script), len(rng.taken)):
+            base = tuple(rng.taken[:i])
+            scripts.extend(base + (alt,) for alt in range(1, rng.options[i]))
+        yield tuple(rng.values), result
+
+
+def page_requests(body):
+    """Return the requests a page offers: its links and POST forms, downloads and auto-battles excepted."""
+    links = [('GET', path) for path in _LINK.findall(body)
+             if not path.startswith('/static/') and path != '/log']
+    # An auto-battle is a run of the attacks, potions and flees explored one at
+    # a time already, and its many rolls would multiply the scripts to try
+    forms = [('POST', path) for path in _FORM.findall(body) if path != '/auto_battle']
+    return tuple(dict.fromkeys(links + forms))
+
+
+class Runner:
+    """Calls route handlers directly on a player dict, without HTTP or the session store."""
+
+    def __init__(self):
+        # One request context serves every call; /start reads its form
+        self.context = web.app.test_request_context('/start', method='POST', data={'player_name': 'Hero'})
+        self.context.push()
+        self.adapter = web.app.url_map.bind('localhost')
+        self.views = {}
+
+    def _view(self, method, path):
+        # Routing is the same for every state, so match each URL once
+        view = self.views.get((method, path))
+        if view is None:
+            endpoint, args = self.adapter.match(path, method)
+            view = self.views[method, path] = (web.app.view_functions[endpoint], args)
+        return view
+
+    def request(self, player, method, path, rng, follow):
+        """
+        Run one request, and its redirects if `follow`.
+
+        Returns:
+            (player after, body of the final page or None)
+        """
+        real_rng = actions.session_rng
+        actions.session_rng = lambda _: rng
+        g.player = player
+        g.player_data = b''
+        try:
+            for _ in range(5):
+                view, args = self._view(method, path)
+                response = view(**args)
+                if isinstance(response, str):
+                    body = response
+                    break
+                if not follow or response.status_code not in (301, 302, 303):
+                    body = response.get_data(as_text=True)
+                    break
+                method, path = 'GET', response.headers['Location']
+            else:
+                raise RuntimeError(f'redirect loop at {path}')
+            # /reset drops the player; the next request starts a new one
+            player = g.pop('player', None) or actions.new_player()
+        finally:
+            actions.session_rng = real_rng
+            g.pop('log_entries', None)
+            g.pop('player', None)
+            g.pop('player_data', None)
+        return player, body if follow else None
+
+
+# ============================================================================
+# VISITED SETS AND FRONTIERS
+# ============================================================================
+
+def state_hash(key):
+    return hashlib.blake2b(key, digest_size=8).digest()
+
+
+class ExactSet:
+    """Visited states as a set of 64-bit hashes."""
+
+    def __init__(self):
+        self.hashes = set()
+
+    def add(self, key):
+        """Add a state; return True if it was new."""
+        digest = state_hash(key)
+        if digest in self.hashes:
+            return False
+        self.hashes.add(digest)
+        return True
+
+    def describe(self):
+        return f'exact set of {len(self.hashes):,} hashes'
+
+
+class BitstateSet:
+    """
+    Visited states in a fixed bit array, three bits per state.
+
+    A state is taken as seen when all three of its bits are set, so a new
+    state is occasionally skipped; memory never grows.
+    """
+    BITS_PER_STATE = 3
+
+    def __init__(self, megabytes):
+        self.size = megabytes * 8 * 1024 * 1024
+        self.bits = bytearray(self.size // 8)
+        self.states = 0
+
+    def add(self, key):
+        digest = hashlib.blake2b(key, digest_size=12).digest()
+        new = False
+        for i in range(self.BITS_PER_STATE):
+            bit = int.from_bytes(digest[4 * i:4 * i + 4], 'little') * self.size >> 32
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                new = True
+        self.states += new
+        return new
+
+    def omission_chance(self):
+        """Chance that a new state is mistaken for a seen one, at the current fill."""
+        fill = 1 - (1 - 1 / self.size) ** (self.BITS_PER_STATE * self.states)
+        return fill ** self.BITS_PER_STATE
+
+    def describe(self):
+        return (f'bitstate table of {len(self.bits) / 2 ** 20:.0f} MB, {self.states:,} states, '
+                f'omission chance now {self.omission_chance():.2g}')
+
+
+class Frontier:
+    """FIFO of (page, state, path) records that spills to a temporary file past `memory_limit`."""
+
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+        self.memory = deque()
+        self.file = None
+        self.read_at = self.write_at = 0
+        self.on_disk = 0
+        self.spilled = 0
+
+    def push(self, page, state, path):
+        if self.on_disk == 0 and len(self.memory) < self.memory_limit:
+            self.memory.append((page, state, path))
+            return
+        # Once spilling, everything goes to disk to keep the order
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(self.write_at)
+        self.file.write(_RECORD.pack(page, len(state), len(path)) + state + path)
+        self.write_at = self.file.tell()
+        self.on_disk += 1
+        self.spilled += 1
+
+    def pop(self):
+        if self.memory:
+            return self.memory.popleft()
+        self.file.seek(self.read_at)
+        page, state_len, path_len = _RECORD.unpack(self.file.read(_RECORD.size))
+        state = self.file.read(state_len)
+        path = self.file.read(path_len)
+        self.read_at = self.file.tell()
+        self.on_disk -= 1
+        if self.on_disk == 0:
+            self.read_at = self.write_at = 0
+        return page, state, path
+
+    def __len__(self):
+        return len(self.memory) + self.on_disk
+
+
+class Stack:
+    """LIFO of (page, state, path) records, for depth-first search."""
+
+    def __init__(self):
+        self.items = []
+        self.spilled = 0
+
+    def push(self, page, state, path):
+        self.items.append((page, state, path))
+
+    def pop(self):
+        return self.items.pop()
+
+    def __len__(self):
+        return len(self.items)
+
+
+# ============================================================================
+# EXPLORATION
+# ============================================================================
+
+def _facts(player):
+    """Content a state shows the player has reached."""
+    facts = {f'location {key}' for key in player['locations_visited']}
+    facts.update(f'item {name}' for name in player['inventory'].names())
+    if player['current_combat']:
+        facts.add(f"enemy {player['current_combat']['type']}")
+    if player['dragon_defeated']:
+        facts.add('dragon defeated')
+    return facts
+
+
+def all_facts():
+    """Everything the content offers to reach."""
+    facts = {f'location {key}' for key in content.LOCATIONS}
+    facts.update(f'enemy {key}' for key in content.ENEMIES)
+    facts.update(f'defeated {key}' for key in content.ENEMIES)
+    facts.update(f'item {item.name}' for item in content.ITEMS.values())
+    facts.add('dragon defeated')
+    return facts
+
+
+class Explorer:
+    """Breadth- or depth-first search over the states the route handlers reach."""
+
+    def __init__(self, mode, gold_cap=200, max_stack=3, bounds=True, visited=None, frontier=None):
+        self.mode = mode
+        self.bounds = bounds
+        self.follow = mode == 'clicks'
+        self.gold_cap = gold_cap
+        self.max_stack = max_stack
+        self.visited = ExactSet() if visited is None else visited
+        self.frontier = Frontier(100_000) if frontier is None else frontier
+        self.runner = Runner()
+        self.pages = [URL_REQUESTS] if mode == 'urls' else []
+        self.page_ids = {}
+        self.steps = []     # (method, path, rolls) by step ID
+        self.step_ids = {}
+
+        self.states = self.transitions = self.pruned = self.depth_limited = 0
+        self.max_depth_seen = 0
+        self.findings = {}  # name -> (count, witness path)
+        self.gold_loops = {}  # request path -> (smallest gain, largest gain, witness path)
+        self.dead_ends = [0, None]
+        self.reached = set()
+
+    # Interning
+
+    def _page(self, body):
+        if not self.follow:
+            return 0
+        requests = page_requests(body)
+        page = self.page_ids.get(requests)
+        if page is None:
+            page = self.page_ids[requests] = len(self.pages)
+            self.pages.append(requests)
+        return page
+
+    def _step(self, method, path, rolls):
+        key = (method, path, rolls)
+        step = self.step_ids.get(key)
+        if step is None:
+            step = self.step_ids[key] = len(self.steps)
+            self.steps.append(key)
+        return step
+
+    def route(self, path):
+        """Turn a path of step IDs into readable requests."""
+        steps = array('I')
+        steps.frombytes(path)
+        route = []
+        for step in steps:
+            method, url, rolls = self.steps[step]
+            label = url if method == 'GET' else f'{method} {url}'
+            route.append(label + (f" [{' '.join(map(str, rolls))}]" if rolls else ''))
+        return route
+
+    # State keys
+
+    def canonical(self, player):
+        """Encode the parts of a player that matter, or None if past --max-stack."""
+        if any(count > self.max_stack for _, count in player['inventory'].stacks()):
+            return None
+        player['message'] = player['message_type'] = None
+        player['seed'] = player['actions'] = 0
+        player['gold'] = min(player['gold'], self.gold_cap)
+        return codec.encode(player)
+
+    def _record(self, name, path, step):
+        count, witness = self.findings.get(name, (0, None))
+        self.findings[name] = (count + 1, witness or path + array('I', [step]).tobytes())
+
+    def _check(self, before, before_page, path, rolls, after, same_state):
+        """Note every invariant a transition breaks."""
+        combat = before['current_combat']
+        name = path.rsplit('/', 1)[-1]
+        broken = []
+        if path.startswith('/attack/') and combat and combat['type'] != name:
+            broken.append('stale-attack')
+        if path.startswith('/combat/') and combat:
+            if combat['type'] != name:
+                broken.append('combat-switch')
+            elif (self.follow and not any(p.startswith('/attack/') for _, p in self.pages[before_page])
+                  and combat['enemy_health'] < content.ENEMIES[name].health):
+                broken.append('combat-carried-over')
+        if rolls and combat and same_state:
+            broken.append('free-retry')
+        if after['dragon_defeated'] and not before['dragon_defeated'] \
+                and 'Crystal Sword' not in before['inventory']:
+            broken.append('quest-bypass')
+        if not before['game_started'] and path not in ('/start', '/reset') and not same_state:
+            broken.append('unguarded')
+        if after['game_started'] and after['health'] <= 0:
+            broken.append('dead-but-playing')
+        return broken
+
+    def expand(self, page, data, path):
+        """Run every request the state allows, with every roll; push the new states."""
+        before = codec.decode(data)
+        depth = len(path) // 4
+        requests = self.pages[page]
+        self_loops = total = 0
+        for method, url in requests:
+            def run(rng):
+                return self.runner.request(codec.decode(data), method, url, rng, self.follow)
+            for rolls, (after, body) in outcomes(run, self.bounds):
+                self.transitions += 1
+                total += 1
+                new_page = self._page(body)
+                key = self.canonical(after)
+                if key is None:
+                    self.pruned += 1
+                    continue
+                same_state = key == data
+                if same_state and new_page == page:
+                    self_loops += 1
+                step = self._step(method, url, rolls)
+                for name in self._check(before, page, url, rolls, after, same_state):
+                    self._record(name, path, step)
+
+                # /reset hands back the starting gold, which is no loop
+                if after['gold'] > before['gold'] and url != '/reset' \
+                        and key == self._with_gold(data, after['gold']):
+                    gain = after['gold'] - before['gold']
+                    low, high, witness = self.gold_loops.get(url, (gain, gain, None))
+                    self.gold_loops[url] = (min(low, gain), max(high, gain),
+                                            witness or path + array('I', [step]).tobytes())
+                if url.startswith('/attack/') and before['current_combat'] and not after['current_combat'] \
+                        and after['health'] > 0:
+                    self.reached.add(f"defeated {before['current_combat']['type']}")
+                # Only the village is recorded in locations_visited, so count requests
+                if url.startswith('/location/') and before['game_started']:
+                    self.reached.add(f"location {url.rsplit('/', 1)[-1]}")
+
+                if self.visited.add(key + _RECORD.pack(new_page, 0, 0)):
+                    self.states += 1
+                    self.reached |= _facts(after)
+                    self.frontier.push(new_page, key, path + array('I', [step]).tobytes())
+                    self.max_depth_seen = max(self.max_depth_seen, depth + 1)
+        if self_loops == total:
+            self.dead_ends[0] += 1
+            self.dead_ends[1] = self.dead_ends[1] or path
+
+    def _with_gold(self, data, gold):
+        # The encoded state with only the gold changed
+        player = codec.decode(data)
+        player['gold'] = min(gold, self.gold_cap)
+        return codec.encode(player)
+
+    def run(self, max_states, max_depth):
+        """Explore until the frontier empties or a limit is hit; return the seconds taken."""
+        start = time.perf_counter()
+        player = actions.new_player()
+        page = self._page(web.views.TITLE_PAGE)
+        data = self.canonical(player)
+        self.visited.add(data + _RECORD.pack(page, 0, 0))
+        self.states = 1
+        self.reached |= _facts(player)
+        self.frontier.push(page, data, b'')
+        while self.frontier and self.states < max_states:
+            page, data, path = self.frontier.pop()
+            if len(path) // 4 >= max_depth:
+                self.depth_limited += 1
+                continue
+            self.expand(page, data, path)
+        return time.perf_counter() - start
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def print_route(explorer, path, indent='      '):
+    route = explorer.route(path)
+    print(indent + (' -> '.join(route) if route else '(the start)'))
+
+
+def report(explorer, elapsed, args):
+    exhausted = not explorer.frontier and not explorer.depth_limited
+    print(f'== {explorer.mode} mode ==')
+    print(f'{explorer.states:,} states, {explorer.transitions:,} transitions in {elapsed:.1f}s '
+          f'({explorer.transitions / elapsed:,.0f}/s), deepest {explorer.max_depth_seen}, '
+          + ('exhaustive' if exhausted else
+             f'not exhaustive ({len(explorer.frontier):,} left in the frontier, '
+             f'{explorer.depth_limited:,} at the depth limit)'))
+    print(f'{explorer.pruned:,} transitions pruned past {args.max_stack} of an item; '
+          f'gold capped at {args.gold_cap}; {args.rolls} rolls')
+    print(f'Visited: {explorer.visited.describe()}; frontier records spilled to disk: '
+          f'{explorer.frontier.spilled:,}')
+
+    print('\nFindings')
+    if not explorer.findings:
+        print('  none')
+    for name, (count, witness) in sorted(explorer.findings.items()):
+        print(f'  {name} ({count:,} transitions): {FINDINGS[name]}')
+        print_route(explorer, witness)
+
+    print('\nGold loops (requests that only add gold)')
+    if not explorer.gold_loops:
+        print('  none')
+    for url, (low, high, witness) in sorted(explorer.gold_loops.items()):
+        print(f'  {url}: +{low}..{high} gold each time')
+        print_route(explorer, witness)
+
+    count, witness = explorer.dead_ends
+    print(f'\nDead ends (every request leads back to the same state): {count:,}')
+    if witness is not None:
+        print_route(explorer, witness)
+
+    missing = sorted(all_facts() - explorer.reached)
+    print('\nUnreachable content' + ('' if exhausted else ' (within the limits)'))
+    print('  ' + (', '.join(missing) if missing else 'none'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Explore the states the web route handlers can reach.')
+    parser.add_argument('--mode', choices=('clicks', 'urls', 'both'), default='both')
+    parser.add_argument('--max-states', type=int, default=200_000, help='stop after this many states')
+    parser.add_argument('--max-depth', type=int, default=12, help='requests from a new player')
+    parser.add_argument('--gold-cap', type=int, default=200, help='gold above this counts as this')
+    parser.add_argument('--max-stack', type=int, default=3, help='ignore holding more of an item than this')
+    parser.add_argument('--rolls', choices=('bounds', 'all'), default='bounds',
+                        help='randint() outcomes to explore: lowest, middle and highest, or all')
+    parser.add_argument('--dfs', action='store_true', help='depth-first instead of breadth-first')
+    parser.add_argument('--bitstate-mb', type=int, help='dedupe in a fixed bitstate table of this size')
+    parser.add_argument('--frontier-memory', type=int, default=100_000,
+                        help='frontier records kept in memory before spilling to disk')
+    args = parser.parse_args(argv)
+
+    modes = ('clicks', 'urls') if args.mode == 'both' else (args.mode,)
+    explorers = {}
+    for mode in modes:
+        visited = BitstateSet(args.bitstate_mb) if args.bitstate_mb else ExactSet()
+        frontier = Stack() if args.dfs else Frontier(args.frontier_memory)
+        explorer = Explorer(mode, args.gold_cap, args.max_stack, args.rolls == 'bounds', visited, frontier)
+        elapsed = explorer.run(args.max_states, args.max_depth)
+        report(explorer, elapsed, args)
+        print()
+        explorers[mode] = explorer
+
+    if len(explorers) == 2:
+        only_urls = sorted(explorers['urls'].reached - explorers['clicks'].reached)
+        print('Reached only by typing URLs')
+        print('  ' + (', '.join(only_urls) if only_urls else 'none'))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'\nPeak memory: {peak / 1024:.0f} MB')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
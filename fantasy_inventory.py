@@ -0,0 +1,148 @@
+"""
+Inventory shared by the CLI and web versions.
+
+Items are stacked: the inventory is a table from integer item ID to
+count, so checking, adding and removing an item are constant-time no
+matter how many potions a player hoards. Stacks keep the order in which
+they were first acquired, which is the order they are displayed in.
+"""
+
+import fantasy_content as content
+
+# Item names by ID, and IDs by name (IDs are defined in fantasy_content)
+ITEMS = tuple(item.name if item else None for item in content.ITEMS_BY_ID)
+ITEM_IDS = {item.name: item.id for item in content.ITEMS.values()}
+
+# Items that can be used from the inventory
+USABLE_ITEMS = frozenset(item.name for item in content.ITEMS.values() if item.usable)
+
+STACK_LIMIT = 99  # most of one item a player can carry
+CAPACITY = 20     # most different items a player can carry
+
+
+class Inventory:
+    """A multiset of items backed by an item-ID to count table."""
+
+    __slots__ = ('_counts', 'capacity', '_usable', '_key')
+
+    def __init__(self, items=(), capacity=CAPACITY):
+        """
+        Create an inventory.
+
+        Args:
+            items: Item names to start with, repeats allowed
+            capacity: Most different items the inventory can hold
+        """
+        self._counts = {}
+        self.capacity = capacity
+        self._invalidate()
+        for name in items:
+            self.add(name)
+
+    @classmethod
+    def from_stacks(cls, stacks):
+        """Build an inventory from (item ID, count) pairs."""
+        inventory = cls()
+        for item_id, count in stacks:
+            inventory._counts[item_id] = inventory._counts.get(item_id, 0) + count
+        return inventory
+
+    def _invalidate(self):
+        self._usable = None
+        self._key = None
+
+    def count(self, name):
+        """Return how many of an item the inventory holds."""
+        return self._counts.get(ITEM_IDS[name], 0)
+
+    def has(self, name):
+        """Return True if the inventory holds at least one of an item."""
+        return ITEM_IDS[name] in self._counts
+
+    __contains__ = has
+
+    def can_add(self, name, count=1):
+        """Return True if `count` more of an item would fit."""
+        item_id = ITEM_IDS[name]
+        held = self._counts.get(item_id, 0)
+        if held == 0 and len(self._counts) >= self.capacity:
+            return False
+        return held + count <= STACK_LIMIT
+
+    def add(self, name, count=1):
+        """
+        Add items to the inventory.
+
+        Raises:
+            ValueError: If the stack limit or capacity would be exceeded
+        """
+        if not self.can_add(name, count):
+            raise ValueError(f"No room for {count} more {name}")
+        item_id = ITEM_IDS[name]
+        self._counts[item_id] = self._counts.get(item_id, 0) + count
+        self._invalidate()
+
+    def remove(self, name, count=1):
+        """
+        Remove items from the inventory.
+
+        Raises:
+            ValueError: If the inventory holds fewer than `count`
+        """
+        item_id = ITEM_IDS[name]
+        held = self._counts.get(item_id, 0)
+        if held < count:
+            raise ValueError(f"Inventory has only {held} {name}")
+        if held == count:
+            del self._counts[item_id]
+        else:
+            self._counts[item_id] = held - count
+        self._invalidate()
+
+    def usable(self):
+        """Return the names of held items that can be used, cached until the next change."""
+        if self._usable is None:
+            self._usable = tuple(name for name in self.names() if name in USABLE_ITEMS)
+        return self._usable
+
+    def names(self):
+        """Return the distinct item names held, in acquisition order."""
+        return [ITEMS[item_id] for item_id in self._counts]
+
+    def stacks(self):
+        """Return (item ID, count) pairs, in acquisition order."""
+        return list(self._counts.items())
+
+    def elements(self):
+        """Yield every item name, repeated as many times as it is held."""
+        for item_id, count in self._counts.items():
+            for _ in range(count):
+                yield ITEMS[item_id]
+
+    def key(self):
+        """Return a hashable snapshot of the contents, e.g. for cache keys."""
+        if self._key is None:
+            self._key = tuple(self._counts.items())
+        return self._key
+
+    def describe(self):
+        """Return the contents as text, e.g. 'Rusty Dagger, Health Potion x3'."""
+        parts = []
+        for item_id, count in self._counts.items():
+            name = ITEMS[item_id]
+            parts.append(f"{name} x{count}" if count > 1 else name)
+        return ', '.join(parts) if parts else 'Empty'
+
+    def __len__(self):
+        return sum(self._counts.values())
+
+    def __bool__(self):
+        return bool(self._counts)
+
+    def __eq__(self, other):
+        if not isinstance(other, Inventory):
+            return NotImplemented
+        return self._counts == other._counts
+
+    def __repr__(self):
+        return f"Inventory({self.describe()!r})"
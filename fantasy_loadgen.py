@@ -0,0 +1,445 @@
+"""
+Load generator for the web version: many virtual players at a target request rate.
+
+Each virtual player has its own cookie jar and plays one game as a
+weighted walk over the real routes. On every page it picks one of the
+links and forms that page offers, so it only attacks during a fight and
+only buys in the shop, with the weight of the route (see WEIGHTS and
+--weight):
+    /  /start  /location/<x>  /combat/<enemy>  /attack/<enemy>  /flee
+    /use_potion_combat  /auto_battle  /shop  /buy/<item>  /status  /reset
+Between clicks it thinks for an exponentially distributed time
+(--think on average), and it leaves after --clicks requests or an error.
+
+The load is open-loop: players arrive as a Poisson process at
+--rate / --clicks per second, which settles at --rate requests per
+second after about --clicks x --think seconds, whatever the latency. A
+slow server gets a queue, not a lighter load, and latency is measured
+from the moment a request was due, not from when it could be sent.
+
+Two targets:
+    inprocess   Flask's test client, in this process. Requests run one at
+                a time and their service times are measured; a virtual
+                clock queues them for --workers servers at the arrival
+                times (an M/G/k queue), so the run takes only as long as
+                the work and planning needs no sockets.
+    URL         a live server such as http://127.0.0.1:8000, driven from
+                an asyncio loop with one connection per request
+The report gives, for every route: requests, errors (HTTP 4xx/5xx,
+timeouts, failed connections), p50/p95/p99 latency, and the session
+size after the request, meaning the cookie the player sends back plus the player
+record and action log in the session store. The store is the app's own
+in process, or --store (the live server's SQLite store) for a URL;
+without it only the cookie is reported.
+
+Usage:
+    python fantasy_loadgen.py inprocess --rate 200 --duration 60 --workers 2
+    python fantasy_loadgen.py http://127.0.0.1:8000 --rate 300 --think 5 --store sqlite:sessions.db
+    python fantasy_loadgen.py inprocess --weight attack=30 --weight shop=0
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import re
+import sys
+import time
+import zlib
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from itsdangerous import base64_decode
+
+import fantasy_sessions as sessions
+
+# Route of each first path segment, and the report's name for it
+ROUTES = {
+    '': '/',
+    'start': '/start',
+    'location': '/location/<x>',
+    'combat': '/combat/<enemy>',
+    'attack': '/attack/<enemy>',
+    'flee': '/flee',
+    'use_potion_combat': '/use_potion_combat',
+    'auto_battle': '/auto_battle',
+    'shop': '/shop',
+    'buy': '/buy/<item>',
+    'status': '/status',
+    'reset': '/reset',
+}
+
+# How likely a player is to take each route the page offers, relative to the others
+WEIGHTS = {
+    '': 1,
+    'start': 1,
+    'location': 4,
+    'combat': 3,
+    'attack': 12,
+    'flee': 1,
+    'use_potion_combat': 2,
+    'auto_battle': 0.5,
+    'shop': 1,
+    'buy': 1,
+    'status': 1,
+    'reset': 0.1,
+}
+
+_LINK = re.compile(r'href="(/[^"]*)"')
+_FORM = re.compile(r'<form action="(/[^"]*)" method="POST"[^>]*>(.*?)</form>', re.S)
+_INPUT = re.compile(r'<input [^>]*name="(\w+)"(?: value="([^"]*)")?')
+
+SESSION_COOKIE = 'session'
+FORM_TYPE = 'application/x-www-form-urlencoded'
+# What a failed live request raises
+FETCH_ERRORS = (OSError, EOFError, ValueError, IndexError, asyncio.LimitOverrunError, asyncio.TimeoutError)
+
+
+def route_of(path):
+    """Return the ROUTES key of a request path."""
+    return path.split('?', 1)[0].split('/')[1]
+
+
+def page_requests(html, name):
+    """
+    List the requests a page offers: its links, and its forms filled in.
+
+    Args:
+        html: The page
+        name: Player name to type into the name field of the title page
+
+    Returns:
+        List of (method, path, form fields or None)
+    """
+    options = [('GET', path, None) for path in _LINK.findall(html)
+               if route_of(path) in ROUTES]
+    for action, body in _FORM.findall(html):
+        fields = {field: value for field, value in _INPUT.findall(body)}
+        if 'player_name' in fields:
+            fields['player_name'] = name
+        options.append(('POST', action, fields))
+    return options
+
+
+def session_ids(cookie):
+    """
+    Return the session ID and action log ID a Flask session cookie holds.
+
+    The payload is read without checking the signature, which only the
+    server can do; it is this player's own cookie.
+    """
+    payload = cookie.rsplit('.', 2)[0]
+    data = base64_decode(payload.lstrip('.'))
+    if payload.startswith('.'):
+        data = zlib.decompress(data)
+    fields = json.loads(data)
+    return fields.get('sid'), fields.get('log')
+
+
+def session_size(cookie, store):
+    """
+    Measure a player's session.
+
+    Args:
+        cookie: Value of the session cookie, or None
+        store: The server's SessionStore, or None if it cannot be read
+
+    Returns:
+        (cookie bytes, player record bytes, action log bytes); the last
+        two are None without a store
+    """
+    if not cookie:
+        return 0, (0 if store else None), (0 if store else None)
+    size = len(SESSION_COOKIE) + 1 + len(cookie)
+    if store is None:
+        return size, None, None
+    sid, log = session_ids(cookie)
+    state = store.load(sid) if sid else None
+    entries = store.load('log:' + log) if log else None
+    return size, len(state or b''), len(entries or b'')
+
+
+class Player:
+    """A virtual player: the requests its current page offers, and how it picks one."""
+
+    def __init__(self, number, rng, weights, clicks, think):
+        self.name = f'Player{number}'
+        self.rng = rng
+        self.weights = weights
+        self.clicks = clicks  # requests left
+        self.mean_think = think
+        self.options = [('GET', '/', None)]
+
+    def next_request(self):
+        """Pick the next click: (method, path, form fields or None)."""
+        self.clicks -= 1
+        weights = [self.weights[route_of(path)] for _, path, _ in self.options]
+        if not any(weights):
+            return self.rng.choice(self.options)
+        return self.rng.choices(self.options, weights)[0]
+
+    def read_page(self, html):
+        self.options = page_requests(html, self.name) or [('GET', '/', None)]
+
+    def think(self):
+        """Return the seconds until the next click."""
+        return self.rng.expovariate(1 / self.mean_think) if self.mean_think > 0 else 0.0
+
+
+class Results:
+    """Latencies, errors and session sizes per route."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sizes = defaultdict(list)
+        self.players = 0
+        self.active = 0
+        self.peak = 0
+
+    def record(self, path, latency, ok, size=None):
+        route = route_of(path)
+        self.latencies[route].append(latency)
+        if not ok:
+            self.errors[route] += 1
+        if size is not None:
+            self.sizes[route].append(size)
+
+    def player_joined(self):
+        self.players += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+    def player_left(self):
+        self.active -= 1
+
+
+def player_arrivals(rng, rate, clicks, duration):
+    """Yield the arrival times of players, a Poisson process that gives `rate` requests per second."""
+    t = rng.expovariate(rate / clicks)
+    while t < duration:
+        yield t
+        t += rng.expovariate(rate / clicks)
+
+
+# ============================================================================
+# IN PROCESS: TEST CLIENT AND A VIRTUAL CLOCK
+# ============================================================================
+
+def run_inprocess(args, weights, results):
+    """
+    Play every virtual player through the test client, one request at a time.
+
+    Requests run in the order they fall due. Each starts on the first of
+    --workers virtual servers to come free, no earlier than it is due,
+    and keeps it busy for the service time measured for it.
+    """
+    import fantasy_adventure_web as web
+
+    rng = random.Random(args.seed)
+    due = []  # (time due, player number, player, client)
+    for number, arrival in enumerate(player_arrivals(rng, args.rate, args.clicks, args.duration)):
+        player = Player(number, rng, weights, args.clicks, args.think)
+        heapq.heappush(due, (arrival, number, player, None))
+    free = [0.0] * args.workers  # when each virtual server comes free
+
+    while due:
+        when, number, player, client = heapq.heappop(due)
+        if client is None:
+            client = web.app.test_client()
+            results.player_joined()
+        method, path, fields = player.next_request()
+        start = max(when, free[0])
+        began = time.perf_counter()
+        response = client.open(path, method=method, data=fields)
+        body = response.get_data(as_text=True)
+        done = start + time.perf_counter() - began
+        heapq.heapreplace(free, done)
+
+        ok = response.status_code < 400
+        cookie = client.get_cookie(SESSION_COOKIE)
+        results.record(path, done - when, ok, session_size(cookie and cookie.value, web.store))
+        player.read_page(body)
+        later = done + player.think()
+        if ok and player.clicks and later < args.duration:
+            heapq.heappush(due, (later, number, player, client))
+        else:
+            results.player_left()
+
+
+# ============================================================================
+# LIVE: ASYNCIO HTTP CLIENT
+# ============================================================================
+
+async def fetch(host, port, method, path, cookie, body=b'', content_type=None):
+    """
+    Send one HTTP/1.0 request on a new connection.
+
+    Returns:
+        (status, Set-Cookie values, body)
+    """
+    head = [f'{method} {path} HTTP/1.0', f'Host: {host}:{port}']
+    if cookie:
+        head.append(f'Cookie: {cookie}')
+    if content_type:
+        head += [f'Content-Type: {content_type}', f'Content-Length: {len(body)}']
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        lines = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        headers = [line.partition(':')[::2] for line in lines[1:] if line]
+        length = [int(value) for name, value in headers if name.lower() == 'content-length']
+        # Stop at the end of the body, as browsers do, rather than wait for
+        # the server to close the connection
+        body = await reader.readexactly(length[0]) if length else await reader.read()
+    finally:
+        writer.close()
+    cookies = [value.strip() for name, value in headers if name.lower() == 'set-cookie']
+    return int(lines[0].split()[1]), cookies, body
+
+
+def update_jar(jar, set_cookies):
+    for header in set_cookies:
+        name, _, value = header.split(';', 1)[0].partition('=')
+        if value:
+            jar[name] = value
+        else:
+            jar.pop(name, None)  # cleared by the server
+
+
+async def play_live(host, port, player, due, deadline, args, store, results):
+    loop = asyncio.get_running_loop()
+    jar = {}
+    results.player_joined()
+    try:
+        while player.clicks and due < deadline:
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            method, path, fields = player.next_request()
+            cookie = '; '.join(f'{name}={value}' for name, value in jar.items())
+            body, content_type = b'', None
+            if fields is not None:
+                body, content_type = urlencode(fields).encode(), FORM_TYPE
+            try:
+                status, set_cookies, body = await asyncio.wait_for(
+                    fetch(host, port, method, path, cookie, body, content_type), args.timeout)
+            except FETCH_ERRORS:
+                results.record(path, loop.time() - due, False)
+                return
+            done = loop.time()
+            update_jar(jar, set_cookies)
+            ok = status < 400
+            results.record(path, done - due, ok, session_size(jar.get(SESSION_COOKIE), store))
+            if not ok:
+                return
+            player.read_page(body.decode('utf-8', 'replace'))
+            due = done + player.think()
+    finally:
+        results.player_left()
+
+
+async def run_live(args, weights, results):
+    """Start virtual players against a live server as they arrive, and wait for them all."""
+    from fantasy_server import raise_file_limit
+
+    raise_file_limit()
+    url = urlsplit(args.target)
+    host, port = url.hostname or '127.0.0.1', url.port or 80
+    store = sessions.create_store(args.store) if args.store else None
+    rng = random.Random(args.seed)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + args.duration
+    tasks = []
+    for number, arrival in enumerate(player_arrivals(rng, args.rate, args.clicks, args.duration)):
+        await asyncio.sleep(max(0.0, start + arrival - loop.time()))
+        player = Player(number, rng, weights, args.clicks, args.think)
+        tasks.append(asyncio.create_task(
+            play_live(host, port, player, start + arrival, deadline, args, store, results)))
+    await asyncio.gather(*tasks)
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def mean_column(values, width):
+    values = [v for v in values if v is not None]
+    return f'{sum(values) / len(values):>{width},.0f}' if values else f"{'-':>{width}}"
+
+
+def print_report(results, duration):
+    total = sum(len(v) for v in results.latencies.values())
+    errors = sum(results.errors.values())
+    print(f'{results.players:,} players (peak {results.peak:,} at once), {total:,} requests, '
+          f'{total / duration:,.1f} req/s, {errors:,} errors')
+    print(f"{'route':<20}{'requests':>9}{'err %':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'cookie B':>10}{'state B':>9}{'log B':>8}")
+    rows = [key for key in ROUTES if key in results.latencies] + [None]
+    for key in rows:
+        if key is None:
+            label = 'all'
+            latencies = [t for v in results.latencies.values() for t in v]
+            failed = errors
+            sizes = [s for v in results.sizes.values() for s in v]
+        else:
+            label = ROUTES[key]
+            latencies = results.latencies[key]
+            failed = results.errors[key]
+            sizes = results.sizes[key]
+        latencies = sorted(latencies)
+        print(f'{label:<20}{len(latencies):>9,}{100 * failed / max(1, len(latencies)):>7.2f}'
+              f'{percentile(latencies, 0.50) * 1e3:>9.2f}{percentile(latencies, 0.95) * 1e3:>9.2f}'
+              f'{percentile(latencies, 0.99) * 1e3:>9.2f}'
+              f'{mean_column([s[0] for s in sizes], 10)}{mean_column([s[1] for s in sizes], 9)}'
+              f'{mean_column([s[2] for s in sizes], 8)}')
+
+
+def parse_weight(text):
+    route, _, weight = text.partition('=')
+    route = route.strip('/')
+    if route not in ROUTES:
+        raise argparse.ArgumentTypeError(f"unknown route {route!r}; one of {', '.join(k or '/' for k in ROUTES)}")
+    try:
+        return route, float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'bad weight in {text!r}') from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Drive the web version with many virtual players at a target rate.')
+    parser.add_argument('target', help="'inprocess' for Flask's test client, or the URL of a live server")
+    parser.add_argument('--rate', type=float, default=100.0, help='target requests per second (default: 100)')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of load (default: 60)')
+    parser.add_argument('--clicks', type=int, default=20, help='requests per player (default: 20)')
+    parser.add_argument('--think', type=float, default=1.0, help='mean seconds between clicks (default: 1)')
+    parser.add_argument('--weight', type=parse_weight, action='append', default=[], metavar='ROUTE=W',
+                        help='weight of a route, e.g. attack=20 or /=0 (repeatable)')
+    parser.add_argument('--workers', type=int, default=1, help='virtual servers, in process (default: 1)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds before a live request fails')
+    parser.add_argument('--store', help='session store of the live server, to measure sessions (sqlite:<path>)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of arrivals and walks')
+    args = parser.parse_args(argv)
+    if args.rate <= 0 or args.clicks < 1 or args.workers < 1:
+        parser.error('--rate, --clicks and --workers must be positive')
+    weights = dict(WEIGHTS, **dict(args.weight))
+
+    results = Results()
+    if args.target == 'inprocess':
+        run_inprocess(args, weights, results)
+        print(f'in process, {args.workers} virtual server(s), target {args.rate:g} req/s')
+    else:
+        if not args.target.startswith('http://'):
+            parser.error("target must be 'inprocess' or an http:// URL")
+        asyncio.run(run_live(args, weights, results))
+        print(f'{args.target}, target {args.rate:g} req/s')
+    print_report(results, args.duration)
+    return 1 if not results.players else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
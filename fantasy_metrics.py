@@ -0,0 +1,335 @@
+"""
+Low-overhead metrics for the web version, exported in Prometheus text format.
+
+Every metric is declared up front with all the label values it can take
+(routes, enemies, caches), so every series has a fixed slot in one flat
+array of float64s. Counting is an index update on that array. A
+histogram observation is only appended to a list of the series, which
+the next sync() buckets, one bisect and two updates per value: that
+keeps the bisect and the indexing off the request path.
+
+With several worker processes, set SHADOWMERE_METRICS_DIR (fantasy_serve.py
+sets it to a fresh temporary directory): each process then keeps its
+array in a memory-mapped file <pid>.metrics there, opened again after a
+fork, and a scrape adds up the files of all processes. The files of
+processes that have exited are folded into archive.metrics by the next
+scrape, so counts survive workers being replaced. Each file starts with a
+hash of the metric layout; files written with a different layout, say by
+an older deploy into the same directory, are skipped. Without the
+directory the array is private memory, which is right for a single
+process such as the debug server.
+
+Counts that a process keeps elsewhere, such as the fragment caches' hits,
+are copied in by functions given to Registry.add_sync(). sync() runs them,
+then buckets the histograms' observations; the app calls it at most
+once every SYNC_SECONDS, a scrape calls it before reading, and
+fantasy_serve.py calls it in a worker that is idle or about to exit.
+
+Updates are not locked: prefork workers run one request at a time, and
+under the threaded debug server a race can at worst lose an increment or
+bucket an observation twice.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left
+
+log = logging.getLogger('shadowmere.metrics')
+
+METRICS_MAGIC = b'SMMETRIC'
+_HEADER = struct.Struct('<8s8s')  # magic, layout hash
+ARCHIVE = 'archive.metrics'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SYNC_SECONDS = 1.0  # how stale the shared values of a busy process may get
+
+# Upper bounds of histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+BYTES_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+
+class Counter:
+    """One counter series."""
+
+    __slots__ = ('registry', 'offset')
+
+    def __init__(self, registry, offset):
+        self.registry = registry
+        self.offset = offset
+
+    def inc(self, amount=1):
+        self.registry.values[self.offset] += amount
+
+    def set(self, value):
+        """Set the count, for mirroring a counter kept elsewhere in this process."""
+        self.registry.values[self.offset] = value
+
+
+class Histogram:
+    """
+    One histogram series: a slot per bucket (not cumulative), then the sum.
+
+    observe(value) is the bound append of `pending`, the values flush()
+    has not bucketed yet, so observing costs one call of a builtin.
+    """
+
+    __slots__ = ('registry', 'offset', 'bounds', 'total', 'pending', 'observe')
+
+    def __init__(self, registry, offset, bounds):
+        self.registry = registry
+        self.offset = offset
+        self.bounds = bounds
+        self.total = offset + len(bounds) + 1
+        self.pending = []
+        self.observe = self.pending.append
+
+    def flush(self):
+        """Bucket the values observed since the last flush."""
+        batch = self.pending[:]
+        if not batch:
+            return
+        del self.pending[:len(batch)]  # values appended by another thread meanwhile wait for the next flush
+        values, offset, bounds = self.registry.values, self.offset, self.bounds
+        for value in batch:
+            values[offset + bisect_left(bounds, value)] += 1
+        values[self.total] += sum(batch)
+
+
+class Family(dict):
+    """A metric: its series (Counters or Histograms) by label value."""
+
+    def __init__(self, name, help, kind, label, series):
+        super().__init__(series)
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label = label
+
+
+class Registry:
+    """Declares metrics, holds their values, and adds up those of every process."""
+
+    def __init__(self):
+        self.families = []
+        self.size = 0
+        self.values = None
+        self.directory = None
+        self.syncs = []
+        self.next_sync = 0.0  # time.perf_counter() after which sync() is due
+        self._header = None
+
+    def _declare(self, name, help, kind, label, values, make, slots):
+        if self.values is not None:
+            raise RuntimeError(f'metric {name} declared after the registry was started')
+        series = {}
+        for value in values if label else (None,):
+            series[value] = make(self.size)
+            self.size += slots
+        family = Family(name, help, kind, label, series)
+        self.families.append(family)
+        return family if label else series[None]
+
+    def counter(self, name, help, label=None, values=()):
+        """
+        Declare a counter.
+
+        Args:
+            name: Metric name, ending in _total
+            help: One-line description
+            label: Name of the label, or None for a single series
+            values: Every value the label can take
+
+        Returns:
+            A Family of Counters indexed by label value, or the Counter
+            itself without a label
+        """
+        return self._declare(name, help, 'counter', label, values, lambda offset: Counter(self, offset), 1)
+
+    def histogram(self, name, help, buckets, label=None, values=()):
+        """Declare a histogram with the given bucket bounds; as counter()."""
+        buckets = tuple(buckets)
+        return self._declare(name, help, 'histogram', label, values,
+                             lambda offset: Histogram(self, offset, buckets), len(buckets) + 2)
+
+    def layout(self):
+        """Return a hash of every metric's name, labels and buckets."""
+        description = [(f.name, f.kind, f.label, [(value, getattr(s, 'bounds', None)) for value, s in f.items()])
+                       for f in self.families]
+        return hashlib.blake2b(repr(description).encode(), digest_size=8).digest()
+
+    def start(self, directory=None):
+        """
+        Allocate the values once every metric is declared.
+
+        Args:
+            directory: Where processes share their values, or None to keep
+                       them private to this process
+        """
+        self.directory = directory
+        self._header = _HEADER.pack(METRICS_MAGIC, self.layout())
+        if directory is None:
+            self.values = memoryview(bytearray(8 * self.size)).cast('d')
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._open_process_file()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._open_process_file)
+
+    def add_sync(self, function):
+        """Have sync() call `function`, which copies counts kept elsewhere in this process in, or observes them."""
+        self.syncs.append(function)
+
+    def histograms(self):
+        """Yield every histogram series."""
+        for family in self.families:
+            if family.kind == 'histogram':
+                yield from family.values()
+
+    def sync(self):
+        """Copy in the counts kept elsewhere and bucket pending observations; due again SYNC_SECONDS later."""
+        self.next_sync = time.perf_counter() + SYNC_SECONDS
+        for function in self.syncs:
+            function()
+        for series in self.histograms():
+            series.flush()
+
+    def reset(self):
+        """Zero this process's values, e.g. after warming up before serving, pending ones included."""
+        self.sync()
+        for i in range(self.size):
+            self.values[i] = 0.0
+
+    # ------------------------------------------------------------------------
+    # Files shared between processes
+    # ------------------------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _lock(self):
+        """Return an open file holding the directory's lock; closing it releases the lock."""
+        import fcntl
+
+        f = open(self._path('.lock'), 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _open_process_file(self):
+        path = self._path(f'{os.getpid()}.metrics')
+        with self._lock():
+            if os.path.exists(path):  # left by an earlier process with the same pid
+                self._fold([path])
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                os.ftruncate(fd, _HEADER.size + 8 * self.size)
+                mapping = mmap.mmap(fd, _HEADER.size + 8 * self.size)
+            finally:
+                os.close(fd)
+            mapping[:_HEADER.size] = self._header
+        self.values = memoryview(mapping)[_HEADER.size:].cast('d')
+
+    def _read(self, path):
+        """Return the values in a metrics file, or None if it is not of this layout."""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) != _HEADER.size + 8 * self.size or data[:_HEADER.size] != self._header:
+            return None
+        return memoryview(data)[_HEADER.size:].cast('d')
+
+    def _fold(self, paths):
+        """Add the files at `paths` into the archive and delete them; the lock must be held."""
+        archive = self._read(self._path(ARCHIVE))
+        total = list(archive) if archive is not None else [0.0] * self.size
+        for path in paths:
+            values = self._read(path)
+            if values is not None:
+                total = [a + b for a, b in zip(total, values)]
+        tmp = self._path(ARCHIVE + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(self._header)
+            f.write(struct.pack(f'<{self.size}d', *total))
+        os.replace(tmp, self._path(ARCHIVE))
+        for path in paths:
+            os.unlink(path)
+
+    def collect(self):
+        """Return the values added up over every process, past and present."""
+        if self.directory is None:
+            return list(self.values)
+        with self._lock():
+            exited = []
+            for name in os.listdir(self.directory):
+                pid = name[:-len('.metrics')]
+                if name.endswith('.metrics') and pid.isdigit() and not process_exists(int(pid)):
+                    exited.append(self._path(name))
+            if exited:
+                self._fold(exited)
+            total = [0.0] * self.size
+            for name in os.listdir(self.directory):
+                if name.endswith('.metrics'):
+                    values = self._read(self._path(name))
+                    if values is None:
+                        log.warning('skipping %s: written with another metric layout', name)
+                        continue
+                    total = [a + b for a, b in zip(total, values)]
+        return total
+
+    # ------------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------------
+
+    def exposition(self):
+        """Render every series in the Prometheus text format; series never observed are left out."""
+        self.sync()
+        values = self.collect()
+        lines = []
+        for family in self.families:
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for value, series in family.items():
+                labels = f'{family.label}="{escape(value)}"' if family.label else ''
+                if family.kind == 'counter':
+                    if values[series.offset] or not family.label:
+                        lines.append(f'{family.name}{braces(labels)} {number(values[series.offset])}')
+                    continue
+                buckets = values[series.offset:series.total]
+                count = sum(buckets)
+                if not count:
+                    continue
+                prefix = labels + ',' if labels else ''
+                cumulative = 0.0
+                for bound, n in zip(series.bounds + (float('inf'),), buckets):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else number(bound)
+                    lines.append(f'{family.name}_bucket{{{prefix}le="{le}"}} {number(cumulative)}')
+                lines.append(f'{family.name}_sum{braces(labels)} {number(values[series.total])}')
+                lines.append(f'{family.name}_count{braces(labels)} {number(count)}')
+        return '\n'.join(lines) + '\n'
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def braces(labels):
+    return f'{{{labels}}}' if labels else ''
+
+
+def number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,346 @@
+"""
+Content packs: enemies, items and locations defined in JSON or TOML files.
+
+A pack is a file with any of three top-level lists. Every entry has the
+same fields as the matching record in fantasy_content:
+
+    [[enemies]]
+    key = "troll"
+    id = 100
+    name = "Cave Troll"
+    health = 60
+    attack = 14
+    gold = 30
+
+    [[locations]]
+    key = "swamp"
+    id = 10
+    name = "Murky Swamp"
+    description = "Fog hangs over black water."
+    action = "🐸 Wade into the Murky Swamp"
+    encounters = [
+        { kind = "fight", enemy = "troll", weight = 2 },
+        { kind = "treasure", min_gold = 5, max_gold = 20 },
+    ]
+
+An entry whose key already exists replaces that record and must keep its
+ID. New entries need a new, unique ID; IDs are what saved sessions store.
+The game refers to a few items by name (the starting Rusty Dagger, the
+Health Potion and the Crystal Sword), so a pack may change those items'
+stats but not their names; see FIXED_NAMES. The village, the cave and the
+dragon's lair play out as the game scripts them, so a pack may not give
+them encounters; see SCRIPTED_LOCATIONS. Stats, prices and amounts may
+not be negative, and enemies need some health.
+
+Packs are read from the directories or files listed in the
+SHADOWMERE_CONTENT_PACKS environment variable (separated like PATH),
+or from ./packs if that variable is unset. Loading is cached: the
+validated result is pickled under .content-cache, keyed by the built-in
+content, each file's size and mtime and, if those changed, each file's
+SHA-256. Unchanged packs are therefore never re-parsed or re-validated.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+import tomllib
+import types
+import typing
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PACK_DIR = os.path.join(BASE_DIR, 'packs')
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, '.content-cache')
+PACK_EXTENSIONS = ('.json', '.toml')
+
+CACHE_FORMAT = 3
+MAX_ID = 0xFFFF  # IDs are stored as u16 in saved sessions
+
+# Records whose names the game code uses, by section; packs may not rename them
+FIXED_NAMES = {'items': ('dagger', 'potion', 'crystal_sword')}
+
+# Locations fantasy_actions.explore() plays out itself, ignoring encounters
+SCRIPTED_LOCATIONS = ('village', 'cave', 'dragon')
+
+# Fields that may not be negative, by record kind (None, e.g. an unsold item's price, is fine)
+NOT_NEGATIVE = {
+    'enemy': ('attack', 'gold'),
+    'item': ('price', 'attack', 'defense', 'max_health', 'heal'),
+}
+
+
+class PackError(ValueError):
+    """A content pack is malformed or inconsistent."""
+
+
+# ============================================================================
+# DISCOVERY AND PARSING
+# ============================================================================
+
+def pack_paths():
+    """Return the configured pack directories and files."""
+    configured = os.environ.get('SHADOWMERE_CONTENT_PACKS')
+    if configured is None:
+        return [DEFAULT_PACK_DIR]
+    return [path for path in configured.split(os.pathsep) if path]
+
+
+def pack_files(paths):
+    """
+    List pack files, in load order.
+
+    Args:
+        paths: Directories (scanned for .json/.toml, sorted by name) or files
+
+    Returns:
+        Absolute file paths; later packs override earlier ones
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(PACK_EXTENSIONS):
+                    files.append(os.path.abspath(os.path.join(path, name)))
+        elif os.path.isfile(path):
+            files.append(os.path.abspath(path))
+        elif path != DEFAULT_PACK_DIR:
+            raise PackError(f"Content pack path does not exist: {path}")
+    return files
+
+
+def read_pack(path, data=None):
+    """Parse a pack file into a dictionary."""
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    try:
+        if path.endswith('.toml'):
+            return tomllib.loads(data.decode('utf-8'))
+        return json.loads(data)
+    except (ValueError, UnicodeDecodeError) as error:
+        raise PackError(f"{path}: {error}") from None
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def _check_type(value, annotation, where):
+    allowed = typing.get_args(annotation) if isinstance(annotation, types.UnionType) else (annotation,)
+    allowed = tuple(type(None) if t is None else t for t in allowed)
+    # bool is a subclass of int, but True is not a sensible attack value
+    if isinstance(value, bool) and bool not in allowed:
+        raise PackError(f"{where}: expected {annotation}, got {value!r}")
+    if not isinstance(value, allowed):
+        raise PackError(f"{where}: expected {annotation}, got {value!r}")
+
+
+def build_record(cls, entry, where, record_types):
+    """
+    Validate one pack entry and turn it into a record.
+
+    Args:
+        cls: Record class, e.g. fantasy_content.Enemy
+        entry: The entry's dictionary from the pack
+        where: Description of the entry for error messages
+        record_types: Record classes by section name; 'encounters' is
+                      used for a location's nested encounter list
+
+    Returns:
+        An instance of cls
+    """
+    if not isinstance(entry, dict):
+        raise PackError(f"{where}: expected a table, got {entry!r}")
+    fields = {f.name: f for f in dataclasses.fields(cls) if f.init}
+    unknown = entry.keys() - fields.keys()
+    if unknown:
+        raise PackError(f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+
+    values = {}
+    for name, f in fields.items():
+        if name not in entry:
+            if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING:
+                raise PackError(f"{where}: missing field '{name}'")
+            continue
+        value = entry[name]
+        if name == 'encounters':
+            if not isinstance(value, list):
+                raise PackError(f"{where}.encounters: expected a list")
+            value = tuple(build_record(record_types['encounters'], e, f"{where}.encounters[{i}]", record_types)
+                          for i, e in enumerate(value))
+        else:
+            _check_type(value, f.type, f"{where}.{name}")
+        values[name] = value
+    return cls(**values)
+
+
+def compile_pack(path, data, record_types):
+    """Turn a parsed pack into records by section, validating every entry."""
+    if not isinstance(data, dict):
+        raise PackError(f"{path}: a pack must be a table of sections")
+    sections = {}
+    for section, entries in data.items():
+        if section not in record_types or section == 'encounters':
+            raise PackError(f"{path}: unknown section '{section}'")
+        if not isinstance(entries, list):
+            raise PackError(f"{path}: '{section}' must be a list")
+        cls = record_types[section]
+        sections[section] = [build_record(cls, entry, f"{path}:{section}[{i}]", record_types)
+                             for i, entry in enumerate(entries)]
+    return sections
+
+
+def merge(builtins, packs):
+    """
+    Merge pack records over the built-in ones and check references.
+
+    Args:
+        builtins: Built-in records by section
+        packs: (path, records by section) pairs in load order
+
+    Returns:
+        Lists of records by section
+    """
+    merged = {section: {record.key: record for record in records} for section, records in builtins.items()}
+
+    for path, sections in packs:
+        for section, records in sections.items():
+            table = merged[section]
+            for record in records:
+                existing = table.get(record.key)
+                if existing is not None and existing.id != record.id:
+                    raise PackError(f"{path}: {section} '{record.key}' must keep ID {existing.id}")
+                if record.key in FIXED_NAMES.get(section, ()) and existing.name != record.name:
+                    raise PackError(f"{path}: {section} '{record.key}' must keep the name '{existing.name}'")
+                table[record.key] = record
+
+    for section, table in merged.items():
+        seen = {}
+        for record in table.values():
+            if not 0 < record.id <= MAX_ID:
+                raise PackError(f"{section} '{record.key}': ID {record.id} is outside 1..{MAX_ID}")
+            if record.id in seen:
+                raise PackError(f"{section} '{record.key}' and '{seen[record.id]}' share ID {record.id}")
+            seen[record.id] = record.key
+
+    enemies, items = merged['enemies'], merged['items']
+    for label, table in (('enemy', enemies), ('item', items)):
+        for record in table.values():
+            for name in NOT_NEGATIVE[label]:
+                value = getattr(record, name)
+                if value is not None and value < 0:
+                    raise PackError(f"{label} '{record.key}': {name} must not be negative")
+    for enemy in enemies.values():
+        if enemy.health <= 0:
+            raise PackError(f"enemy '{enemy.key}': health must be positive")
+        if enemy.reward_item is not None and enemy.reward_item not in items:
+            raise PackError(f"enemy '{enemy.key}': unknown reward_item '{enemy.reward_item}'")
+    for location in merged['locations'].values():
+        if location.key in SCRIPTED_LOCATIONS and location.encounters:
+            raise PackError(f"location '{location.key}': the game scripts it, so it cannot have encounters")
+        for encounter in location.encounters:
+            where = f"location '{location.key}'"
+            if encounter.kind not in encounter.KINDS:
+                raise PackError(f"{where}: unknown encounter kind '{encounter.kind}'")
+            if encounter.weight < 1:
+                raise PackError(f"{where}: encounter weight must be at least 1")
+            if encounter.kind == 'fight' and encounter.enemy not in enemies:
+                raise PackError(f"{where}: unknown enemy '{encounter.enemy}'")
+            if encounter.kind == 'heal' and encounter.amount < 0:
+                raise PackError(f"{where}: heal amount must not be negative")
+            if encounter.kind == 'treasure' and not 0 <= encounter.min_gold <= encounter.max_gold:
+                raise PackError(f"{where}: treasure needs 0 <= min_gold <= max_gold")
+
+    return {section: list(table.values()) for section, table in merged.items()}
+
+
+# ============================================================================
+# CACHED LOADING
+# ============================================================================
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    return cached if isinstance(cached, dict) and cached.get('format') == CACHE_FORMAT else None
+
+
+def _write_cache(path, cached):
+    # Write to a temporary file first so readers never see half a cache
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # a read-only deploy still works, it just re-parses
+
+
+def load(record_types, builtins, paths=None, cache_dir=None):
+    """
+    Load content: built-in records plus every configured pack.
+
+    Args:
+        record_types: Record classes by section ('enemies', 'items',
+                      'locations', 'encounters')
+        builtins: Built-in records by section
+        paths: Pack directories or files; defaults to pack_paths()
+        cache_dir: Where compiled packs are cached
+
+    Returns:
+        Lists of records by section
+
+    Raises:
+        PackError: If a pack is malformed or inconsistent
+    """
+    files = pack_files(pack_paths() if paths is None else paths)
+    if not files:
+        return {section: list(records) for section, records in builtins.items()}
+
+    # Changing the built-in content must invalidate the cache too
+    fingerprint = _digest(repr(sorted(builtins.items())).encode())
+    cache_dir = cache_dir or os.environ.get('SHADOWMERE_CONTENT_CACHE', DEFAULT_CACHE_DIR)
+    cache_path = os.path.join(cache_dir, f"packs-{_digest(repr(files).encode())[:16]}.pickle")
+
+    stats = []
+    for path in files:
+        st = os.stat(path)
+        stats.append((path, st.st_mtime_ns, st.st_size))
+
+    cached = _read_cache(cache_path)
+    if cached is not None and cached['fingerprint'] != fingerprint:
+        cached = None
+
+    # Fast path: nothing touched since the cache was written
+    if cached is not None and cached['stats'] == stats:
+        return cached['records']
+
+    contents = {}
+    for path in files:
+        with open(path, 'rb') as f:
+            contents[path] = f.read()
+    digests = [_digest(contents[path]) for path in files]
+
+    # Files were touched but their bytes are the same
+    if cached is not None and cached['digests'] == digests:
+        records = cached['records']
+    else:
+        packs = [(path, compile_pack(path, read_pack(path, contents[path]), record_types)) for path in files]
+        records = merge(builtins, packs)
+
+    _write_cache(cache_path, {
+        'format': CACHE_FORMAT,
+        'fingerprint': fingerprint,
+        'stats': stats,
+        'digests': digests,
+        'records': records,
+    })
+    return records
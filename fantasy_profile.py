@@ -0,0 +1,408 @@
+"""
+On-demand profiling of live requests to the web version, as flame graphs per route.
+
+Profiling is opt-in twice over. Unless SHADOWMERE_ADMIN_TOKEN is set,
+fantasy_adventure_web does not install ProfileMiddleware at all, so it
+costs nothing. With the token set, profiling still stays off until an
+admin switches it on, for every worker at once:
+
+    curl -H "Authorization: Bearer $TOKEN" -d rate=0.05 -d minutes=10 http://host/admin/profile
+    curl -H "Authorization: Bearer $TOKEN" -d rate=0 http://host/admin/profile    # off
+    curl -H "Authorization: Bearer $TOKEN" http://host/admin/profile              # state and files
+
+That profiles 5% of requests, picked at random, for 10 minutes. The
+switch is a file in the profile directory, which every worker rereads
+once a second. A single request can also be profiled by sending the
+token in an X-Shadowmere-Profile header; its response then names the
+file its stacks went to. While the switch is off, the middleware costs a
+request two dict lookups and a clock read.
+
+The profiler is statistical. During a profiled request, an interval
+timer raises SIGALRM every `interval` (1ms by default), and the handler
+records the Python stack from the app down. Samples are counted per stack. When
+the request ends they are added to its route's collapsed-stack file,
+which holds one "frame;frame;frame count" line per stack. That is the
+input format of flamegraph.pl, speedscope and inferno:
+
+    <directory>/<route>/<YYYYmmdd-HHMM>.folded
+
+The observer is not free. A profiled /location/cave request ran about a
+third slower at 1ms: a quarter for arming the timer and merging the
+stacks into their file, the rest for the samples themselves. At 100us it
+ran six times as long, so shorter intervals are for single flagged
+requests, not for a rate. With a rate r, the mean cost is about r / 3 of
+a request, which keeps 5% under 2% overall; the tail is what suffers, as
+the profiled requests are the slow ones.
+
+Each file covers one period (an hour by default). The oldest files are
+deleted once a route has more than `keep` (24). Workers merge into the
+same files under an flock. Signal handlers run in the main thread only,
+so a request is only profiled when the main thread serves it. That holds
+for fantasy_serve.py's workers, but not for the threaded debug server.
+
+Usage:
+    SHADOWMERE_ADMIN_TOKEN=... python fantasy_serve.py --workers 4
+    python fantasy_profile.py profiles
+    python fantasy_profile.py profiles --route '/attack/<enemy>' --folded | flamegraph.pl > attack.svg
+"""
+
+import argparse
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+from werkzeug.exceptions import HTTPException
+
+log = logging.getLogger('shadowmere.profile')
+
+ADMIN_PATH = '/admin/profile'
+FLAG_HEADER = 'X-Shadowmere-Profile'
+_FLAG_KEY = 'HTTP_' + FLAG_HEADER.upper().replace('-', '_')
+SWITCH_FILE = 'switch.json'
+UNMATCHED = 'unmatched'
+RELOAD_SECONDS = 1.0  # how often a worker rereads the switch
+DEFAULT_MINUTES = 10  # sampling switches itself off after this long unless told otherwise
+
+
+def route_slug(rule):
+    """Return the directory name of a route, e.g. 'attack_enemy' for '/attack/<enemy>'."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', rule).strip('_') or 'index'
+
+
+def period_name(now, period):
+    """Return the name of the file covering time `now`, in periods of `period` seconds."""
+    return time.strftime('%Y%m%d-%H%M', time.gmtime(now - now % period)) + '.folded'
+
+
+# ============================================================================
+# SAMPLING
+# ============================================================================
+
+class Sampler:
+    """Counts the Python stacks of the main thread below a given frame, from SIGALRM."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.root = None  # frame the stacks are recorded below, while sampling
+        self.stacks = Counter()
+        self.names = {}  # code object -> frame name
+        signal.signal(signal.SIGALRM, self.sample)
+        signal.siginterrupt(signal.SIGALRM, False)  # system calls in C code resume after a sample
+
+    def start(self, root):
+        self.stacks = Counter()
+        self.root = root
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def stop(self):
+        """Stop sampling; return the stacks counted."""
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        self.root = None
+        return self.stacks
+
+    def sample(self, signum, frame):
+        root = self.root
+        stack = []
+        while frame is not None and frame is not root:
+            code = frame.f_code
+            name = self.names.get(code)
+            if name is None:
+                name = self.names[code] = f'{os.path.basename(code.co_filename)}:{code.co_qualname}'
+            stack.append(name)
+            frame = frame.f_back
+        if frame is not None:  # a sample that lands after the request ended is dropped
+            self.stacks[';'.join(reversed(stack))] += 1
+
+
+# ============================================================================
+# STACK FILES
+# ============================================================================
+
+def parse_folded(text):
+    """Return the stack counts in collapsed-stack text."""
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+
+def format_folded(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def add_stacks(path, stacks):
+    """Add stack counts into the collapsed-stack file at `path`; return whether it was new."""
+    import fcntl
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, 'r+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        text = f.read()
+        total = parse_folded(text)
+        total.update(stacks)
+        f.seek(0)
+        f.truncate()
+        f.write(format_folded(total))
+    return not text
+
+
+def read_folded(path):
+    import fcntl
+
+    with open(path, encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        return parse_folded(f.read())
+
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+class ProfileMiddleware:
+    """WSGI middleware that profiles sampled or flagged requests, and serves the admin switch."""
+
+    def __init__(self, app, wsgi_app, directory, token, interval=0.001, period=3600, keep=24):
+        """
+        Args:
+            app: The Flask app, whose URL map names the routes
+            wsgi_app: The WSGI app to profile (usually app.wsgi_app)
+            directory: Where the switch and the stack files are kept
+            token: Secret an admin must present, as a bearer token or in
+                   the X-Shadowmere-Profile header
+            interval: Seconds between samples; shorter intervals slow
+                      profiled requests down sharply (see the module docstring)
+            period: Seconds covered by each stack file
+            keep: Stack files kept per route
+        """
+        self.wsgi_app = wsgi_app
+        self.url_map = app.url_map
+        self.directory = directory
+        self.token = token.encode()
+        self.period = period
+        self.keep = keep
+        self.sampler = Sampler(interval)
+        self.rate = 0.0
+        self.next_check = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == ADMIN_PATH:
+            return self.admin(environ, start_response)
+        flag = environ.get(_FLAG_KEY)
+        if time.monotonic() >= self.next_check:
+            self.refresh()
+        if flag is None and not (self.rate and random.random() < self.rate):
+            return self.wsgi_app(environ, start_response)
+        if flag is not None and not self.authorized(flag):
+            return self.wsgi_app(environ, start_response)
+        if self.sampler.root is not None or threading.current_thread() is not threading.main_thread():
+            return self.wsgi_app(environ, start_response)  # see the module docstring
+        return self.profile(environ, start_response, flag is not None)
+
+    def profile(self, environ, start_response, flagged):
+        path = self.stack_file(environ)
+
+        def flagged_start_response(status, headers, exc_info=None):
+            headers.append((FLAG_HEADER, os.path.relpath(path, self.directory)))
+            return start_response(status, headers, exc_info)
+
+        self.sampler.start(sys._getframe())
+        try:
+            result = self.wsgi_app(environ, flagged_start_response if flagged else start_response)
+        finally:
+            stacks = self.sampler.stop()
+        if stacks:
+            try:
+                if add_stacks(path, stacks):
+                    self.prune(os.path.dirname(path))
+            except OSError as e:
+                log.warning('cannot write profile %s: %s', path, e)
+        return result
+
+    def stack_file(self, environ):
+        """Return the path of the stack file for this request's route, creating its directory."""
+        try:
+            rule, _ = self.url_map.bind_to_environ(environ).match(return_rule=True)
+            route = route_slug(rule.rule)
+        except HTTPException:
+            route = UNMATCHED
+        directory = os.path.join(self.directory, route)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, period_name(time.time(), self.period))
+
+    def prune(self, directory):
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.folded'))
+        for name in names[:-self.keep]:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass  # another worker got there first
+
+    # ------------------------------------------------------------------------
+    # The switch
+    # ------------------------------------------------------------------------
+
+    def authorized(self, token):
+        return hmac.compare_digest(token.encode(), self.token)
+
+    def switch(self):
+        """Return the rate and expiry time in the switch file; (0, None) if there is none."""
+        try:
+            with open(os.path.join(self.directory, SWITCH_FILE), encoding='utf-8') as f:
+                data = json.load(f)
+            return float(data['rate']), data.get('until')
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0.0, None
+
+    def refresh(self):
+        self.next_check = time.monotonic() + RELOAD_SECONDS
+        rate, until = self.switch()
+        self.rate = rate if until is None or time.time() < until else 0.0
+
+    def admin(self, environ, start_response):
+        """GET: report the switch and the stack files. POST rate=&minutes=: set the switch."""
+        def respond(status, data):
+            body = json.dumps(data, indent=1).encode()
+            start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body))),
+                                    ('Cache-Control', 'no-store')])
+            return [body]
+
+        auth = environ.get('HTTP_AUTHORIZATION', '')
+        if not auth.startswith('Bearer ') or not self.authorized(auth[len('Bearer '):]):
+            return respond('403 Forbidden', {'error': 'an admin token is required'})
+
+        if environ['REQUEST_METHOD'] == 'POST':
+            try:
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+                form = parse_qs(environ['wsgi.input'].read(length).decode('latin-1'))
+                rate = float(form['rate'][0])
+                minutes = float(form.get('minutes', [DEFAULT_MINUTES])[0])
+                if not 0 <= rate <= 1 or minutes < 0:
+                    raise ValueError
+            except (KeyError, ValueError):
+                return respond('400 Bad Request', {'error': 'rate must be in [0, 1] and minutes not negative'})
+            until = time.time() + minutes * 60 if minutes else None
+            tmp = os.path.join(self.directory, SWITCH_FILE + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'rate': rate, 'until': until}, f)
+            os.replace(tmp, os.path.join(self.directory, SWITCH_FILE))
+            log.info('profiling %g of requests%s', rate, f' for {minutes:g} minutes' if until and rate else '')
+            self.next_check = 0.0
+        elif environ['REQUEST_METHOD'] != 'GET':
+            return respond('405 Method Not Allowed', {'error': 'use GET or POST'})
+
+        rate, until = self.switch()
+        if until is not None and time.time() >= until:
+            rate = 0.0
+        return respond('200 OK', {
+            'rate': rate,
+            'until': until,
+            'interval': self.sampler.interval,
+            'routes': stack_files(self.directory),
+        })
+
+
+def install(app, directory, token, **options):
+    """
+    Wrap `app` in a ProfileMiddleware keeping its files in `directory`.
+
+    Args:
+        app: The Flask app
+        directory: Where the switch and the stack files are kept
+        token: The admin token
+        **options: interval, period and keep, as for ProfileMiddleware
+    """
+    if not hasattr(signal, 'setitimer'):
+        log.warning('request profiling needs signal.setitimer, which this platform lacks')
+        return
+    app.wsgi_app = ProfileMiddleware(app, app.wsgi_app, directory, token, **options)
+    log.info('request profiling available at %s, files in %s', ADMIN_PATH, directory)
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def stack_files(directory, route=None):
+    """Return {route directory: [stack file names, oldest first]}, for one route or all."""
+    routes = {}
+    for name in sorted(os.listdir(directory)):
+        if route is not None and name != route:
+            continue
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            files = sorted(f for f in os.listdir(path) if f.endswith('.folded'))
+            if files:
+                routes[name] = files
+    return routes
+
+
+def frame_times(stacks):
+    """Return (self, total) Counters of samples per frame; a frame is counted once per stack."""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return own, total
+
+
+def print_report(route, stacks, top):
+    samples = sum(stacks.values())
+    own, total = frame_times(stacks)
+    print(f'{route}: {samples:,} samples, {len(stacks):,} distinct stacks')
+    print(f"  {'self':>6}{'total':>7}  frame")
+    for frame, count in own.most_common(top):
+        print(f'  {count / samples:>6.1%}{total[frame] / samples:>7.1%}  {frame}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize or merge the request profiles of the web version.')
+    parser.add_argument('directory', help='profile directory (SHADOWMERE_PROFILE_DIR of the server)')
+    parser.add_argument('--route', help="one route, as its rule ('/attack/<enemy>') or its directory name")
+    parser.add_argument('--last', type=int, default=0, help='only the newest N files of each route (default: all)')
+    parser.add_argument('--top', type=int, default=15, help='frames listed per route, by self time (default: 15)')
+    parser.add_argument('--folded', action='store_true',
+                        help='print the merged stacks in collapsed-stack format instead, e.g. for flamegraph.pl')
+    args = parser.parse_args(argv)
+
+    route = None
+    if args.route:
+        route = route_slug(args.route) if args.route.startswith('/') else args.route
+    try:
+        routes = stack_files(args.directory, route)
+    except OSError as e:
+        print(f'{args.directory}: {e}', file=sys.stderr)
+        return 2
+    if not routes:
+        print('no profiles' + (f' for {args.route}' if args.route else ''), file=sys.stderr)
+        return 1
+
+    merged = {}
+    for name, files in routes.items():
+        stacks = Counter()
+        for file in files[-args.last:] if args.last else files:
+            stacks.update(read_folded(os.path.join(args.directory, name, file)))
+        merged[name] = stacks
+    if args.folded:
+        sys.stdout.write(format_folded(sum(merged.values(), Counter())))
+        return 0
+    for name, stacks in sorted(merged.items(), key=lambda item: -sum(item[1].values())):
+        print_report(name, stacks, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Action logs of the web version, and a replay engine for them.
+
+With SHADOWMERE_ACTION_LOGS set, every session of fantasy_adventure_web
+appends each action it takes (see fantasy_actions) to a log in the
+session store, downloadable at /log. As each action's rolls come from the
+session's seed and the number of actions counted before it, the log
+alone reproduces the game: replay() runs the actions from the state the
+log starts at, at full speed, without requests or templates, and checks
+each step against the state the server recorded.
+
+Each game gets a new log. A log that would grow past MAX_LOG_BYTES
+starts over from the state before the actions being added, so it stays
+under some 1,500 actions however long the game, at the cost of the
+actions before the latest start-over.
+
+Layout of a log (all integers little-endian):
+
+    header      b'SMLOG' + u8 version
+    state       u16 length + fantasy_codec record of the state the log starts at
+    entry       u8 action code (index in ACTION_CODES)
+                u16 argument ID: location, enemy or item ID, 0 if none
+                8 bytes  BLAKE2b digest of the state after the action (see digest())
+    start       entries continue with u64 seed + u16 length + UTF-8 name
+    reseed      entries continue with u64 seed
+    auto        entries continue with u16 potion_at + u16 flee_at of the policy
+
+Usage:
+    python fantasy_replay.py shadowmere.log             # check a bug report
+    python fantasy_replay.py shadowmere.log --show      # print every step
+    python fantasy_replay.py logs/*.log --repeat 1000 --no-check
+"""
+
+import argparse
+import hashlib
+import struct
+import sys
+import time
+from dataclasses import dataclass
+
+import fantasy_actions as actions
+import fantasy_codec as codec
+import fantasy_content as content
+from fantasy_combat import Policy
+
+MAGIC = b'SMLOG'
+# Version 1 logs had no starting state and were written while every
+# action counted towards the rolls, even one that did nothing
+VERSION = 2
+MAX_LOG_BYTES = 16 * 1024
+
+# Append-only, like the codec's ID tables
+ACTION_CODES = ('start', 'explore', 'combat', 'attack', 'flee', 'potion', 'buy', 'reset', 'auto', 'reseed')
+ACTION_IDS = {action: i for i, action in enumerate(ACTION_CODES)}
+
+# Content tables the argument ID of each action refers to
+ARG_TABLES = {
+    'explore': (content.LOCATIONS, content.LOCATIONS_BY_ID),
+    'combat': (content.ENEMIES, content.ENEMIES_BY_ID),
+    'attack': (content.ENEMIES, content.ENEMIES_BY_ID),
+    'buy': (content.ITEMS, content.ITEMS_BY_ID),
+}
+
+_HEADER = struct.Struct('<5sB')
+_ENTRY = struct.Struct('<BH8s')
+_START = struct.Struct('<QH')
+_SEED = struct.Struct('<Q')
+_AUTO = struct.Struct('<HH')
+_U16 = struct.Struct('<H')
+
+
+@dataclass(slots=True)
+class Replay:
+    player: dict
+    actions: int
+    divergence: int | None  # index of the first entry whose state differs
+
+
+def digest(player):
+    """
+    Return the 8-byte digest of the player's state that a log records.
+
+    The message is left out: pages clear it once shown, which is not an action.
+    """
+    message = player['message'], player['message_type']
+    player['message'] = player['message_type'] = None
+    data = codec.encode(player)
+    player['message'], player['message_type'] = message
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+
+def entry(action, arg, player):
+    """
+    Return the log entry of `action` taken with `arg`, leaving `player`.
+
+    Raises:
+        ValueError: If a start's name is 64 KiB or more in UTF-8
+    """
+    tables = ARG_TABLES.get(action)
+    arg_id = tables[0][arg].id if tables else 0
+    data = _ENTRY.pack(ACTION_IDS[action], arg_id, digest(player))
+    if action == 'start':
+        name, seed = arg
+        raw = name.encode('utf-8')
+        if len(raw) > 0xFFFF:
+            raise ValueError(f'name of {len(raw)} bytes does not fit a u16 length: {raw[:20]!r}...')
+        data += _START.pack(seed, len(raw)) + raw
+    elif action == 'reseed':
+        data += _SEED.pack(arg)
+    elif action == 'auto':
+        data += _AUTO.pack(arg.potion_at, arg.flee_at)
+    return data
+
+
+def extend_log(log, entries, state):
+    """
+    Return `log` with the encoded `entries` appended.
+
+    Args:
+        log: The log so far, or None to start a new one
+        entries: Encoded entries, from entry()
+        state: fantasy_codec record of the state before the entries; a
+               new log, or one that would grow past MAX_LOG_BYTES, starts
+               over from it
+    """
+    body = b''.join(entries)
+    if log is None or len(log) + len(body) > MAX_LOG_BYTES:
+        log = _HEADER.pack(MAGIC, VERSION) + _U16.pack(len(state)) + state
+    return log + body
+
+
+def read_log(data):
+    """
+    Parse a log.
+
+    Returns:
+        (state, entries): the fantasy_codec record of the state the log
+        starts at, and a list of (action, arg, digest) tuples
+
+    Raises:
+        ValueError: If the data is not a log or is cut short
+    """
+    if len(data) < _HEADER.size or _HEADER.unpack_from(data)[0] != MAGIC:
+        raise ValueError('Not a Shadowmere action log')
+    version = _HEADER.unpack_from(data)[1]
+    if version != VERSION:
+        raise ValueError(f'Action log version {version} cannot be replayed by this version ({VERSION})')
+    entries = []
+    offset = _HEADER.size
+    try:
+        length, = _U16.unpack_from(data, offset)
+        start = data[offset + _U16.size:offset + _U16.size + length]
+        offset += _U16.size + length
+        codec.decode(start)
+        while offset < len(data):
+            code, arg_id, state = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            action = ACTION_CODES[code]
+            arg = None
+            if action == 'start':
+                seed, length = _START.unpack_from(data, offset)
+                offset += _START.size
+                arg = (data[offset:offset + length].decode('utf-8'), seed)
+                offset += length
+            elif action == 'reseed':
+                arg, = _SEED.unpack_from(data, offset)
+                offset += _SEED.size
+            elif action == 'auto':
+                arg = Policy(*_AUTO.unpack_from(data, offset))
+                offset += _AUTO.size
+            elif action in ARG_TABLES:
+                arg = ARG_TABLES[action][1][arg_id].key
+            entries.append((action, arg, state))
+    except (struct.error, IndexError, KeyError, AttributeError, ValueError) as e:
+        raise ValueError(f'Corrupt action log at byte {offset}') from e
+    return start, entries
+
+
+def replay(state, entries, check=True, on_step=None):
+    """
+    Run logged actions from the state the log starts at.
+
+    Args:
+        state: fantasy_codec record of that state, from read_log()
+        entries: (action, arg, digest) tuples from read_log()
+        check: Compare the state after each action with the logged digest
+        on_step: Optional callback(index, action, arg, result, player)
+
+    Returns:
+        Replay with the final player and the first divergence, if any
+    """
+    player = codec.decode(state)
+    divergence = None
+    for i, (action, arg, state) in enumerate(entries):
+        result = actions.perform(player, action, arg)
+        if on_step:
+            on_step(i, action, arg, result, player)
+        if check and divergence is None and digest(player) != state:
+            divergence = i
+    return Replay(player, len(entries), divergence)
+
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+
+def show_step(i, action, arg, result, player):
+    if action == 'start':
+        arg_text = arg[0]
+    elif action == 'auto':
+        arg_text = f'{arg.potion_at}/{arg.flee_at}'
+    else:
+        arg_text = arg
+    print(f"{i:>5}  {action:<8}{arg_text or '':<12}{player['health']:>4}/{player['max_health']:<4}"
+          f"{player['gold']:>5}g  {player['message'] or ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay and check action logs of the web version.')
+    parser.add_argument('logs', nargs='+', help='logs downloaded from /log')
+    parser.add_argument('--show', action='store_true', help='print every step')
+    parser.add_argument('--repeat', type=int, default=1, help='replay each log this many times')
+    parser.add_argument('--no-check', action='store_true', help='skip comparing states with the log')
+    args = parser.parse_args(argv)
+
+    logs = []
+    for path in args.logs:
+        with open(path, 'rb') as f:
+            try:
+                logs.append((path, *read_log(f.read())))
+            except ValueError as e:
+                print(f'{path}: {e}', file=sys.stderr)
+                return 2
+
+    failed = 0
+    for path, state, entries in logs:
+        result = replay(state, entries, not args.no_check, show_step if args.show else None)
+        player = result.player
+        if result.divergence is not None:
+            action, arg, _ = entries[result.divergence]
+            step = f'{action} {arg}' if arg else action
+            print(f'{path}: DIVERGED at action {result.divergence} ({step})')
+            failed += 1
+        else:
+            status = 'checked' if not args.no_check else 'replayed'
+            print(f"{path}: {result.actions} actions {status}; {player['name'] or 'no hero'} ends with "
+                  f"{player['health']}/{player['max_health']} health, {player['gold']} gold"
+                  + (', dragon defeated' if player['dragon_defeated'] else ''))
+
+    if args.repeat > 1:
+        total = sum(len(entries) for _, _, entries in logs) * args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for _, state, entries in logs:
+                replay(state, entries, not args.no_check)
+        elapsed = time.perf_counter() - start
+        print(f'{total:,} actions in {elapsed:.3f}s: {total / elapsed:,.0f} actions/s'
+              f"{'' if args.no_check else ' (checked)'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Production server for the web version: a prefork pool of WSGI workers.
+
+The master process imports the app and warms it up (templates compiled,
+content loaded, fragment caches filled by rendering the common pages),
+then moves everything it has allocated into the garbage collector's
+permanent generation with gc.freeze() before it forks --workers
+processes that accept from one shared listening socket. A collection in
+a worker never touches frozen objects, so their pages stay shared with
+the master instead of being copied into every worker.
+
+A worker exits after --max-requests requests, plus a random share of
+--max-requests-jitter so that workers do not all restart together, and
+the master starts a replacement. Signals to the master:
+    SIGTERM, SIGINT   workers finish the request in progress, then all stop
+    SIGHUP            every worker is replaced the same graceful way
+
+Every worker must see the same sessions and sign cookies with the same
+key, so:
+    - the session store defaults to sqlite:sessions.db (set
+      SHADOWMERE_SESSION_STORE or --store to change it; the memory store
+      is refused with more than one worker)
+    - the secret key comes from SHADOWMERE_SECRET_KEY, or else from
+      --secret-file, which is created with a random key on first start
+      and keeps cookies valid across restarts
+and every worker's /metrics must count the requests of all of them, so
+they keep their metrics in files under SHADOWMERE_METRICS_DIR (see
+fantasy_metrics), a temporary directory removed at exit if it is unset.
+
+Usage:
+    python fantasy_serve.py --port 8000 --workers 4
+    python fantasy_serve.py --workers 8 --max-requests 10000 --store sqlite:/var/lib/shadowmere/sessions.db
+"""
+
+import argparse
+import gc
+import logging
+import os
+import random
+import secrets
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+log = logging.getLogger('shadowmere.serve')
+
+# A worker that dies sooner than this after starting is restarted only after this long
+MIN_WORKER_LIFETIME = 1.0
+
+
+class RequestHandler(WSGIRequestHandler):
+    # One request per connection, so a slow client cannot hold a worker
+    # between requests; and no per-request access log
+    protocol_version = 'HTTP/1.0'
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def closing_read_side(app):
+    """
+    Wrap a WSGI app to shut the connection's read side once a response is written.
+
+    After every response werkzeug waits up to 10ms for request data the
+    app left unread, so that such a client sees the response rather than
+    a reset. A request without a body has nothing left to send on a
+    one-request connection, and the wait only keeps the worker idle.
+    """
+    def app_closing_read_side(environ, start_response):
+        body = app(environ, start_response)
+        try:
+            yield from body
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        if not environ.get('CONTENT_LENGTH') and not environ.get('HTTP_TRANSFER_ENCODING'):
+            try:
+                environ['werkzeug.socket'].shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+    return app_closing_read_side
+
+
+class WorkerServer(BaseWSGIServer):
+    """Serves requests from a listening socket inherited from the master, and counts them."""
+
+    multiprocess = True
+
+    def __init__(self, sock, app, on_idle=None):
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, closing_read_side(app), handler=RequestHandler, fd=sock.fileno())
+        self.timeout = 0.5  # how often the worker checks whether it should stop
+        self.on_idle = on_idle  # called after each timeout without a request
+        self.requests = 0
+
+    def process_request(self, request, client_address):
+        self.requests += 1
+        super().process_request(request, client_address)
+
+    def handle_timeout(self):
+        if self.on_idle is not None:
+            self.on_idle()
+
+
+# ============================================================================
+# SETUP (IN THE MASTER, BEFORE FORKING)
+# ============================================================================
+
+def load_secret(path):
+    """Return the secret key stored at `path`, creating it if needed."""
+    try:
+        with open(path, encoding='ascii') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        key = secrets.token_hex(32)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w', encoding='ascii') as f:
+            f.write(key + '\n')
+        return key
+
+
+def warm_up(web):
+    """Render the common pages once, with a throwaway session store, no request trace and no metrics."""
+    import fantasy_content as content
+    import fantasy_sessions as sessions
+    import fantasy_trace as trace
+    from fantasy_cache import FragmentCache
+
+    store = web.store
+    web.store = sessions.MemoryStore()
+    try:
+        client = web.app.test_client()
+        client.environ_base[trace.UNTRACED] = True
+        client.get('/')
+        client.post('/start', data={'player_name': 'Warmup'})
+        for key in content.LOCATIONS:
+            client.get(f'/location/{key}')
+        for path in ('/', '/shop', '/status', '/combat/goblin', '/api/v1/status',
+                     f'/static/{web.assets.STYLESHEET.filename}'):
+            client.get(path)
+        client.get('/reset')
+    finally:
+        web.store = store
+    # The warm-up is not traffic: forget what it counted, but keep what it cached
+    web.registry.reset()
+    for cache in FragmentCache.registry:
+        cache.reset_counters()
+    web.page_etag_counts.clear()
+
+
+def load_app(store, secret_file, metrics_dir):
+    """Configure the environment, then import and warm up the web app."""
+    os.environ['SHADOWMERE_METRICS_DIR'] = metrics_dir
+    if store:
+        os.environ['SHADOWMERE_SESSION_STORE'] = store
+    os.environ.setdefault('SHADOWMERE_SESSION_STORE', 'sqlite:sessions.db')
+    if 'SHADOWMERE_SECRET_KEY' not in os.environ:
+        os.environ['SHADOWMERE_SECRET_KEY'] = load_secret(secret_file)
+
+    import fantasy_adventure_web as web
+
+    warm_up(web)
+    return web
+
+
+# ============================================================================
+# MASTER AND WORKERS
+# ============================================================================
+
+class Master:
+    """Forks the workers, replaces those that exit, and stops them on a signal."""
+
+    def __init__(self, sock, app, workers, max_requests=0, max_requests_jitter=0, graceful_timeout=30.0,
+                 on_worker_idle=None, on_worker_exit=None):
+        self.sock = sock
+        self.app = app
+        self.size = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.on_worker_idle = on_worker_idle  # called in a worker waiting for requests, every WorkerServer.timeout
+        self.on_worker_exit = on_worker_exit  # called in a worker just before it exits
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+        self.reloading = False
+
+    def spawn(self):
+        limit = 0
+        if self.max_requests:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = run_worker(self.sock, self.app, limit, self.on_worker_idle)
+            finally:
+                try:
+                    if self.on_worker_exit is not None:
+                        self.on_worker_exit()
+                finally:
+                    os._exit(code)
+        self.workers[pid] = time.monotonic()
+        log.info('worker %d started', pid)
+
+    def reap(self):
+        """Forget exited workers; return how long the shortest-lived one ran."""
+        shortest = None
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            lifetime = time.monotonic() - started
+            shortest = lifetime if shortest is None else min(shortest, lifetime)
+            log.info('worker %d exited with status %d after %.1fs', pid, os.waitstatus_to_exitcode(status), lifetime)
+        return shortest
+
+    def signal_workers(self, signum):
+        for pid in self.workers:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        def stop(signum, frame):
+            self.stopping = True
+
+        def reload(signum, frame):
+            self.reloading = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, reload)
+
+        for _ in range(self.size):
+            self.spawn()
+        while not self.stopping:
+            time.sleep(0.1)
+            if self.reloading:
+                self.reloading = False
+                log.info('replacing all workers')
+                self.signal_workers(signal.SIGTERM)
+            shortest = self.reap()
+            if shortest is not None and shortest < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)  # do not spin on a worker that cannot start
+            while len(self.workers) < self.size and not self.stopping:
+                self.spawn()
+
+        log.info('stopping %d workers', len(self.workers))
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+            self.reap()
+        if self.workers:
+            log.warning('killing %d workers that did not stop in time', len(self.workers))
+            self.signal_workers(signal.SIGKILL)
+            for pid in self.workers:
+                os.waitpid(pid, 0)
+            self.workers.clear()
+
+
+def run_worker(sock, app, max_requests, on_idle=None):
+    """
+    Serve requests until told to stop or `max_requests` is reached.
+
+    Args:
+        sock: Listening socket shared by all workers
+        app: The WSGI app
+        max_requests: Requests to serve before exiting, or 0 for no limit
+        on_idle: Called whenever no request came for WorkerServer.timeout
+
+    Returns:
+        Exit status
+    """
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master decides when to stop
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    server = WorkerServer(sock, app, on_idle)
+    try:
+        while not stopping and not (max_requests and server.requests >= max_requests):
+            server.handle_request()
+    finally:
+        server.server_close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the Shadowmere web version with a prefork worker pool.')
+    parser.add_argument('--host', default='0.0.0.0', help='interface to bind (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)),
+                        help='port to bind (default: $PORT, else 5000)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='replace a worker after this many requests (default: never)')
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help='add up to this many requests to each worker\'s limit')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds workers get to finish before they are killed (default: 30)')
+    parser.add_argument('--backlog', type=int, default=2048, help='listen queue length')
+    parser.add_argument('--store', help='session store spec (default: $SHADOWMERE_SESSION_STORE, '
+                                        'else sqlite:sessions.db)')
+    parser.add_argument('--secret-file', default='.shadowmere-secret',
+                        help='file holding the session secret key, unless SHADOWMERE_SECRET_KEY is set')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    store = args.store or os.environ.get('SHADOWMERE_SESSION_STORE')
+    if args.workers > 1 and store == 'memory':
+        parser.error('the memory session store is not shared between workers; use sqlite:<path>')
+
+    # Workers add up each other's metrics through files in this directory
+    metrics_dir = os.environ.get('SHADOWMERE_METRICS_DIR')
+    temporary_metrics = not metrics_dir
+    if temporary_metrics:
+        metrics_dir = tempfile.mkdtemp(prefix='shadowmere-metrics-')
+    web = load_app(args.store, args.secret_file, metrics_dir)
+    # Everything allocated so far is shared with the workers; keep the collector off it
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.create_server((args.host, args.port), backlog=args.backlog)
+    sock.setblocking(False)  # workers that lose the race for a connection go back to waiting
+    log.info('serving on http://%s:%d with %d workers (sessions: %s)',
+             args.host, args.port, args.workers, os.environ['SHADOWMERE_SESSION_STORE'])
+    Master(sock, web.app, args.workers, args.max_requests, args.max_requests_jitter,
+           args.graceful_timeout, on_worker_idle=web.registry.sync, on_worker_exit=web.registry.sync).run()
+    sock.close()
+    if temporary_metrics:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Line-based TCP server for the CLI game.
+
+Every connection gets its own GameState; one asyncio event loop serves
+them all, so a single process can host thousands of concurrent games.
+Connect with any telnet-style client:
+
+    python fantasy_server.py --port 4000
+    telnet localhost 4000        (or: nc localhost 4000)
+
+A game only uses CPU while it handles a line; between lines a session
+costs one GameState and one socket. Idle sessions are closed after
+--idle-timeout seconds and --max-sessions caps how many may be open.
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from fantasy_adventure_game import GameState
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+log = logging.getLogger('shadowmere.server')
+
+MAX_LINE = 1024  # longest input line accepted, in bytes
+
+
+class GameServer:
+    """Accepts connections and runs one game per connection."""
+
+    def __init__(self, idle_timeout=600.0, max_sessions=10_000):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions = 0        # currently connected
+        self.total_sessions = 0  # served since start
+
+    async def handle(self, reader, writer):
+        """Run one game over a connection until it ends or the client leaves."""
+        if self.sessions >= self.max_sessions:
+            writer.write(b'The realm is full. Please try again later.\r\n')
+            await self._close(writer)
+            return
+
+        self.sessions += 1
+        self.total_sessions += 1
+        game = GameState()
+        try:
+            self._send(writer, game.start())
+            while not game.finished:
+                await writer.drain()
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    self._send(writer, '\nYou have been idle too long. Farewell, adventurer!\n')
+                    break
+                except ValueError:  # line longer than MAX_LINE
+                    break
+                if not line:  # client disconnected
+                    break
+                self._send(writer, game.send(line.decode('utf-8', 'replace').rstrip('\r\n')))
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            await self._close(writer)
+
+    @staticmethod
+    def _send(writer, text):
+        # Telnet expects CRLF line endings
+        writer.write(text.replace('\n', '\r\n').encode('utf-8'))
+
+    @staticmethod
+    async def _close(writer):
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def serve(self, host, port, ready=None):
+        """
+        Listen until cancelled.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind; 0 picks a free one
+            ready: Optional callback given the bound port once listening
+        """
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE,
+                                            backlog=min(self.max_sessions, 4096))
+        bound = server.sockets[0].getsockname()[1]
+        log.info('Serving Shadowmere on %s:%d', host, bound)
+        if ready:
+            ready(bound)
+        async with server:
+            await server.serve_forever()
+
+
+def raise_file_limit():
+    """Raise the open-file soft limit to the hard limit, so every socket fits."""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the Shadowmere CLI game over TCP.')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=4000, help='port to bind (default: 4000)')
+    parser.add_argument('--idle-timeout', type=float, default=600.0,
+                        help='seconds before an idle session is closed (default: 600)')
+    parser.add_argument('--max-sessions', type=int, default=10_000,
+                        help='most concurrent sessions (default: 10000)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    raise_file_limit()
+    server = GameServer(idle_timeout=args.idle_timeout, max_sessions=args.max_sessions)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
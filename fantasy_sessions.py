@@ -0,0 +1,157 @@
+"""
+Server-side session stores for the web version.
+
+The session cookie only carries an opaque session ID; the player's state
+lives in one of these stores as an encoded byte string. Every store has
+the same three methods, so the web app does not care which one it uses:
+
+    load(sid)        -> bytes, or None if unknown or expired
+    save(sid, data)  -> store bytes under sid
+    delete(sid)      -> forget sid
+
+Pick a store with the SHADOWMERE_SESSION_STORE environment variable:
+    memory                  in-process LRU (the default)
+    sqlite:path/to/file.db  shared by every process on the machine
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 7 * 24 * 60 * 60  # a week, measured from the last save
+
+
+def new_session_id():
+    """Return a fresh, unguessable session ID."""
+    return secrets.token_urlsafe(24)
+
+
+class SessionStore:
+    """Base class for session stores."""
+
+    def load(self, sid):
+        """Return the bytes saved under sid, or None."""
+        raise NotImplementedError
+
+    def save(self, sid, data):
+        """Save bytes under sid, replacing anything already there."""
+        raise NotImplementedError
+
+    def delete(self, sid):
+        """Remove sid if it exists."""
+        raise NotImplementedError
+
+
+class MemoryStore(SessionStore):
+    """
+    In-process LRU store with expiry.
+
+    Sessions expire `ttl` seconds after their last save, and the least
+    recently used session is dropped once `maxsize` is reached. State is
+    lost on restart and is not shared between worker processes.
+    """
+
+    def __init__(self, maxsize=100_000, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # sid -> (expires, data)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry[1]
+
+    def save(self, sid, data):
+        with self._lock:
+            self._entries[sid] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore(SessionStore):
+    """
+    File-backed store that every process on the machine can share.
+
+    Each thread gets its own connection. Expired rows are ignored on load
+    and swept out every `purge_every` saves.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, purge_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._saves = 0
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS sessions '
+                '(sid TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        # Connections must not be shared across threads or forked processes
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def load(self, sid):
+        row = self._connect().execute(
+            'SELECT data FROM sessions WHERE sid = ? AND expires >= ?', (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data):
+        with self._connect() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                (sid, data, time.time() + self.ttl),
+            )
+            self._saves += 1
+            if self._saves % self.purge_every == 0:
+                db.execute('DELETE FROM sessions WHERE expires < ?', (time.time(),))
+
+    def delete(self, sid):
+        with self._connect() as db:
+            db.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+def create_store(spec=None):
+    """
+    Create a session store from a spec string.
+
+    Args:
+        spec: 'memory' or 'sqlite:<path>'; defaults to the
+              SHADOWMERE_SESSION_STORE environment variable, then 'memory'
+
+    Returns:
+        A SessionStore
+    """
+    spec = spec or os.environ.get('SHADOWMERE_SESSION_STORE', 'memory')
+    if spec == 'memory':
+        return MemoryStore()
+    if spec.startswith('sqlite:'):
+        return SQLiteStore(spec[len('sqlite:'):])
+    raise ValueError(f"Unknown session store: {spec!r}")
@@ -0,0 +1,284 @@
+"""
+Monte Carlo combat simulator, vectorized with NumPy.
+
+Runs many fights at once as arrays: each round, every fight still going
+picks its action by the same Policy as fantasy_combat.fight(), and all
+the rolls for that round are drawn in one call. Damage ranges, the
+max(1, roll - defense) rule, potions and the flee chance all come from
+fantasy_combat, so the simulator plays by the game's rules.
+
+Usage:
+    python fantasy_sim.py                      # every enemy vs. the standard builds
+    python fantasy_sim.py --fights 1000000 --potions 3 --potion-at 30
+    python fantasy_sim.py --rules web --enemy dragon
+    python fantasy_sim.py --check              # compare with the scalar engine
+
+Requires NumPy (pip install -r requirements-tools.txt); the game itself
+does not.
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+import fantasy_combat as rules
+import fantasy_content as content
+from fantasy_combat import DEATH, FLED, TIMEOUT, WIN, Policy
+
+FIGHT_DTYPE = np.int32
+
+
+@dataclass(frozen=True)
+class SimResult:
+    """Per-fight results of a batch, as arrays of equal length."""
+    outcome: np.ndarray       # WIN, DEATH, FLED or TIMEOUT
+    turns: np.ndarray
+    health: np.ndarray        # player health at the end
+    potions_used: np.ndarray
+
+    def __len__(self):
+        return len(self.outcome)
+
+    def rates(self):
+        """Return the fraction of fights per outcome name."""
+        counts = np.bincount(self.outcome, minlength=len(rules.OUTCOMES))
+        return {name: counts[i] / len(self) for i, name in enumerate(rules.OUTCOMES)}
+
+    def summary(self):
+        """Return the outcome rates plus turn, health and potion statistics."""
+        won = self.outcome == WIN
+        turns = self.turns
+        summary = self.rates()
+        summary.update(
+            turns_mean=float(turns.mean()),
+            turns_p50=float(np.percentile(turns, 50)),
+            turns_p90=float(np.percentile(turns, 90)),
+            turns_p99=float(np.percentile(turns, 99)),
+            turns_to_kill=float(turns[won].mean()) if won.any() else math.nan,
+            health_after_win=float(self.health[won].mean()) if won.any() else math.nan,
+            potions_used=float(self.potions_used.mean()),
+        )
+        return summary
+
+
+def simulate(build, enemy, n, policy=Policy(), ruleset=rules.RULES['cli'], rng=None, max_turns=1000):
+    """
+    Simulate n independent fights of one build against one enemy.
+
+    Args:
+        build: fantasy_combat.Build
+        enemy: fantasy_content.Enemy
+        n: Number of fights
+        policy: Which action the player picks each round
+        ruleset: fantasy_combat.RULES['cli'] or ['web']
+        rng: numpy.random.Generator; a fresh one if None
+        max_turns: Rounds before a fight is called a TIMEOUT
+
+    Returns:
+        A SimResult
+    """
+    rng = rng or np.random.default_rng()
+    low, high = rules.PLAYER_DAMAGE
+    enemy_low = enemy.attack + rules.ENEMY_DAMAGE[0]
+    enemy_high = enemy.attack + rules.ENEMY_DAMAGE[1]
+
+    health = np.full(n, build.start_health, FIGHT_DTYPE)
+    enemy_health = np.full(n, enemy.health, FIGHT_DTYPE)
+    potions = np.full(n, build.potions, FIGHT_DTYPE)
+    outcome = np.full(n, TIMEOUT, np.int8)
+    turns = np.full(n, max_turns, FIGHT_DTYPE)
+
+    # Indices of the fights still going; shrinks as fights end
+    active = np.arange(n)
+    for turn in range(1, max_turns + 1):
+        if active.size == 0:
+            break
+        hp = health[active]
+        drink = (potions[active] > 0) & (hp <= policy.potion_at)
+        flee = ~drink & (hp <= policy.flee_at)
+        attack = ~drink & ~flee
+
+        # Attacks
+        attackers = active[attack]
+        enemy_health[attackers] -= rng.integers(build.attack + low, build.attack + high,
+                                                size=attackers.size, endpoint=True, dtype=FIGHT_DTYPE)
+        killed = enemy_health[attackers] <= 0
+        outcome[attackers[killed]] = WIN
+        turns[attackers[killed]] = turn
+        countered = [attackers[~killed]]
+
+        # Potions
+        drinkers = active[drink]
+        potions[drinkers] -= 1
+        health[drinkers] = np.minimum(health[drinkers] + rules.POTION.heal, build.max_health)
+        if ruleset.counter_after_potion:
+            countered.append(drinkers)
+
+        # Flee attempts
+        fleeing = active[flee]
+        escaped = rng.random(fleeing.size) > rules.FLEE_FAIL_CHANCE
+        outcome[fleeing[escaped]] = FLED
+        turns[fleeing[escaped]] = turn
+        if ruleset.counter_after_failed_flee:
+            countered.append(fleeing[~escaped])
+
+        # The enemy hits back
+        hit = np.concatenate(countered)
+        damage = rng.integers(enemy_low, enemy_high, size=hit.size, endpoint=True, dtype=FIGHT_DTYPE)
+        health[hit] -= np.maximum(rules.MIN_DAMAGE, damage - build.defense)
+        died = hit[health[hit] <= 0]
+        outcome[died] = DEATH
+        turns[died] = turn
+
+        active = active[outcome[active] == TIMEOUT]
+
+    return SimResult(outcome, turns, health, build.potions - potions)
+
+
+def simulate_scalar(build, enemy, n, policy=Policy(), ruleset=rules.RULES['cli'], seed=None, max_turns=1000):
+    """Run n fights with the scalar engine (fantasy_combat.fight) and return a SimResult."""
+    rng = random.Random(seed)
+    results = [rules.fight(build, enemy, policy, ruleset, rng, max_turns) for _ in range(n)]
+    return SimResult(
+        np.array([r.outcome for r in results], np.int8),
+        np.array([r.turns for r in results], FIGHT_DTYPE),
+        np.array([r.health for r in results], FIGHT_DTYPE),
+        np.array([r.potions_used for r in results], FIGHT_DTYPE),
+    )
+
+
+# ============================================================================
+# STATISTICAL CHECK
+# ============================================================================
+
+def _z_proportion(a, b):
+    """z statistic for the difference of two proportions (count, n) pairs."""
+    (ka, na), (kb, nb) = a, b
+    pooled = (ka + kb) / (na + nb)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / na + 1 / nb))
+    return 0.0 if se == 0 else (ka / na - kb / nb) / se
+
+
+def _z_mean(a, b):
+    """Welch z statistic for the difference of two sample means."""
+    if len(a) < 2 or len(b) < 2:
+        return 0.0
+    se = math.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+    return 0.0 if se == 0 else (a.mean() - b.mean()) / se
+
+
+def compare(scalar, batch):
+    """
+    Compare a scalar and a batched SimResult.
+
+    Returns:
+        (metric, scalar value, batched value, z) tuples for the outcome
+        rates, mean turns and mean health after a win
+    """
+    rows = []
+    for code, name in enumerate(rules.OUTCOMES[:3]):
+        ks, kb = int((scalar.outcome == code).sum()), int((batch.outcome == code).sum())
+        rows.append((f'{name} rate', ks / len(scalar), kb / len(batch),
+                     _z_proportion((ks, len(scalar)), (kb, len(batch)))))
+    rows.append(('turns', scalar.turns.mean(), batch.turns.mean(),
+                 _z_mean(scalar.turns.astype(float), batch.turns.astype(float))))
+    won_s, won_b = scalar.outcome == WIN, batch.outcome == WIN
+    if won_s.sum() > 1 and won_b.sum() > 1:
+        rows.append(('health after win', scalar.health[won_s].mean(), batch.health[won_b].mean(),
+                     _z_mean(scalar.health[won_s].astype(float), batch.health[won_b].astype(float))))
+    return rows
+
+
+def check(scenarios, scalar_fights, batch_fights, seed, threshold):
+    """
+    Check batched against scalar results for each scenario.
+
+    Returns:
+        True if every |z| is below threshold
+    """
+    ok = True
+    rng = np.random.default_rng(seed)
+    width = max(len(label) for label, *_ in scenarios) + 2
+    print(f"{'scenario':<{width}}{'metric':<18}{'scalar':>10}{'batched':>10}{'z':>8}")
+    for label, build, enemy, policy, ruleset in scenarios:
+        scalar = simulate_scalar(build, enemy, scalar_fights, policy, ruleset, seed=seed)
+        batch = simulate(build, enemy, batch_fights, policy, ruleset, rng=rng)
+        for metric, s, b, z in compare(scalar, batch):
+            flag = '' if abs(z) < threshold else '  MISMATCH'
+            ok = ok and not flag
+            print(f'{label:<{width}}{metric:<18}{s:>10.4f}{b:>10.4f}{z:>8.2f}{flag}')
+    return ok
+
+
+def check_scenarios(potions, policy):
+    """Every enemy against a weak, a middling and a strong build, under both rule sets."""
+    builds = rules.standard_builds(potions)
+    scenarios = []
+    for ruleset in rules.RULES.values():
+        for build in (builds[0], builds[1], builds[-1]):
+            for enemy in content.ENEMIES.values():
+                label = f'{ruleset.name} {build.name} vs {enemy.key}'
+                scenarios.append((label, build, enemy, policy, ruleset))
+    return scenarios
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def report(builds, enemies, fights, policy, ruleset, seed):
+    """Print outcome and turn distributions for every build against every enemy."""
+    rng = np.random.default_rng(seed)
+    print(f'{fights:,} fights per row, {ruleset.name} rules, '
+          f'potion at <= {policy.potion_at} HP, flee at <= {policy.flee_at} HP')
+    print(f"{'build':<44}{'enemy':<10}{'win%':>7}{'death%':>8}{'fled%':>7}"
+          f"{'turns':>7}{'p50':>5}{'p90':>5}{'p99':>5}{'ttk':>7}{'hp left':>8}{'pots':>6}")
+    total = 0
+    start = time.perf_counter()
+    for build in builds:
+        for enemy in enemies:
+            s = simulate(build, enemy, fights, policy, ruleset, rng=rng).summary()
+            total += fights
+            print(f"{build.name:<44}{enemy.key:<10}{s['win'] * 100:>7.2f}{s['death'] * 100:>8.2f}"
+                  f"{s['fled'] * 100:>7.2f}{s['turns_mean']:>7.2f}{s['turns_p50']:>5.0f}"
+                  f"{s['turns_p90']:>5.0f}{s['turns_p99']:>5.0f}{s['turns_to_kill']:>7.2f}"
+                  f"{s['health_after_win']:>8.1f}{s['potions_used']:>6.2f}")
+    elapsed = time.perf_counter() - start
+    print(f'\n{total:,} fights in {elapsed:.2f}s ({total / elapsed:,.0f} fights/s)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Monte Carlo combat simulator.')
+    parser.add_argument('--fights', type=int, default=100_000, help='fights per build and enemy')
+    parser.add_argument('--rules', choices=sorted(rules.RULES), default='cli')
+    parser.add_argument('--enemy', action='append', choices=sorted(content.ENEMIES),
+                        help='enemy to simulate (repeatable; default: all)')
+    parser.add_argument('--potions', type=int, default=0, help='potions each build starts with')
+    parser.add_argument('--potion-at', type=int, default=0, help='drink a potion at or below this health')
+    parser.add_argument('--flee-at', type=int, default=0, help='flee at or below this health')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--check', action='store_true',
+                        help='compare batched results with the scalar engine instead')
+    parser.add_argument('--scalar-fights', type=int, default=20_000, help='scalar fights per check scenario')
+    parser.add_argument('--threshold', type=float, default=4.5, help='largest |z| the check accepts')
+    args = parser.parse_args(argv)
+
+    policy = Policy(potion_at=args.potion_at, flee_at=args.flee_at)
+    if args.check:
+        ok = check(check_scenarios(args.potions, policy), args.scalar_fights, args.fights,
+                   args.seed, args.threshold)
+        print('\nOK: batched and scalar results agree' if ok else '\nFAILED: see MISMATCH rows')
+        return 0 if ok else 1
+
+    enemies = [content.ENEMIES[key] for key in args.enemy] if args.enemy else list(content.ENEMIES.values())
+    report(rules.standard_builds(args.potions), enemies, args.fights, policy, rules.RULES[args.rules], args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,530 @@
+"""
+Request traces of the web version: capture real traffic, then replay it faster.
+
+Capture is opt-in: with SHADOWMERE_TRACE=<file> set, fantasy_adventure_web
+wraps its WSGI app in TraceMiddleware, which appends one record per
+request to the file. Every process opens it for appending and writes each
+record with a single write(), so the workers of fantasy_serve.py can share
+one trace.
+
+Each record holds:
+    start       wall-clock time the request arrived (float64 seconds)
+    duration    time the app took to answer (uint32 microseconds)
+    session     8-byte keyed BLAKE2 hash of the browser's action log ID
+                (see fantasy_adventure_web.log_key), zero for requests
+                outside any game. The key is derived from the app's secret
+                key, so every worker hashes a browser the same way and the
+                trace cannot be matched back to a cookie.
+    status      HTTP status
+    method, path with query, and the form or JSON body of a POST, with
+                the player's name replaced by as many x's and the state
+                versions (?v= of action links, ?since= of the API) left out
+The file starts with b'SMTRACE' and a format byte; each record is
+_RECORD followed by the path and the body, about 45 bytes per page view.
+
+Replay groups the records by session and re-issues them against the app
+in process (Flask's test client, on a virtual clock with --workers
+servers, as in fantasy_loadgen) or against a live server URL, --speed
+times faster than they were recorded. A session's requests keep their
+order and their spacing, scaled, and none is sent before the previous
+answer arrives. A replayed game draws other rolls than the recorded one,
+and has other state versions, so it is the same traffic but not the same
+games.
+
+The report compares the latency of every route with the recorded
+durations and flags the routes whose p95 got more than --threshold
+slower (exit status 1). A p95 from a few dozen requests rests on its top
+two or three, so one slow request can move it by half; a route is only
+flagged when the regression holds for the whole confidence interval.
+The interval comes from the ranks that bracket the 95th percentile in a
+sample of that size, which needs no assumption about the latency
+distribution: the route must have at least --min-requests requests, and
+the lower --confidence bound of its replayed p95 must exceed the upper
+bound of its recorded p95 by --threshold. The recorded durations are
+the app's own time; replay latency also counts any queueing at --speed,
+plus the network for a live server.
+
+Usage:
+    SHADOWMERE_TRACE=traffic.trace python fantasy_serve.py --workers 4
+    python fantasy_trace.py traffic.trace --show
+    python fantasy_trace.py traffic.trace --speed 10
+    python fantasy_trace.py traffic.trace --target http://127.0.0.1:8000 --speed 50
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import statistics
+import struct
+import sys
+import time
+from collections import defaultdict, namedtuple
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+log = logging.getLogger('shadowmere.trace')
+
+TRACE_MAGIC = b'SMTRACE'
+TRACE_VERSION = 1
+_HEADER = TRACE_MAGIC + bytes([TRACE_VERSION])
+# start, duration (us), session, status, method, body kind, path length, body length
+_RECORD = struct.Struct('<dI8sHBBHH')
+
+METHODS = ('GET', 'POST', 'HEAD', 'PUT', 'DELETE', 'PATCH', 'OPTIONS')
+BODY_NONE, BODY_FORM, BODY_JSON = 0, 1, 2
+BODY_TYPES = {BODY_FORM: 'application/x-www-form-urlencoded', BODY_JSON: 'application/json'}
+NO_SESSION = bytes(8)
+MAX_PATH = 2048
+MAX_BODY = 4096  # larger bodies are not recorded
+
+# Set this key in a request's WSGI environ to leave the request out of the
+# trace (fantasy_serve.py does, for its warm-up)
+UNTRACED = 'shadowmere.untraced'
+
+# Query and form fields that carry a state version; they are only good for
+# the recorded session, so they are not recorded
+VERSION_FIELDS = ('v', 'since')
+
+TraceRecord = namedtuple('TraceRecord', 'start duration session status method path body_kind body')
+
+
+def body_kind(content_type):
+    content_type = content_type.split(';', 1)[0].strip()
+    for kind, name in BODY_TYPES.items():
+        if content_type == name:
+            return kind
+    return BODY_NONE
+
+
+def without_versions(query):
+    """Return a query string or form body without its VERSION_FIELDS."""
+    fields = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(name, value) for name, value in fields if name not in VERSION_FIELDS])
+
+
+def anonymize_body(body, kind):
+    """Replace the player's name in a request body with as many x's, and leave out its state version."""
+    if kind == BODY_FORM:
+        fields = parse_qsl(body.decode('latin-1'), keep_blank_values=True)
+        fields = [(name, 'x' * len(value) if name == 'player_name' else value)
+                  for name, value in fields if name not in VERSION_FIELDS]
+        return urlencode(fields).encode('latin-1')
+    if kind == BODY_JSON:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return b''
+        if isinstance(data, dict) and isinstance(data.get('name'), str):
+            data['name'] = 'x' * len(data['name'])
+        return json.dumps(data, separators=(',', ':')).encode()
+    return b''
+
+
+# ============================================================================
+# CAPTURE
+# ============================================================================
+
+class TraceMiddleware:
+    """WSGI middleware that appends a record of every request to a trace file."""
+
+    def __init__(self, app, wsgi_app, path):
+        """
+        Args:
+            app: The Flask app, whose secret key signs the session cookies
+            wsgi_app: The WSGI app to trace (usually app.wsgi_app)
+            path: Trace file; created if missing, appended to if not
+
+        Raises:
+            ValueError: If `path` exists but is not a trace
+        """
+        self.wsgi_app = wsgi_app
+        self.path = path
+        self.serializer = app.session_interface.get_signing_serializer(app)
+        self.cookie_name = app.config['SESSION_COOKIE_NAME']
+        secret = app.secret_key if isinstance(app.secret_key, bytes) else app.secret_key.encode()
+        self.key = hashlib.blake2b(secret, digest_size=32, person=b'smtrace').digest()
+        self.fd = None
+        self.pid = None
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, 'rb') as f:
+                if f.read(len(_HEADER)) != _HEADER:
+                    raise ValueError(f'{path} is not a version {TRACE_VERSION} request trace') from None
+        else:
+            os.write(fd, _HEADER)
+            os.close(fd)
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if environ.get(UNTRACED) or method not in METHODS:
+            return self.wsgi_app(environ, start_response)
+
+        kind = body_kind(environ.get('CONTENT_TYPE', ''))
+        body = b''
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if kind and 0 < length <= MAX_BODY:
+            body = environ['wsgi.input'].read(length)
+            environ['wsgi.input'] = io.BytesIO(body)
+        response = []
+
+        def traced_start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+            return start_response(status, headers, exc_info)
+
+        started = time.time()
+        begin = time.perf_counter()
+        result = self.wsgi_app(environ, traced_start_response)
+        duration = time.perf_counter() - begin
+        if response:
+            try:
+                self.write(started, duration, environ, response, method, kind, body)
+            except OSError as e:
+                log.warning('cannot write to trace %s: %s', self.path, e)
+        return result
+
+    def write(self, started, duration, environ, response, method, kind, body):
+        if self.pid != os.getpid():  # first request in this process
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self.pid = os.getpid()
+        status, headers = response
+        path = quote(environ.get('PATH_INFO', '').encode('latin-1'))
+        query = without_versions(environ.get('QUERY_STRING', ''))
+        if query:
+            path += '?' + query
+        path = path.encode('latin-1')[:MAX_PATH]
+        body = anonymize_body(body, kind) if body else b''
+        record = _RECORD.pack(started, min(int(duration * 1e6), 0xFFFFFFFF), self.session(environ, headers),
+                              int(status[:3]), METHODS.index(method), kind if body else BODY_NONE,
+                              len(path), len(body))
+        os.write(self.fd, record + path + body)
+
+    def session(self, environ, headers):
+        """Return the anonymized ID of the request's browser: from its cookie, else from the one it was given."""
+        ident = self.identity(parse_cookie(environ).get(self.cookie_name))
+        if ident is None:
+            prefix = self.cookie_name + '='
+            for name, value in headers:
+                if name.lower() == 'set-cookie' and value.startswith(prefix):
+                    ident = self.identity(value.split(';', 1)[0][len(prefix):])
+        if ident is None:
+            return NO_SESSION
+        return hashlib.blake2b(ident.encode(), key=self.key, digest_size=8).digest()
+
+    def identity(self, cookie):
+        if not cookie:
+            return None
+        try:
+            data = self.serializer.loads(cookie)
+        except BadSignature:
+            return None
+        return data.get('log') or data.get('sid')
+
+
+def install(app, path):
+    """Trace every request to `app` into the file at `path`."""
+    app.wsgi_app = TraceMiddleware(app, app.wsgi_app, path)
+    log.info('tracing requests to %s', path)
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def read_trace(data):
+    """
+    Parse a trace file's contents.
+
+    Returns:
+        List of TraceRecord, sorted by start time. A record cut short at
+        the end (a process killed mid-write) is left out.
+
+    Raises:
+        ValueError: If `data` is not a trace
+    """
+    if data[:len(_HEADER)] != _HEADER:
+        raise ValueError(f'not a version {TRACE_VERSION} request trace')
+    records = []
+    pos = len(_HEADER)
+    while pos + _RECORD.size <= len(data):
+        start, duration, session, status, method, kind, path_len, body_len = _RECORD.unpack_from(data, pos)
+        pos += _RECORD.size
+        if pos + path_len + body_len > len(data):
+            break
+        path = data[pos:pos + path_len].decode('latin-1')
+        body = data[pos + path_len:pos + path_len + body_len]
+        pos += path_len + body_len
+        records.append(TraceRecord(start, duration / 1e6, session, status, METHODS[method], path, kind, body))
+    records.sort(key=lambda r: r.start)
+    return records
+
+
+def route_of(path):
+    """Return the route a request path belongs to, as named in the report."""
+    from fantasy_loadgen import ROUTES
+
+    parts = path.split('?', 1)[0].split('/')
+    if parts[1] == 'api' and len(parts) > 3:
+        return '/'.join(parts[:4]) + ('/<x>' if len(parts) > 4 else '')
+    if len(parts) == 2:
+        return '/' + parts[1]
+    return ROUTES.get(parts[1]) or f'/{parts[1]}/<x>'
+
+
+def replay_times(records, speed, max_gap):
+    """
+    Return when to send each record, in seconds from the start of the replay.
+
+    Gaps of more than `max_gap` seconds between consecutive requests,
+    such as between two runs traced into one file, are shortened to
+    `max_gap`; the rest of the timeline is kept and divided by `speed`.
+    """
+    times = []
+    t = 0.0
+    for i, record in enumerate(records):
+        if i:
+            t += min(record.start - records[i - 1].start, max_gap)
+        times.append(t / speed)
+    return times
+
+
+def sessions_of(records, times):
+    """Group (time, record) pairs by session; requests outside any game are each their own."""
+    groups = defaultdict(list)
+    alone = []
+    for when, record in zip(times, records):
+        if record.session == NO_SESSION:
+            alone.append([(when, record)])
+        else:
+            groups[record.session].append((when, record))
+    return list(groups.values()) + alone
+
+
+def replay_request(record):
+    """
+    Return (path, body, content type) to send for a record.
+
+    State versions are dropped, from the query and from a form, since
+    the replayed game's versions differ from the recorded ones; traces
+    written before they were left out at capture still hold them.
+    """
+    path, _, query = record.path.partition('?')
+    query = without_versions(query)
+    if query:
+        path += '?' + query
+    body = record.body
+    if record.body_kind == BODY_FORM:
+        body = without_versions(body.decode('latin-1')).encode('latin-1')
+    return path, body, BODY_TYPES.get(record.body_kind)
+
+
+# ============================================================================
+# REPLAY
+# ============================================================================
+
+class Comparison:
+    """Recorded durations and replayed latencies, per route."""
+
+    def __init__(self):
+        self.recorded = defaultdict(list)
+        self.replayed = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, record, latency, status):
+        route = route_of(record.path)
+        self.recorded[route].append(record.duration)
+        self.replayed[route].append(latency)
+        if status is None or status >= 500:
+            self.errors[route] += 1
+
+
+def replay_inprocess(groups, workers, results):
+    """
+    Replay sessions through the test client, on a virtual clock.
+
+    As fantasy_loadgen.run_inprocess: each request starts on the first of
+    `workers` virtual servers to come free, and takes the service time
+    measured for it.
+    """
+    import heapq
+
+    os.environ.pop('SHADOWMERE_TRACE', None)  # do not trace the replay into the trace
+    import fantasy_adventure_web as web
+
+    due = [(group[0][0], number, 0, None) for number, group in enumerate(groups)]
+    heapq.heapify(due)
+    free = [0.0] * workers
+    while due:
+        when, number, index, client = heapq.heappop(due)
+        if client is None:
+            client = web.app.test_client()
+        record = groups[number][index][1]
+        path, body, content_type = replay_request(record)
+        start = max(when, free[0])
+        began = time.perf_counter()
+        response = client.open(path, method=record.method, data=body or None, content_type=content_type)
+        response.get_data()
+        done = start + time.perf_counter() - began
+        heapq.heapreplace(free, done)
+        results.record(record, done - when, response.status_code)
+        if index + 1 < len(groups[number]):
+            heapq.heappush(due, (max(groups[number][index + 1][0], done), number, index + 1, client))
+
+
+async def replay_live(groups, url, timeout, results):
+    """Replay sessions against a live server, each session in its own task."""
+    from fantasy_loadgen import FETCH_ERRORS, fetch, update_jar
+    from fantasy_server import raise_file_limit
+
+    raise_file_limit()
+    url = urlsplit(url)
+    host, port = url.hostname or '127.0.0.1', url.port or 80
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def play(group):
+        jar = {}
+        done = start
+        for when, record in group:
+            due = max(start + when, done)
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            path, body, content_type = replay_request(record)
+            cookie = '; '.join(f'{name}={value}' for name, value in jar.items())
+            try:
+                status, set_cookies, _ = await asyncio.wait_for(
+                    fetch(host, port, record.method, path, cookie, body, content_type), timeout)
+            except FETCH_ERRORS:
+                status, set_cookies = None, []
+            done = loop.time()
+            update_jar(jar, set_cookies)
+            results.record(record, done - due, status)
+
+    await asyncio.gather(*(play(group) for group in groups))
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def print_summary(records, groups):
+    span = records[-1].start - records[0].start if records else 0.0
+    routes = defaultdict(int)
+    for record in records:
+        routes[route_of(record.path)] += 1
+    print(f'{len(records):,} requests in {len(groups):,} sessions over {span:,.1f}s')
+    for route, count in sorted(routes.items(), key=lambda item: -item[1]):
+        print(f'  {route:<24}{count:>9,}')
+
+
+def percentile_bounds(values, fraction, confidence):
+    """
+    Return one-sided confidence bounds for a percentile of sorted `values`.
+
+    The number of samples below the true percentile is binomial, so the
+    values at ranks a few standard deviations either side of
+    len(values) * fraction bracket it, whatever the distribution.
+
+    Args:
+        values: Sorted samples
+        fraction: The percentile, e.g. 0.95
+        confidence: Probability that each bound holds on its own side
+
+    Returns:
+        (lower, upper); the extreme samples when there are too few to do better
+    """
+    n = len(values)
+    spread = statistics.NormalDist().inv_cdf(confidence) * (n * fraction * (1 - fraction)) ** 0.5
+    lower = max(0, int(n * fraction - spread))
+    upper = min(n - 1, int(n * fraction + spread) + 1)
+    return values[lower], values[upper]
+
+
+def print_comparison(results, threshold, min_requests, confidence):
+    """Print recorded vs. replayed latency per route; return the routes that regressed."""
+    from fantasy_loadgen import percentile
+
+    regressions = []
+    print(f"{'route':<24}{'requests':>9}{'errors':>7}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}  p95 change")
+    print(f"{'':<40}{'recorded replay':>16}{'recorded replay':>16}{'recorded replay':>16}")
+    for route in sorted(results.replayed, key=lambda r: -len(results.replayed[r])):
+        recorded = sorted(results.recorded[route])
+        replayed = sorted(results.replayed[route])
+        columns = ''.join(f'{percentile(recorded, q) * 1e3:>8.2f}{percentile(replayed, q) * 1e3:>8.2f}'
+                          for q in (0.50, 0.95, 0.99))
+        before, after = percentile(recorded, 0.95), percentile(replayed, 0.95)
+        change = after / before - 1 if before else 0.0
+        flag = ''
+        if change > threshold and len(replayed) >= min_requests:
+            _, highest_before = percentile_bounds(recorded, 0.95, confidence)
+            lowest_after, _ = percentile_bounds(replayed, 0.95, confidence)
+            if highest_before and lowest_after / highest_before - 1 > threshold:
+                flag = f'  REGRESSION (at least {lowest_after / highest_before - 1:+.0%})'
+                regressions.append(route)
+        print(f'{route:<24}{len(replayed):>9,}{results.errors[route]:>7,}{columns}  {change:>+9.0%}{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a request trace of the web version and compare latencies.')
+    parser.add_argument('trace', help='trace file written with SHADOWMERE_TRACE')
+    parser.add_argument('--target', default='inprocess',
+                        help="'inprocess' for Flask's test client (default), or the URL of a live server")
+    parser.add_argument('--speed', type=float, default=1.0, help='replay this many times faster (default: 1)')
+    parser.add_argument('--max-gap', type=float, default=60.0,
+                        help='shorten pauses in the traffic to this many seconds (default: 60)')
+    parser.add_argument('--workers', type=int, default=1, help='virtual servers, in process (default: 1)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds before a live request fails')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='flag routes whose p95 latency grew by more than this fraction (default: 0.2)')
+    parser.add_argument('--min-requests', type=int, default=100,
+                        help='only flag routes with at least this many requests (default: 100)')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help='confidence of the p95 bounds a regression must clear (default: 0.95)')
+    parser.add_argument('--show', action='store_true', help='only summarize the trace')
+    args = parser.parse_args(argv)
+    if args.speed <= 0 or args.workers < 1:
+        parser.error('--speed and --workers must be positive')
+    if not 0.5 <= args.confidence < 1:
+        parser.error('--confidence must be in [0.5, 1)')
+
+    try:
+        with open(args.trace, 'rb') as f:
+            records = read_trace(f.read())
+    except (OSError, ValueError) as e:
+        print(f'{args.trace}: {e}', file=sys.stderr)
+        return 2
+    times = replay_times(records, args.speed, args.max_gap)
+    groups = sessions_of(records, times)
+    print_summary(records, groups)
+    if args.show or not records:
+        return 0
+
+    results = Comparison()
+    began = time.perf_counter()
+    if args.target == 'inprocess':
+        replay_inprocess(groups, args.workers, results)
+        where = f'in process, {args.workers} virtual server(s)'
+    else:
+        if not args.target.startswith('http://'):
+            parser.error("--target must be 'inprocess' or an http:// URL")
+        asyncio.run(replay_live(groups, args.target, args.timeout, results))
+        where = args.target
+    print(f'replayed at {args.speed:g}x against {where} in {time.perf_counter() - began:,.1f}s')
+    regressions = print_comparison(results, args.threshold, args.min_requests, args.confidence)
+    if regressions:
+        print(f"p95 regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
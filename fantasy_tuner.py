@@ -0,0 +1,300 @@
+"""
+Difficulty auto-tuner: search enemy stats for target win rates.
+
+For each enemy with a target win rate, the tuner searches its health and
+attack so that the build expected to meet it (see MATCHUPS) wins that
+often, preferring the candidate closest to the current stats. The gold
+reward is then scaled so gold per round of combat stays what it is now
+(or --gold-per-turn), since a longer fight should pay more.
+
+The search has two phases, each evaluating candidates for every enemy at
+once with fantasy_sim in a process pool:
+    scale   health and attack are scaled together; a row of scales is
+            simulated and the range narrowed to the pair that brackets
+            the target (win rates fall as enemies get stronger)
+    grid    a 5x5 grid around each enemy's best candidate; the grid
+            shrinks when the best stays put, until the steps are 1
+A candidate's random stream is derived from --seed and the candidate
+itself (enemy, health, attack), never from the worker that runs it, so
+the results are the same with any number of processes.
+
+Usage:
+    python fantasy_tuner.py --target goblin=0.95 --target dragon=0.6
+    python fantasy_tuner.py --workers 8 --fights 50000 --write-pack packs/tuned.toml
+
+Requires NumPy (pip install -r requirements-tools.txt), like fantasy_sim.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+import fantasy_combat as rules
+import fantasy_content as content
+import fantasy_sim as sim
+import fantasy_solver as solver
+from fantasy_combat import Policy
+
+# Default target win rates
+TARGETS = {'goblin': 0.95, 'wolf': 0.95, 'bat': 0.85, 'dragon': 0.70}
+
+# Items the player is expected to have when meeting each enemy
+MATCHUPS = {
+    'goblin': (),
+    'wolf': (),
+    'bat': ('sword',),
+    'dragon': ('crystal_sword',),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Candidate:
+    enemy: str
+    health: int
+    attack: int
+
+
+@dataclass(frozen=True, slots=True)
+class Evaluation:
+    candidate: Candidate
+    win_rate: float
+    turns: float
+    loss: float
+
+
+def evaluate(task):
+    """
+    Simulate one candidate; run in a worker process.
+
+    Args:
+        task: (candidate, build, policy, ruleset, fights, seed)
+
+    Returns:
+        (candidate, win rate, mean turns)
+    """
+    candidate, build, policy, ruleset, fights, seed = task
+    enemy = replace(content.ENEMIES[candidate.enemy], health=candidate.health, attack=candidate.attack)
+    # The stream depends only on the seed and the candidate, not on the worker
+    stream = np.random.SeedSequence(seed, spawn_key=(content.ENEMIES[candidate.enemy].id,
+                                                     candidate.health, candidate.attack))
+    result = sim.simulate(build, enemy, fights, policy, ruleset, rng=np.random.default_rng(stream))
+    return candidate, float(np.mean(result.outcome == rules.WIN)), float(result.turns.mean())
+
+
+def loss(win_rate, target, tolerance, candidate, original):
+    """Squared miss in units of the tolerance, plus the relative change in stats."""
+    return (((win_rate - target) / tolerance) ** 2
+            + ((candidate.health - original.health) / original.health) ** 2
+            + ((candidate.attack - original.attack) / max(original.attack, 1)) ** 2)
+
+
+def grid(center, health_step, attack_step, radius=2):
+    """Return the candidates around `center`, keeping stats positive."""
+    candidates = []
+    for dh in range(-radius, radius + 1):
+        for da in range(-radius, radius + 1):
+            health = center.health + dh * health_step
+            attack = center.attack + da * attack_step
+            if health >= 1 and attack >= 1:
+                candidates.append(Candidate(center.enemy, health, attack))
+    return candidates
+
+
+def scaled(key, scale):
+    enemy = content.ENEMIES[key]
+    return Candidate(key, max(1, round(enemy.health * scale)), max(1, round(enemy.attack * scale)))
+
+
+def tune(targets, builds, policy, ruleset, fights, seed, workers, tolerance=0.01,
+         scale_rounds=3, scales_per_round=12, max_iterations=30):
+    """
+    Search stats for every enemy in `targets`.
+
+    Args:
+        targets: Target win rate by enemy key
+        builds: fantasy_combat.Build by enemy key
+        policy, ruleset: How the simulated player fights
+        fights: Simulated fights per candidate
+        seed: Root seed of every candidate's random stream
+        workers: Processes in the pool
+        tolerance: Win-rate miss that costs as much as doubling a stat
+        scale_rounds: Rounds of the scale phase
+        scales_per_round: Scales simulated per enemy and round
+        max_iterations: Give up refining the grid after this many rounds
+
+    Returns:
+        (best Evaluation by enemy key, convergence history) where the
+        history holds (phase, round, enemy, Evaluation, step) rows
+    """
+    originals = {key: content.ENEMIES[key] for key in targets}
+    results = {}  # every candidate evaluated so far, so none is simulated twice
+    history = []
+
+    def run(pool, candidates):
+        tasks = [(c, builds[c.enemy], policy, ruleset, fights, seed)
+                 for c in dict.fromkeys(candidates) if c not in results]
+        chunksize = max(1, len(tasks) // (workers * 4))
+        for candidate, win_rate, turns in pool.map(evaluate, tasks, chunksize=chunksize):
+            key = candidate.enemy
+            results[candidate] = Evaluation(candidate, win_rate, turns,
+                                            loss(win_rate, targets[key], tolerance, candidate, originals[key]))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Scale phase: bracket the target along health and attack scaled together
+        ranges = {key: (0.25, 8.0) for key in targets}
+        best = {}
+        for round_ in range(1, scale_rounds + 1):
+            rows = {}
+            for key, (low, high) in ranges.items():
+                factors = np.geomspace(low, high, scales_per_round)
+                rows[key] = [(factor, scaled(key, factor)) for factor in factors]
+            run(pool, [c for row in rows.values() for _, c in row])
+            for key, row in rows.items():
+                low, high = ranges[key]
+                for (f1, c1), (f2, c2) in zip(row, row[1:]):
+                    if results[c1].win_rate >= targets[key] >= results[c2].win_rate:
+                        low, high = f1, f2
+                        break
+                else:  # target outside the range: stay at the nearer end
+                    low = high = row[0][0] if results[row[0][1]].win_rate < targets[key] else row[-1][0]
+                ranges[key] = (low, high)
+                closest = min((results[c] for _, c in row), key=lambda e: abs(e.win_rate - targets[key]))
+                best[key] = closest.candidate
+                history.append(('scale', round_, key, closest, f'x{low:.3g}-{high:.3g}'))
+
+        # Grid phase: refine health and attack separately
+        steps = {key: (max(1, c.health // 10), max(1, c.attack // 10)) for key, c in best.items()}
+        done = set()
+        for iteration in range(1, max_iterations + 1):
+            pending = [key for key in targets if key not in done]
+            if not pending:
+                break
+            run(pool, [c for key in pending for c in grid(best[key], *steps[key])])
+            for key in pending:
+                health_step, attack_step = steps[key]
+                choice = min((results[c] for c in grid(best[key], health_step, attack_step)),
+                             key=lambda e: (e.loss, e.candidate.health, e.candidate.attack))
+                history.append(('grid', iteration, key, choice, f'{health_step}/{attack_step}'))
+                if choice.candidate == best[key]:
+                    if health_step == attack_step == 1:
+                        done.add(key)
+                    steps[key] = (max(1, health_step // 2), max(1, attack_step // 2))
+                best[key] = choice.candidate
+
+    return {key: results[candidate] for key, candidate in best.items()}, history
+
+
+def propose_gold(key, evaluation, build, policy, ruleset, gold_per_turn=None):
+    """Return the gold reward that keeps gold per round of combat constant."""
+    enemy = content.ENEMIES[key]
+    if gold_per_turn is None:
+        current = solver.solve(build, enemy, policy, ruleset).expected_turns
+        gold_per_turn = enemy.gold / current
+    return max(1, round(gold_per_turn * evaluation.turns))
+
+
+# ============================================================================
+# REPORTS
+# ============================================================================
+
+def print_convergence(history):
+    print('Convergence')
+    print(f"{'phase':<6}{'round':>5}  {'enemy':<10}{'health':>7}{'attack':>7}{'win':>8}{'loss':>10}  step")
+    for phase, round_, key, e, step in history:
+        c = e.candidate
+        print(f'{phase:<6}{round_:>5}  {key:<10}{c.health:>7}{c.attack:>7}{e.win_rate:>8.4f}'
+              f'{e.loss:>10.4f}  {step}')
+
+
+def print_table(proposals, targets):
+    print('Proposed stats')
+    print(f"{'enemy':<10}{'health':>12}{'attack':>10}{'gold':>11}{'target':>8}{'sim win':>9}{'exact win':>11}")
+    for key, (e, gold, exact) in proposals.items():
+        enemy = content.ENEMIES[key]
+        c = e.candidate
+        print(f'{key:<10}{f"{enemy.health} -> {c.health}":>12}{f"{enemy.attack} -> {c.attack}":>10}'
+              f'{f"{enemy.gold} -> {gold}":>11}{targets[key]:>8.2f}{e.win_rate:>9.4f}{exact:>11.4f}')
+
+
+def write_pack(path, proposals):
+    """Write the proposed stats as a content pack overriding the enemies."""
+    lines = ['# Enemy stats proposed by fantasy_tuner.py', '']
+    for key, (e, gold, _) in proposals.items():
+        enemy = content.ENEMIES[key]
+        lines += [
+            '[[enemies]]',
+            f'key = "{enemy.key}"',
+            f'id = {enemy.id}',
+            f'name = "{enemy.name}"',
+            f'health = {e.candidate.health}',
+            f'attack = {e.candidate.attack}',
+            f'gold = {gold}',
+        ]
+        if enemy.reward_item:
+            lines.append(f'reward_item = "{enemy.reward_item}"')
+        lines += [f'icon = "{enemy.icon}"', f'appears = "{enemy.appears}"', '']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+
+
+def parse_targets(values):
+    targets = dict(TARGETS) if not values else {}
+    for value in values or ():
+        key, _, rate = value.partition('=')
+        if key not in content.ENEMIES or not rate:
+            raise SystemExit(f'--target expects ENEMY=RATE with a known enemy, got {value!r}')
+        targets[key] = float(rate)
+    return targets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search enemy stats for target win rates.')
+    parser.add_argument('--target', action='append', metavar='ENEMY=RATE',
+                        help='target win rate (repeatable; default: ' +
+                             ', '.join(f'{k}={v}' for k, v in TARGETS.items()) + ')')
+    parser.add_argument('--rules', choices=sorted(rules.RULES), default='cli')
+    parser.add_argument('--potions', type=int, default=1, help='potions the player carries')
+    parser.add_argument('--potion-at', type=int, default=30, help='drink a potion at or below this health')
+    parser.add_argument('--fights', type=int, default=20_000, help='simulated fights per candidate')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='acceptable win-rate miss')
+    parser.add_argument('--gold-per-turn', type=float, help='gold per combat round (default: keep current)')
+    parser.add_argument('--seed', type=int, default=0, help='root seed')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--write-pack', metavar='PATH', help='write the proposal as a content pack')
+    args = parser.parse_args(argv)
+
+    targets = parse_targets(args.target)
+    starter = replace(rules.STARTER, potions=args.potions)
+    builds = {key: starter.with_items(*MATCHUPS.get(key, ())) for key in targets}
+    policy = Policy(potion_at=args.potion_at)
+    ruleset = rules.RULES[args.rules]
+
+    start = time.perf_counter()
+    best, history = tune(targets, builds, policy, ruleset, args.fights, args.seed, args.workers,
+                         tolerance=args.tolerance)
+    elapsed = time.perf_counter() - start
+
+    proposals = {}
+    for key, evaluation in best.items():
+        gold = propose_gold(key, evaluation, builds[key], policy, ruleset, args.gold_per_turn)
+        tuned = replace(content.ENEMIES[key], health=evaluation.candidate.health,
+                        attack=evaluation.candidate.attack)
+        proposals[key] = (evaluation, gold, solver.solve(builds[key], tuned, policy, ruleset).win)
+
+    print_convergence(history)
+    print()
+    print_table(proposals, targets)
+    print(f'\n{len(history)} enemy-rounds, {args.workers} workers, {elapsed:.2f}s')
+    if args.write_pack:
+        write_pack(args.write_pack, proposals)
+        print(f'Wrote {args.write_pack}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""
+View layer for the web version of Realm of Shadowmere.
+
+Every page and HTML fragment is a Jinja template that is compiled once,
+when this module is imported, and then rendered with plain data.
+Routes never build markup themselves; they call render() with the
+template name and the values the template needs.
+"""
+
+import hashlib
+
+from jinja2 import DictLoader, Environment
+from markupsafe import Markup
+
+import fantasy_assets as assets
+import fantasy_content as content
+
+# ============================================================================
+# TEMPLATES
+# ============================================================================
+
+LAYOUT_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Realm of Shadowmere - Fantasy Adventure</title>
+    <link rel="stylesheet" href="{{ stylesheet_url }}">
+</head>
+<body>
+    <div class="container">
+        {% block content %}{% endblock %}
+    </div>
+    <footer>Fantasy Adventure Game - Created with Python & Flask</footer>
+</body>
+</html>
+"""
+
+STATS_BAR_TEMPLATE = """
+    <div class="stats-bar">
+        <div class="stat">
+            <div class="stat-label">Adventurer</div>
+            <div class="stat-value">{{ player.name }}</div>
+        </div>
+        <div class="stat">
+            <div class="stat-label">Health</div>
+            <div class="health-bar"><div class="health-fill" style="width: {{ health_percent }}%"></div></div>
+            <div class="stat-value">{{ player.health }}/{{ player.max_health }}</div>
+        </div>
+        <div class="stat">
+            <div class="stat-label">Attack</div>
+            <div class="stat-value">⚔️ {{ player.attack }}</div>
+        </div>
+        <div class="stat">
+            <div class="stat-label">Defense</div>
+            <div class="stat-value">🛡️ {{ player.defense }}</div>
+        </div>
+        <div class="stat">
+            <div class="stat-label">Gold</div>
+            <div class="stat-value">💰 {{ player.gold }}</div>
+        </div>
+    </div>
+"""
+
+MESSAGE_TEMPLATE = """<div class="message message-{{ msg_type }}">{{ msg }}</div>"""
+
+INVENTORY_TEMPLATE = """
+    <div class="inventory">
+        <h3>🎒 Inventory</h3>
+        <p>{{ items }}</p>
+    </div>
+"""
+
+TITLE_PAGE_TEMPLATE = """{% extends "layout.html" %}{% block content %}
+        <h1>⚔️ REALM OF SHADOWMERE ⚔️</h1>
+        <p class="subtitle">A Fantasy-Style Text Adventure</p>
+
+        <div class="game-text">
+            <p>In the land of Shadowmere, a fearsome dragon threatens the kingdom.</p>
+            <p>You are a brave adventurer chosen to defeat this ancient evil.</p>
+            <p>Explore the land, gather items, and prepare for the ultimate battle!</p>
+        </div>
+
+        <form action="/start" method="POST">
+            <input type="text" name="player_name" placeholder="Enter your adventurer's name..." maxlength="40" required>
+            {%- if version %}
+            <input type="hidden" name="v" value="{{ version }}">
+            {%- endif %}
+            <button type="submit" class="choice-btn">🗡️ Begin Your Quest</button>
+        </form>
+{% endblock %}"""
+
+HUB_PAGE_TEMPLATE = """{% extends "layout.html" %}{% block content %}
+        {{ stats_bar }}{{ message }}
+        <h2>📍 Village of Elderbrook</h2>
+        <div class="game-text">
+            <p>You stand in the heart of the village. The townsfolk go about their daily business.</p>
+            <p>Where would you like to go?</p>
+        </div>
+
+        <div class="choices">
+            {%- for location in locations %}
+            <a href="/location/{{ location.key }}" class="choice-btn">{{ location.action }}</a>
+            {%- endfor %}
+            <a href="/shop" class="choice-btn">🛒 Visit the Shop</a>
+            <a href="/status" class="choice-btn">📊 Check Status</a>
+            <a href="/reset" class="choice-btn">🔄 Restart Game</a>
+        </div>
+        {{ inventory }}
+{% endblock %}"""
+
+LOCATION_PAGE_TEMPLATE = """{% extends "layout.html" %}{% block content %}
+        {{ stats_bar }}{{ message }}{{ body }}{{ inventory }}
+        <div class="choices"><a href="/" class="choice-btn">⬅️ Return to Village</a></div>
+{% endblock %}"""
+
+VILLAGE_FIRST_VISIT_TEMPLATE = """
+        <h2>🏘️ Village of Elderbrook</h2>
+        <div class="game-text">
+            <p>The villagers greet you warmly as you walk through the cobblestone streets.</p>
+            <p>An old sage approaches you with wisdom in his eyes...</p>
+            <p><em>"Brave adventurer," he says, "to defeat the dragon, you must first
+            find the Crystal Sword hidden in the Crystal Cave. Without it,
+            the dragon's scales cannot be pierced!"</em></p>
+            <p>A grateful villager gives you <strong>{{ gold_bonus }} gold</strong> for your bravery!</p>
+        </div>
+"""
+
+VILLAGE_TEMPLATE = """
+        <h2>🏘️ Village of Elderbrook</h2>
+        <div class="game-text">
+            <p>The peaceful village continues its daily routines.</p>
+            <p>The old sage nods at you knowingly. "Remember - the Crystal Sword is your key to victory!"</p>
+        </div>
+"""
+
+ENCOUNTER_TEMPLATE = """<h2>{{ location.icon }} {{ location.name }}</h2>
+        <div class="game-text"><p>{{ location.intro or location.description }}</p>
+{%- if not encounter %}
+        </div>
+{%- elif encounter.kind == 'fight' %}
+            <p>{{ enemy.icon }} <strong>{{ enemy.appears or 'A ' ~ enemy.name ~ ' attacks!' }}</strong></p>
+        </div>
+        <div class="choices">
+            <a href="/combat/{{ enemy.key }}" class="choice-btn">⚔️ Fight the {{ enemy.name }}</a>
+            <a href="/flee" class="choice-btn">🏃 Attempt to Flee</a>
+        </div>
+{%- elif encounter.kind == 'heal' %}
+            <p>{{ encounter.icon }} <strong>{{ encounter.text or 'You find a moment of rest.' }}</strong></p>
+            <p>{{ encounter.detail or 'You recover' }} <strong>{{ heal }} health</strong>!</p>
+        </div>
+{%- else %}
+            <p>{{ encounter.icon }} <strong>{{ encounter.text or 'You stumble upon some treasure!' }}</strong></p>
+            <p>{{ encounter.detail or 'You find' }} <strong>{{ gold }} gold coins</strong>!</p>
+        </div>
+{%- endif %}
+"""
+
+CAVE_TEMPLATE = """<h2>💎 Crystal Cave</h2>
+        <div class="game-text"><p>The crystals illuminate your path as you explore the cave...</p>
+{%- if has_sword %}
+            <p>The cave feels peaceful now that you've claimed the Crystal Sword.</p>
+            <p>The crystals seem to hum with approval as you pass.</p>
+        </div>
+{%- else %}
+            <p>🦇 <strong>A Giant Bat swoops down from the darkness!</strong></p>
+            <p>You must defeat it to reach the legendary Crystal Sword!</p>
+        </div>
+        <div class="choices">
+            <a href="/combat/bat" class="choice-btn">⚔️ Fight the Giant Bat</a>
+            <a href="/flee" class="choice-btn">🏃 Attempt to Flee</a>
+        </div>
+{%- endif %}
+"""
+
+DRAGON_TEMPLATE = """<h2>🐉 Dragon's Lair</h2>
+{%- if outcome == 'defeated' %}
+        <div class="game-text">
+            <p>The dragon has been defeated. Peace has returned to the lair.</p>
+            <p>Your legend will be told for generations to come!</p>
+        </div>
+{%- elif outcome == 'no_sword' %}
+        <div class="game-text">
+            <p>🐉 <strong>THE DRAGON OF SHADOWMERE AWAKENS!</strong></p>
+            <p>Its massive form fills the cavern, scales glittering like obsidian.</p>
+            <p>⚠️ <strong>You don't have the Crystal Sword!</strong></p>
+            <p>Your attacks bounce harmlessly off the dragon's scales. You barely escape with your life!</p>
+            <p class="message message-danger">You took {{ damage }} damage fleeing!</p>
+        </div>
+{%- else %}
+        <div class="game-text">
+            <p>🐉 <strong>THE DRAGON OF SHADOWMERE AWAKENS!</strong></p>
+            <p>Its massive form fills the cavern, scales glittering like obsidian.</p>
+            <p>Your Crystal Sword glows with ancient power! The dragon recognizes the legendary blade!</p>
+        </div>
+        <div class="choices">
+            <a href="/combat/dragon" class="choice-btn">⚔️ FIGHT THE DRAGON!</a>
+            <a href="/flee" class="choice-btn">🏃 Flee (Coward!)</a>
+        </div>
+{%- endif %}
+"""
+
+COMBAT_PAGE_TEMPLATE = """{% extends "layout.html" %}{% block content %}
+    {{ stats_bar }}
+    <h2>⚔️ Battle: {{ combat.enemy_name }}</h2>
+    <div class="game-text">
+        <p><strong>{{ combat.enemy_name }} Health:</strong> {{ combat.enemy_health }}</p>
+    </div>
+    <div class="choices">
+        <a href="/attack/{{ enemy }}?v={{ version }}" class="choice-btn">⚔️ Attack!</a>
+        {%- if has_potion %}
+        <a href="/use_potion_combat?v={{ version }}" class="choice-btn">🧪 Use Health Potion</a>
+        {%- endif %}
+        <a href="/flee?v={{ version }}" class="choice-btn">🏃 Attempt to Flee</a>
+    </div>
+    <form action="/auto_battle" method="POST" class="auto-battle">
+        <input type="hidden" name="v" value="{{ version }}">
+        <label>Drink a potion at <input type="number" name="potion_at" value="30" min="0"> health or less</label>
+        <label>Flee at <input type="number" name="flee_at" value="0" min="0"> health or less</label>
+        <button type="submit" class="choice-btn">🤖 Auto-Battle to the End</button>
+    </form>
+{% endblock %}"""
+
+AUTO_BATTLE_PAGE_TEMPLATE = """{% extends "layout.html" %}{% block content %}
+    {{ stats_bar }}{{ message }}
+    <h2>🤖 Auto-Battle: {{ enemy_name }}</h2>
+    <div class="game-text">
+        <p>{{ summary }}</p>
+        <ol class="combat-log">
+            {%- for line, count in log %}
+            <li>{{ line }}{% if count > 1 %} (×{{ count }}){% endif %}</li>
+            {%- endfor %}
+        </ol>
+    </div>
+    <div class="choices">
+        {%- if fighting %}
+        <a href="/combat/{{ enemy }}" class="choice-btn">⚔️ Continue the Fight</a>
+        {%- endif %}
+        <a href="/" class="choice-btn">{{ "🗡️ Begin a New Quest" if defeated else "⬅️ Return to Village" }}</a>
+    </div>
+    {{ inventory }}
+{% endblock %}"""
+
+SHOP_PAGE_TEMPLATE = """{% extends "layout.html" %}{% block content %}
+    {{ stats_bar }}{{ message }}
+    <h2>🛒 Village Shop</h2>
+    <div class="game-text">
+        <p>"Welcome, adventurer! What would you like to purchase?"</p>
+    </div>
+    <div class="choices">
+        {%- for item in shop_items %}
+        <a href="/buy/{{ item.key }}?v={{ version }}" class="choice-btn">{{ item.icon }} {{ item.name }} - {{ item.price }} gold ({{ item.summary }})</a>
+        {%- endfor %}
+        <a href="/" class="choice-btn">⬅️ Leave Shop</a>
+    </div>
+    {{ inventory }}
+{% endblock %}"""
+
+STATUS_PAGE_TEMPLATE = """{% extends "layout.html" %}{% block content %}
+    {{ stats_bar }}
+    <h2>📊 Adventurer Status</h2>
+    <div class="game-text">
+        <p><strong>Name:</strong> {{ player.name }}</p>
+        <p><strong>Health:</strong> {{ player.health }}/{{ player.max_health }}</p>
+        <p><strong>Attack Power:</strong> {{ player.attack }}</p>
+        <p><strong>Defense:</strong> {{ player.defense }}</p>
+        <p><strong>Gold:</strong> {{ player.gold }}</p>
+        <p><strong>Quest Status:</strong> {{ quest_status }}</p>
+        <p><strong>Locations Visited:</strong> {{ locations_visited }}</p>
+    </div>
+    {{ inventory }}
+    <div class="choices">
+        <a href="/" class="choice-btn">⬅️ Return to Village</a>
+        {% if action_log %}<a href="/log" class="choice-btn">🧾 Download Action Log</a>{% endif %}
+    </div>
+{% endblock %}"""
+
+TEMPLATES = {
+    'layout.html': LAYOUT_TEMPLATE,
+    'stats_bar.html': STATS_BAR_TEMPLATE,
+    'message.html': MESSAGE_TEMPLATE,
+    'inventory.html': INVENTORY_TEMPLATE,
+    'title.html': TITLE_PAGE_TEMPLATE,
+    'hub.html': HUB_PAGE_TEMPLATE,
+    'location.html': LOCATION_PAGE_TEMPLATE,
+    'village_first_visit.html': VILLAGE_FIRST_VISIT_TEMPLATE,
+    'village.html': VILLAGE_TEMPLATE,
+    'encounter.html': ENCOUNTER_TEMPLATE,
+    'cave.html': CAVE_TEMPLATE,
+    'dragon.html': DRAGON_TEMPLATE,
+    'combat.html': COMBAT_PAGE_TEMPLATE,
+    'auto_battle.html': AUTO_BATTLE_PAGE_TEMPLATE,
+    'shop.html': SHOP_PAGE_TEMPLATE,
+    'status.html': STATUS_PAGE_TEMPLATE,
+}
+
+# ============================================================================
+# COMPILATION
+# ============================================================================
+
+env = Environment(loader=DictLoader(TEMPLATES), autoescape=True)
+env.globals['stylesheet_url'] = assets.STYLESHEET.url
+env.globals['locations'] = tuple(content.LOCATIONS.values())
+env.globals['shop_items'] = content.SHOP_ITEMS
+
+# Compile everything up front so no request ever pays for parsing.
+compiled = {name: env.get_template(name) for name in TEMPLATES}
+
+
+def render(name, **context):
+    """
+    Render a precompiled template.
+
+    Args:
+        name: Template name, e.g. 'status.html'
+        **context: Values the template refers to
+
+    Returns:
+        The rendered HTML as Markup, so it can be embedded in another
+        template without being escaped again
+    """
+    return Markup(compiled[name].render(**context))
+
+
+# Changes whenever any template or the stylesheet does, so ETags derived
+# from it never outlive a deploy.
+VERSION = hashlib.blake2b(
+    ''.join(TEMPLATES[name] for name in sorted(TEMPLATES)).encode() + assets.STYLESHEET.digest.encode(),
+    digest_size=8,
+).hexdigest()
+
+
+def page_etag(page, state):
+    """
+    Compute an ETag for a page that is a pure function of some state.
+
+    Args:
+        page: Template name of the page
+        state: Tuple of every value the page displays
+
+    Returns:
+        A short hex digest, suitable for a weak ETag
+    """
+    return hashlib.blake2b(repr((VERSION, page, state)).encode(), digest_size=8).hexdigest()
+
+
+# ============================================================================
+# STATIC FRAGMENTS
+# ============================================================================
+
+# These never change, so they are rendered once per process. The web
+# version serves the title page with the player's state version instead.
+TITLE_PAGE = render('title.html')
+VILLAGE_REVISITED = render('village.html')
+CAVE_PEACEFUL = render('cave.html', has_sword=True)
+CAVE_BAT = render('cave.html', has_sword=False)
+DRAGON_DEFEATED = render('dragon.html', outcome='defeated', damage=0)
+DRAGON_READY = render('dragon.html', outcome='fight', damage=0)